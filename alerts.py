@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram.error import Forbidden, RetryAfter
+
+from formazione.rosters import Roster
+from metrics import registry
+from quote.cache import Snapshot
+from quote.resilience import TokenBucket
+from workers import process_pool
+
+ALERTS_PATH = os.getenv("ALERTS_PATH", "avvisi.json")
+ALERT_THRESHOLD = float(os.getenv("ALERT_THRESHOLD", "5"))  # variazione minima di probabilità, in punti percentuali
+# Limiti di invio di Telegram: ~30 messaggi al secondo in totale e circa uno al secondo per chat
+ALERT_RATE_LIMIT = 25
+ALERT_CHAT_INTERVAL = 1.0  # secondi minimi tra due avvisi alla stessa chat
+ALERT_MAX_LINES = 15  # variazioni mostrate al massimo in un messaggio
+
+ALERTS = registry.counter("fanta_alerts_total", "Avvisi sulle quote inviati alle chat, per esito (sent, failed, retry).")
+ALERT_PENDING = registry.gauge("fanta_alerts_pending", "Chat con avvisi in attesa di invio.")
+ALERT_RATE_LIMIT_WAIT = registry.histogram("fanta_alert_rate_limit_wait_seconds", "Attesa imposta dal rate limiter prima dell'invio di un avviso su Telegram.")
+
+# (ruolo, nome, squadra, mercato)
+ChangeKey = Tuple[str, str, str, str]
+AlertSender = Callable[[int, str], Awaitable[Any]]
+RosterQuotes = Dict[str, List[Dict[str, Any]]]
+
+# Mercati confrontati per ruolo: (campo di get_roster_quotes, etichetta)
+_MARKETS = {
+    "Por": [("prob_concedes", "subire gol")],
+    "Dif": [("prob_goal_fair", "gol"), ("prob_assist_fair", "assist")],
+    "Cen": [("prob_goal_fair", "gol"), ("prob_assist_fair", "assist")],
+    "Att": [("prob_goal_fair", "gol"), ("prob_assist_fair", "assist")],
+}
+
+
+@dataclass
+class OddsChange:
+    """Variazione della probabilità (in %) di un giocatore su un mercato."""
+    role: str
+    name: str
+    team: str
+    market: str
+    before: float
+    after: float
+
+    @property
+    def key(self) -> ChangeKey:
+        return self.role, self.name, self.team, self.market
+
+    @property
+    def delta(self) -> float:
+        return self.after - self.before
+
+
+def diff_roster_quotes(before: Dict[str, List[Dict[str, Any]]], after: Dict[str, List[Dict[str, Any]]], threshold: float) -> List[OddsChange]:
+    """Variazioni di almeno `threshold` punti percentuali tra due abbinamenti della stessa rosa."""
+    changes = []
+    for role, markets in _MARKETS.items():
+        for old, new in zip(before.get(role, []), after.get(role, [])):
+            for field, label in markets:
+                if old[field] is None or new[field] is None:
+                    continue
+                if abs(new[field] - old[field]) >= threshold:
+                    changes.append(OddsChange(role, new["name"], new["team"], label, old[field], new[field]))
+    return changes
+
+
+def format_alert(changes: List[OddsChange]) -> str:
+    """Messaggio Telegram con le variazioni, dalla più ampia."""
+    changes = sorted(changes, key=lambda c: abs(c.delta), reverse=True)
+    lines = [
+        f"{'📈' if c.delta > 0 else '📉'} {c.name} ({c.team}) {c.market}: {c.before:.1f}% → {c.after:.1f}% ({c.delta:+.1f})"
+        for c in changes[:ALERT_MAX_LINES]
+    ]
+    if len(changes) > ALERT_MAX_LINES:
+        lines.append(f"… e altre {len(changes) - ALERT_MAX_LINES} variazioni.")
+    return "🔔 *Quote cambiate per la tua rosa*\n\n" + "\n".join(lines)
+
+
+class SubscriptionStore:
+    """Chat iscritte agli avvisi, con la soglia di ciascuna, salvate su un file JSON."""
+
+    def __init__(self, path: str = ALERTS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._thresholds: Dict[int, float] = self._load()
+
+    def _load(self) -> Dict[int, float]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Impossibile leggere le iscrizioni agli avvisi da '{self.path}': {e}")
+            return {}
+        return {int(chat_id): float(threshold) for chat_id, threshold in raw.items()}
+
+    def _save(self) -> None:
+        # Scrittura atomica: un crash a metà non lascia il file corrotto
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({str(chat_id): threshold for chat_id, threshold in self._thresholds.items()}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, chat_id: int) -> Optional[float]:
+        return self._thresholds.get(chat_id)
+
+    def set(self, chat_id: int, threshold: float) -> None:
+        with self._lock:
+            self._thresholds[chat_id] = threshold
+            self._save()
+
+    def remove(self, chat_id: int) -> None:
+        with self._lock:
+            if self._thresholds.pop(chat_id, None) is not None:
+                self._save()
+
+    def all(self) -> Dict[int, float]:
+        return dict(self._thresholds)
+
+
+class AlertManager:
+    """
+    Avvisi push sulle variazioni delle quote.
+
+    - A ogni nuova istantanea le rose delle chat iscritte vengono abbinate alla precedente e
+      alla nuova (nel gruppo di processi, con i giocatori comuni abbinati una volta sola).
+    - Ogni chat riceve un solo messaggio con tutte le variazioni oltre la sua soglia; se un
+      messaggio non è ancora partito, le nuove variazioni vi vengono unite.
+    - L'invio rispetta i limiti di Telegram: rate limit globale, intervallo minimo per chat (le
+      chat non ancora pronte vengono saltate, senza fermare le altre) e attesa indicata da
+      Telegram (RetryAfter). Le chat che hanno bloccato il bot vengono disiscritte.
+    """
+
+    def __init__(self, roster_for: Callable[[int], Roster], store: Optional[SubscriptionStore] = None):
+        self.roster_for = roster_for
+        self.store = store or SubscriptionStore()
+        self._previous: Optional[Snapshot] = None
+        # chat_id -> variazioni da inviare, nell'ordine in cui le chat sono state accodate
+        self._pending: "OrderedDict[int, Dict[ChangeKey, OddsChange]]" = OrderedDict()
+        self._last_sent: Dict[int, float] = {}
+        self._rate_limiter = TokenBucket(ALERT_RATE_LIMIT, ALERT_RATE_LIMIT, wait_metric=ALERT_RATE_LIMIT_WAIT)
+        self._wakeup = asyncio.Event()
+        self._send: Optional[AlertSender] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def has_subscribers(self) -> bool:
+        return bool(self.store.all())
+
+    async def subscribe(self, chat_id: int, threshold: float = ALERT_THRESHOLD) -> None:
+        # Scrittura del file JSON in un thread, per non bloccare l'event loop
+        await asyncio.to_thread(self.store.set, chat_id, threshold)
+
+    async def unsubscribe(self, chat_id: int) -> None:
+        self._pending.pop(chat_id, None)
+        ALERT_PENDING.set(len(self._pending))
+        await asyncio.to_thread(self.store.remove, chat_id)
+
+    async def on_snapshot(self, snapshot: Snapshot) -> None:
+        """Confronta la nuova istantanea con la precedente e accoda gli avvisi."""
+        previous, self._previous = self._previous, snapshot
+        subscriptions = self.store.all()
+        if previous is None or previous.version == snapshot.version or not subscriptions:
+            return
+
+        rosters = {chat_id: self.roster_for(chat_id) for chat_id in subscriptions}
+        old_quotes, new_quotes = await asyncio.gather(
+            process_pool.match_rosters(previous, rosters), process_pool.match_rosters(snapshot, rosters)
+        )
+        changes = self.diff(old_quotes, new_quotes, subscriptions)
+        for chat_id, chat_changes in changes.items():
+            self._enqueue(chat_id, chat_changes)
+        if changes:
+            logging.info(f"Avvisi sulle quote da inviare a {len(changes)} chat.")
+            self._wakeup.set()
+
+    def _enqueue(self, chat_id: int, changes: List[OddsChange]) -> None:
+        pending = self._pending.setdefault(chat_id, {})
+        for change in changes:
+            # Variazioni successive non ancora inviate: si tiene il valore di partenza più vecchio
+            if change.key in pending:
+                change.before = pending[change.key].before
+            pending[change.key] = change
+        ALERT_PENDING.set(len(self._pending))
+
+    @staticmethod
+    def diff(old_quotes: Dict[int, RosterQuotes], new_quotes: Dict[int, RosterQuotes], subscriptions: Dict[int, float]) -> Dict[int, List[OddsChange]]:
+        """Variazioni oltre soglia per ogni chat iscritta, dagli abbinamenti delle rose alle due istantanee."""
+        result = {}
+        for chat_id, threshold in subscriptions.items():
+            changes = diff_roster_quotes(old_quotes[chat_id], new_quotes[chat_id], threshold)
+            if changes:
+                result[chat_id] = changes
+        return result
+
+    def start(self, send: AlertSender) -> None:
+        self._send = send
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="alert-sender")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _next_due(self) -> Tuple[Optional[int], float]:
+        """
+        Prima chat in coda a cui si può già scrivere; quelle non ancora pronte (intervallo minimo
+        per chat) vengono rimesse in fondo. Se nessuna è pronta, restituisce (None, attesa minima).
+        """
+        now = time.monotonic()
+        wait = ALERT_CHAT_INTERVAL
+        for chat_id in list(self._pending):
+            chat_wait = self._last_sent.get(chat_id, float("-inf")) + ALERT_CHAT_INTERVAL - now
+            if chat_wait <= 0:
+                return chat_id, 0.0
+            self._pending.move_to_end(chat_id)
+            wait = min(wait, chat_wait)
+        return None, wait
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                chat_id, wait = self._next_due()
+                if chat_id is None:
+                    await asyncio.sleep(wait)
+                    continue
+                changes = self._pending.pop(chat_id)
+                ALERT_PENDING.set(len(self._pending))
+                await self._deliver(chat_id, changes)
+
+    async def _deliver(self, chat_id: int, changes: Dict[ChangeKey, OddsChange]) -> None:
+        threshold = self.store.get(chat_id)
+        if threshold is None:
+            return
+        # Dopo l'unione alcune variazioni possono essersi annullate
+        relevant = [change for change in changes.values() if abs(change.delta) >= threshold]
+        if not relevant:
+            return
+
+        await self._rate_limiter.acquire()
+        try:
+            await self._send(chat_id, format_alert(relevant))
+            ALERTS.inc(result="sent")
+        except RetryAfter as e:
+            # Telegram chiede di rallentare: la chat torna in coda (in fondo) e il mittente si ferma
+            ALERTS.inc(result="retry")
+            logging.warning(f"Telegram limita gli invii: riprovo l'avviso alla chat {chat_id} tra {e.retry_after}s.")
+            newer = self._pending.pop(chat_id, {})
+            self._enqueue(chat_id, list(changes.values()) + list(newer.values()))
+            await asyncio.sleep(e.retry_after)
+        except Forbidden:
+            logging.info(f"La chat {chat_id} ha bloccato il bot: la disiscrivo dagli avvisi.")
+            await self.unsubscribe(chat_id)
+        except Exception as e:
+            ALERTS.inc(result="failed")
+            logging.error(f"Errore nell'invio dell'avviso alla chat {chat_id}: {e}")
+        finally:
+            self._last_sent[chat_id] = time.monotonic()
@@ -0,0 +1,81 @@
+"""
+Tempo di importazione dei moduli del bot, misurato con `python -X importtime` in un processo pulito.
+
+Uso:
+    python -m benchmark.bench_import [--module main] [--budget-ms 900] [--top 15]
+
+Esce con codice 1 se il tempo totale supera il budget o se vengono importate dipendenze
+pesanti che devono restare pigre (pandas, openai): utile anche in CI.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Dipendenze da importare solo quando servono (salvataggio CSV, spiegazione dell'AI)
+LAZY_MODULES = ["pandas", "openai"]
+DEFAULT_BUDGET_MS = 900
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def measure_imports(module: str) -> List[Tuple[str, int, int, int]]:
+    """Restituisce (modulo, tempo proprio µs, tempo cumulativo µs, profondità) per ogni import."""
+    env = dict(os.environ)
+    # main.py richiede il token all'importazione; non viene usato
+    env.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Importazione di '{module}' fallita:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="dipendenze dirette più lente da mostrare")
+    parser.add_argument("--repeat", type=int, default=3, help="misure (si tiene la migliore)")
+    args = parser.parse_args()
+
+    runs = [measure_imports(args.module) for _ in range(args.repeat)]
+    imports = min(runs, key=lambda r: next(c for n, _, c, _ in r if n == args.module))
+    total_ms = next(c for n, _, c, _ in imports if n == args.module) / 1000
+
+    # Moduli importati direttamente (profondità 1) dal modulo misurato e dai suoi figli di primo livello
+    by_module: Dict[str, int] = {}
+    for name, _, cumulative, depth in imports:
+        if depth == 1:
+            by_module[name] = max(by_module.get(name, 0), cumulative)
+
+    print(f"import {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, cumulative in sorted(by_module.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {name:<32} {cumulative / 1000:8.1f} ms")
+
+    failures = []
+    imported = {name for name, *_ in imports}
+    eager = [name for name in LAZY_MODULES if name in imported]
+    if eager:
+        failures.append(f"dipendenze importate all'avvio: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"budget superato di {total_ms - args.budget_ms:.0f} ms")
+    if failures:
+        print("ERRORE: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
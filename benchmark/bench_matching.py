@@ -0,0 +1,73 @@
+"""
+Benchmark del matching dei nomi: scansione lineare (`find_best_match`) contro `PlayerNameIndex`.
+
+Uso:
+    python -m benchmark.bench_matching [--players 700] [--roster 24] [--rosters 50]
+"""
+import argparse
+import random
+import time
+
+from quote.matching import PlayerNameIndex
+from quote.model import find_best_match
+
+SYLLABLES = ["ba", "ro", "ma", "ni", "lu", "ka", "de", "zo", "ti", "ver", "gar", "son", "el", "mi", "co", "ra", "vic", "ski", "ez", "al"]
+
+
+def random_surname(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def build_dataset(rng: random.Random, n_players: int, roster_size: int):
+    """Genera i nomi "bookmaker" e un roster con nomi scritti in modo leggermente diverso."""
+    bookmaker_names = sorted({f"{random_surname(rng).upper()} {rng.choice('ABCDEFGHILMNOPRSTVZ')}." for _ in range(n_players)})
+    roster = []
+    for name in rng.sample(bookmaker_names, roster_size // 2):
+        surname, initial = name.split(" ")
+        roster.append(f"{surname.capitalize()} {initial}")
+    # Metà del roster non ha quote (es. difensori senza mercato marcatori)
+    roster.extend(random_surname(rng) for _ in range(roster_size - len(roster)))
+    return bookmaker_names, roster
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=700, help="nomi nel mercato del bookmaker")
+    parser.add_argument("--roster", type=int, default=24, help="giocatori per roster")
+    parser.add_argument("--rosters", type=int, default=50, help="roster da abbinare alla stessa istantanea")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names, roster = build_dataset(rng, args.players, args.roster)
+    rosters = [roster] + [rng.sample(roster, len(roster)) for _ in range(args.rosters - 1)]
+
+    start = time.perf_counter()
+    linear = [{name: find_best_match(name, names) for name in r} for r in rosters]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = PlayerNameIndex(names)
+    build_time = time.perf_counter() - start
+    indexed = [index.match_many(r) for r in rosters]
+    indexed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cold_index = PlayerNameIndex(names)
+    cold_index.match_many(roster)
+    cold_time = time.perf_counter() - start
+
+    agreement = sum(
+        (a[name][0] if a[name] else None) == (b[name][0] if b[name] else None)
+        for a, b in zip(linear, indexed) for name in a
+    ) / sum(len(r) for r in rosters)
+
+    print(f"Nomi bookmaker: {len(names)}, roster: {args.rosters} x {args.roster} giocatori")
+    print(f"Scansione lineare:          {linear_time * 1000:9.2f} ms")
+    print(f"PlayerNameIndex (totale):   {indexed_time * 1000:9.2f} ms (di cui costruzione {build_time * 1000:.2f} ms)")
+    print(f"PlayerNameIndex (1 roster): {cold_time * 1000:9.2f} ms")
+    print(f"Speedup: {linear_time / indexed_time:.1f}x, risultati coincidenti: {agreement:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark del parsing di eventDetail: `json.loads` + `parse_event_detail` contro `parse_event_detail_raw`.
+
+Uso:
+    python -m benchmark.bench_parser [payload.json | cartella ...] [--repeat 20]
+
+Senza argomenti usa payload sintetici con la stessa struttura di quelli Sisal.
+"""
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+from typing import List, Tuple
+
+from quote.config import Config
+from quote.parser import parse_event_detail, parse_event_detail_raw
+
+
+def synthetic_event_detail(match_id: int, n_players: int = 40, n_other_markets: int = 600) -> bytes:
+    """Genera un payload eventDetail con i quattro mercati usati e molti mercati da scartare."""
+    rng = random.Random(match_id)
+
+    def entry(description: str, quota: int) -> dict:
+        return {
+            "descrizione": description,
+            "esitoList": [{"quota": quota, "codiceEsito": rng.randint(1, 99), "stato": 1, "descrizione": "SI"}],
+            "codiceScommessa": rng.randint(1, 99999),
+            "attributi": {"ordine": rng.randint(1, 999), "visibile": True},
+        }
+
+    info = {}
+    for i in range(n_players):
+        name = f"GIOCATORE{match_id}X{i}"
+        info[f"27051-{match_id}-{Config.MARCATORE_KEY_PREFIX}-{i}"] = entry(f"{name} SEGNA O SUO SOSTITUTO INCL. T.S.", rng.randint(150, 2500))
+        info[f"27051-{match_id}-{Config.ASSIST_KEY_PREFIX}-{i}"] = entry(f"{name} ASSIST O SUO SOSTITUTO INCL. T.S.", rng.randint(200, 3000))
+    for i in range(n_other_markets):
+        info[f"27051-{match_id}-{9000 + i}-{rng.randint(0, 9)}"] = entry(f"MERCATO {i}", rng.randint(101, 5000))
+    info[f"27051-{match_id}-{Config.SEGNA_CASA_KEY_PREFIX}-0"] = entry("SEGNA CASA", 130)
+    info[f"27051-{match_id}-{Config.SEGNA_OSPITE_KEY_PREFIX}-0"] = entry("SEGNA OSPITE", 160)
+    return json.dumps({"avvenimento": {"codiceAvvenimento": match_id}, "infoAggiuntivaMap": info}).encode("utf-8")
+
+
+def load_payloads(paths: List[str]) -> List[Tuple[str, bytes]]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(".json"))
+        else:
+            files.append(path)
+    payloads = []
+    for file in files:
+        with open(file, "rb") as f:
+            payloads.append((os.path.splitext(os.path.basename(file))[0], f.read()))
+    return payloads
+
+
+def measure(func, payloads: List[Tuple[str, bytes]], repeat: int) -> Tuple[float, int]:
+    """Restituisce (ms medi per partita, picco di memoria medio per partita in byte)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for match_id, raw in payloads:
+            func(raw, match_id)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / (repeat * len(payloads))
+
+    peaks = []
+    for match_id, raw in payloads:
+        tracemalloc.start()
+        func(raw, match_id)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return elapsed_ms, sum(peaks) // len(peaks)
+
+
+def full_parse(raw: bytes, match_id: str):
+    return parse_event_detail(json.loads(raw), match_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="file o cartelle con payload eventDetail registrati")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.paths) if args.paths else [
+        (str(1000 + i), synthetic_event_detail(1000 + i)) for i in range(10)
+    ]
+
+    for match_id, raw in payloads:
+        if full_parse(raw, match_id) != parse_event_detail_raw(raw, match_id):
+            raise SystemExit(f"Risultati diversi per il payload {match_id}")
+
+    avg_size = sum(len(raw) for _, raw in payloads) / len(payloads) / 1024
+    print(f"Payload: {len(payloads)} partite, {avg_size:.0f} KiB in media")
+    for label, func in (("json.loads + parse_event_detail", full_parse), ("parse_event_detail_raw", parse_event_detail_raw)):
+        elapsed_ms, peak = measure(func, payloads, args.repeat)
+        print(f"{label:<32} {elapsed_ms:8.3f} ms/partita   picco memoria {peak / 1024:8.0f} KiB/partita")
+
+
+if __name__ == "__main__":
+    main()
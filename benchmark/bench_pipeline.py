@@ -0,0 +1,290 @@
+"""
+Benchmark della pipeline delle quote contro fixture registrate servite da un server locale.
+
+Misura: latenza end-to-end di /quote e /formazione (cache fredda e calda), tempi per fase
+(eventi, dettagli, matching, gruppo di processi, rendering, salvataggio CSV), throughput con N comandi
+concorrenti e picco di memoria. I risultati vengono salvati in benchmark/results/ (non
+versionata) e confrontati con l'ultima esecuzione sulle stesse fixture o, se non ce ne sono,
+con il riferimento versionato in benchmark/baseline.json (aggiornabile con --save-baseline).
+
+Uso:
+    python -m benchmark.bench_pipeline [cartella_fixture] [--repeat 10] [--concurrency 50] [--latency 0.02] [--save-baseline]
+
+Senza cartella usa una giornata sintetica (vedi benchmark.fixtures).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Il benchmark non chiama mai Groq; Football-Data è servito dal server locale
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("FOOTBALL_DATA_API_KEY", "benchmark")
+
+from benchmark.fixtures import FixtureSet, load_fixture_set, synthetic_fixture_set  # noqa: E402
+from benchmark.stub_server import StubServer  # noqa: E402
+from coalescing import request_coalescer  # noqa: E402
+from formazione import model as formazione_model  # noqa: E402
+from formazione.rosters import roster_key  # noqa: E402
+from quote import model as quote_model  # noqa: E402
+from quote.cache import Snapshot, fingerprint, snapshot_cache  # noqa: E402
+from quote.client import ScraperClient, close_scraper_client  # noqa: E402
+from quote.delta import DeltaState  # noqa: E402
+from quote.parser import parse_event_detail_raw, parse_events  # noqa: E402
+from quote.render import QuotesRenderer  # noqa: E402
+from quote.save import save_all_quotes_to_dataframe  # noqa: E402
+from quote.store import close_odds_store  # noqa: E402
+from quote.table import get_quotes_table  # noqa: E402
+from workers import process_pool  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+ROLES = ["Por", "Dif", "Cen", "Att"]
+ROLE_SIZES = {"Por": 3, "Dif": 8, "Cen": 8, "Att": 6}
+
+Roster = Dict[str, List[Tuple[str, str]]]
+
+
+def roster_from_fixtures(fixtures: FixtureSet) -> Roster:
+    """
+    Costruisce una rosa dai giocatori presenti nelle fixture, con i nomi scritti
+    come in una rosa di fantacalcio ("THURAM K." -> "Thuram K.").
+    """
+    matches, _ = parse_events(json.loads(fixtures.events))
+    teams = {match.id: match for match in matches}
+    players = []
+    for match_id, raw in fixtures.event_details.items():
+        scorers, _, _ = parse_event_detail_raw(raw, match_id)
+        match = teams.get(match_id)
+        if match:
+            players.extend((p.player_name.title(), match.home_team if i % 2 else match.away_team) for i, p in enumerate(scorers))
+
+    # Distribuisce i giocatori sui ruoli prendendoli da partite diverse; i portieri sono solo squadre
+    players = players[::max(1, len(players) // 25)]
+    roster: Roster = {"Por": [(f"Portiere {m.home_team}", m.home_team) for m in matches[:ROLE_SIZES["Por"]]]}
+    start = 0
+    for role in ROLES[1:]:
+        roster[role] = players[start:start + ROLE_SIZES[role]]
+        start += ROLE_SIZES[role]
+    return roster
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Statistiche in millisecondi."""
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "median_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "min_ms": round(ms[0], 3),
+    }
+
+
+async def timed(func: Callable[[], Awaitable[Any]], repeat: int, before: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def timed_sync(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def quote_command(roster: Roster) -> str:
+    """Quello che fa /quote, senza Telegram: istantanea condivisa, gruppo di processi e rendering in cache."""
+    snapshot = await quote_model.get_latest_snapshot()
+    roster_hash = roster_key(roster)
+    rendered = await request_coalescer.run(
+        ("quote", roster_hash, snapshot.version), lambda: quote_model.render_roster_quotes(roster, roster_hash, snapshot), label="quote"
+    )
+    return quote_model.format_stale_notice(snapshot) + rendered.pages[0]
+
+
+async def formazione_command(roster: Roster) -> str:
+    """Quello che fa /formazione, senza Telegram e senza spiegazione dell'AI."""
+    return await formazione_model.get_best_lineup(roster, explain=False)
+
+
+async def run_benchmark(fixtures: FixtureSet, repeat: int, concurrency: int, latency: float) -> Dict[str, Any]:
+    roster = roster_from_fixtures(fixtures)
+    results: Dict[str, Any] = {"stages": {}, "end_to_end": {}, "throughput": {}, "memory": {}}
+    stages = results["stages"]
+
+    process_pool.start()
+    with StubServer(fixtures, latency=latency) as server:
+        async with ScraperClient() as client:
+            matches, codice = await quote_model.get_next_events_async(client)
+            stages["events"] = await timed(lambda: quote_model.get_next_events_async(client), repeat)
+            stages["details"] = await timed(lambda: quote_model.fetch_and_process_all_data_async(client, matches, codice), repeat)
+            data = await quote_model.fetch_and_process_all_data_async(client, matches, codice)
+            # Aggiornamento incrementale senza variazioni (richieste condizionali, 304)
+            delta = DeltaState()
+            await quote_model.fetch_and_process_all_data_async(client, matches, codice, delta)
+            stages["details_unchanged"] = await timed(lambda: quote_model.fetch_and_process_all_data_async(client, matches, codice, delta), repeat)
+
+        # Tabella e indici sono costruiti una volta per istantanea: misuriamo il primo abbinamento a parte
+        def first_match():
+            fresh = quote_model.aggregate_match_quotes(list(data.match_quotes.values()))
+            quote_model.get_roster_quotes(roster, fresh)
+
+        stages["table"] = timed_sync(lambda: get_quotes_table(quote_model.aggregate_match_quotes(list(data.match_quotes.values()))), repeat)
+        stages["matching_cold"] = timed_sync(first_match, repeat)
+        stages["matching_warm"] = timed_sync(lambda: quote_model.get_roster_quotes(roster, data), repeat)
+        # Abbinamento nel gruppo di processi (come /quote e gli avvisi) e rendering a cache vuota
+        snapshot = Snapshot(codice, data, version=fingerprint(data))
+        await process_pool.match_rosters(snapshot, {"benchmark": roster})  # avvio dei worker e caricamento dell'istantanea
+        stages["matching_pool"] = await timed(lambda: process_pool.match_rosters(snapshot, {"benchmark": roster}), repeat)
+        roster_quotes = quote_model.get_roster_quotes(roster, data)
+        stages["rendering"] = timed_sync(lambda: QuotesRenderer().render(snapshot.version, "benchmark", lambda: roster_quotes), repeat)
+        stages["csv_save"] = timed_sync(lambda: save_all_quotes_to_dataframe(data), repeat)
+
+        # --- End-to-end, come i comandi del bot (client e cache condivisi) ---
+        e2e = results["end_to_end"]
+        e2e["quote_cold"] = await timed(lambda: quote_command(roster), repeat, before=snapshot_cache.invalidate)
+        e2e["quote_warm"] = await timed(lambda: quote_command(roster), repeat)
+        formazione_model._fixtures_cache = None
+        e2e["fixtures_cold"] = await timed(formazione_model.fetch_next_matchday, repeat)
+        e2e["formazione_warm"] = await timed(lambda: formazione_command(roster), repeat)
+
+        # --- Throughput: N comandi /quote concorrenti, a cache fredda e calda ---
+        for label, before in (("quote_cold", snapshot_cache.invalidate), ("quote_warm", None)):
+            if before:
+                before()
+            start = time.perf_counter()
+            await asyncio.gather(*(quote_command(roster) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            results["throughput"][label] = {
+                "commands": concurrency,
+                "total_ms": round(elapsed * 1000, 3),
+                "commands_per_s": round(concurrency / elapsed, 1),
+            }
+
+        # --- Memoria: picco durante uno scraping completo e l'abbinamento della rosa ---
+        snapshot_cache.invalidate()
+        tracemalloc.start()
+        await quote_command(roster)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["memory"]["quote_cold_peak_kib"] = round(peak / 1024)
+        results["memory"]["quote_cold_retained_kib"] = round(current / 1024)
+
+        results["http_requests"] = server.requests
+
+    await process_pool.stop()
+    await close_scraper_client()
+    close_odds_store()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "sconosciuto"
+
+
+def previous_result(fixtures_name: str) -> Optional[Dict[str, Any]]:
+    """Ultimo risultato salvato per le stesse fixture, altrimenti il riferimento versionato."""
+    files = sorted(os.listdir(RESULTS_DIR), reverse=True) if os.path.isdir(RESULTS_DIR) else []
+    paths = [os.path.join(RESULTS_DIR, file) for file in files if file.endswith(".json")]
+    if os.path.exists(BASELINE_PATH):
+        paths.append(BASELINE_PATH)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            result = json.load(f)
+        if result.get("fixtures") == fixtures_name:
+            return result
+    return None
+
+
+def save_result(result: Dict[str, Any], path: Optional[str] = None) -> str:
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{result['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def print_report(result: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> None:
+    def compare(section: str, name: str, key: str, value: float) -> str:
+        old = (previous or {}).get(section, {}).get(name, {}).get(key)
+        if not old:
+            return ""
+        return f"  ({(value - old) / old * 100:+.0f}% rispetto a {previous['commit']})"
+
+    print(f"Fixture: {result['fixtures']} ({result['matches']} partite), commit {result['commit']}")
+    for section in ("stages", "end_to_end"):
+        print(f"\n{section}")
+        for name, stats in result[section].items():
+            print(f"  {name:<16} mediana {stats['median_ms']:9.3f} ms   p95 {stats['p95_ms']:9.3f} ms"
+                  + compare(section, name, "median_ms", stats["median_ms"]))
+    print("\nthroughput")
+    for name, stats in result["throughput"].items():
+        print(f"  {name:<16} {stats['commands']} comandi in {stats['total_ms']:.0f} ms ({stats['commands_per_s']}/s)"
+              + compare("throughput", name, "total_ms", stats["total_ms"]))
+    print("\nmemory")
+    for name, value in result["memory"].items():
+        print(f"  {name:<24} {value} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="?", help="cartella di fixture registrate (default: giornata sintetica)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=50, help="comandi /quote concorrenti")
+    parser.add_argument("--latency", type=float, default=0.0, help="latenza simulata del server, in secondi")
+    parser.add_argument("--no-save", action="store_true", help="non salvare il risultato")
+    parser.add_argument("--save-baseline", action="store_true", help="salva il risultato come riferimento versionato (benchmark/baseline.json)")
+    args = parser.parse_args()
+
+    fixtures = load_fixture_set(args.fixtures) if args.fixtures else synthetic_fixture_set()
+
+    import logging
+    logging.disable(logging.INFO)
+    # Storico e CSV finiscono in una cartella temporanea
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            measures = asyncio.run(run_benchmark(fixtures, args.repeat, args.concurrency, args.latency))
+        finally:
+            os.chdir(cwd)
+
+    result = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "fixtures": fixtures.name,
+        "matches": len(fixtures.event_details),
+        "args": {"repeat": args.repeat, "concurrency": args.concurrency, "latency": args.latency},
+        **measures,
+    }
+    print_report(result, previous_result(fixtures.name))
+    if not args.no_save:
+        print(f"\nRisultato salvato in {save_result(result)}")
+    if args.save_baseline:
+        print(f"Riferimento salvato in {save_result(result, BASELINE_PATH)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Fixture registrate per i benchmark: risposte `schedaManifestazione`, `eventDetail` e Football-Data salvate su disco.
+
+Struttura di una cartella di fixture:
+    events.json                 risposta schedaManifestazione
+    event_detail/<match_id>.json  una risposta eventDetail per partita
+    football_data.json          (facoltativo) partite della prossima giornata
+
+Uso:
+    python -m benchmark.fixtures record benchmark/fixtures/giornata_07   # dalle API reali
+    python -m benchmark.fixtures synthetic benchmark/fixtures/sintetiche [--matches 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmark.bench_parser import synthetic_event_detail
+from quote.client import ScraperClient
+from quote.config import Config
+from quote.parser import parse_events
+
+EVENTS_FILE = "events.json"
+EVENT_DETAIL_DIR = "event_detail"
+FOOTBALL_DATA_FILE = "football_data.json"
+
+TEAMS = [
+    "Atalanta", "Bologna", "Cagliari", "Como", "Cremonese", "Fiorentina", "Genoa", "Inter", "Juventus", "Lazio",
+    "Lecce", "Milan", "Napoli", "Parma", "Pisa", "Roma", "Sassuolo", "Torino", "Udinese", "Verona",
+]
+
+
+@dataclass
+class FixtureSet:
+    """Risposte registrate, come byte pronti da servire."""
+    name: str
+    events: bytes
+    event_details: Dict[str, bytes]
+    football_data: Optional[bytes] = None
+
+
+def load_fixture_set(path: str) -> FixtureSet:
+    def read(file: str) -> bytes:
+        with open(file, "rb") as f:
+            return f.read()
+
+    details_dir = os.path.join(path, EVENT_DETAIL_DIR)
+    event_details = {
+        os.path.splitext(file)[0]: read(os.path.join(details_dir, file))
+        for file in sorted(os.listdir(details_dir)) if file.endswith(".json")
+    }
+    football_data_path = os.path.join(path, FOOTBALL_DATA_FILE)
+    return FixtureSet(
+        name=os.path.basename(os.path.normpath(path)),
+        events=read(os.path.join(path, EVENTS_FILE)),
+        event_details=event_details,
+        football_data=read(football_data_path) if os.path.exists(football_data_path) else None,
+    )
+
+
+def save_fixture_set(fixtures: FixtureSet, path: str) -> None:
+    os.makedirs(os.path.join(path, EVENT_DETAIL_DIR), exist_ok=True)
+    files = {EVENTS_FILE: fixtures.events}
+    files.update({os.path.join(EVENT_DETAIL_DIR, f"{match_id}.json"): raw for match_id, raw in fixtures.event_details.items()})
+    if fixtures.football_data is not None:
+        files[FOOTBALL_DATA_FILE] = fixtures.football_data
+    for file, raw in files.items():
+        with open(os.path.join(path, file), "wb") as f:
+            f.write(raw)
+
+
+def synthetic_fixture_set(n_matches: int = 10, seed: int = 1000) -> FixtureSet:
+    """Una giornata sintetica con la stessa struttura delle risposte reali."""
+    rng = random.Random(seed)
+    teams = rng.sample(TEAMS, 2 * n_matches) if 2 * n_matches <= len(TEAMS) else [f"Squadra {i}" for i in range(2 * n_matches)]
+    codice_palinsesto = 27051
+    scommessa_map = {}
+    fixtures = []
+    kickoff = datetime(2025, 10, 18, 13, tzinfo=timezone.utc)
+    for i in range(n_matches):
+        home, away = teams[2 * i], teams[2 * i + 1]
+        match_id = seed + i
+        scommessa_map[f"{codice_palinsesto}-{match_id}"] = {
+            "codicePalinsesto": codice_palinsesto,
+            "codiceAvvenimento": match_id,
+            "descrizioneAvvenimento": f"{home} - {away}",
+        }
+        fixtures.append({
+            "matchday": 7,
+            "utcDate": (kickoff + timedelta(hours=3 * i)).isoformat().replace("+00:00", "Z"),
+            "homeTeam": {"name": home},
+            "awayTeam": {"name": away},
+        })
+
+    return FixtureSet(
+        name="sintetiche",
+        events=json.dumps({"scommessaMap": scommessa_map}).encode("utf-8"),
+        event_details={str(seed + i): synthetic_event_detail(seed + i) for i in range(n_matches)},
+        football_data=json.dumps({"matches": fixtures}).encode("utf-8"),
+    )
+
+
+async def record_fixture_set(name: str) -> FixtureSet:
+    """Scarica le risposte reali di Sisal (e di Football-Data, se la chiave è configurata)."""
+    async with ScraperClient() as client:
+        events = await client.get_bytes(Config.EVENTS_URL)
+        matches, codice_palinsesto = parse_events(json.loads(events))
+        if not matches:
+            raise SystemExit("Nessuna partita nel palinsesto: niente da registrare.")
+
+        async def detail(match_id: str) -> bytes:
+            url = Config.EVENT_DETAIL_URL_TEMPLATE.format(codice_palinsesto=codice_palinsesto, match_id=match_id)
+            return await client.get_bytes(url)
+
+        raws: List[bytes] = await asyncio.gather(*(detail(match.id) for match in matches))
+
+    football_data = None
+    token = os.getenv("FOOTBALL_DATA_API_KEY")
+    if token:
+        from formazione.model import FOOTBALL_DATA_URL
+        async with httpx.AsyncClient(timeout=Config.HTTP_TIMEOUT) as http:
+            response = await http.get(FOOTBALL_DATA_URL, headers={"X-Auth-Token": token})
+            response.raise_for_status()
+            football_data = response.content
+
+    return FixtureSet(name, events, {match.id: raw for match, raw in zip(matches, raws)}, football_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["record", "synthetic"])
+    parser.add_argument("path", help="cartella di destinazione")
+    parser.add_argument("--matches", type=int, default=10, help="partite (solo fixture sintetiche)")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        fixtures = asyncio.run(record_fixture_set(os.path.basename(os.path.normpath(args.path))))
+    else:
+        fixtures = synthetic_fixture_set(args.matches)
+    save_fixture_set(fixtures, args.path)
+    size = (len(fixtures.events) + sum(len(raw) for raw in fixtures.event_details.values())) / 1024
+    print(f"Salvate {len(fixtures.event_details)} partite ({size:.0f} KiB) in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
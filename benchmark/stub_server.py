@@ -0,0 +1,127 @@
+"""
+Server HTTP locale che serve le fixture registrate al posto di Sisal e Football-Data.
+
+    with StubServer(load_fixture_set("benchmark/fixtures/giornata_07"), latency=0.05) as server:
+        ...  # Config.EVENTS_URL, Config.EVENT_DETAIL_URL_TEMPLATE e FOOTBALL_DATA_URL puntano al server
+
+Supporta ETag / If-None-Match, così anche lo scraping incrementale viene misurato.
+"""
+import hashlib
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from benchmark.fixtures import FixtureSet
+from quote.config import Config
+
+_DETAIL_PATH = re.compile(r"^/eventDetail/[^-/]+-([^/?]+)")
+
+
+class StubServer:
+    def __init__(self, fixtures: FixtureSet, latency: float = 0.0):
+        self.fixtures = fixtures
+        # Latenza simulata per ogni risposta, in secondi
+        self.latency = latency
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._saved_urls: Dict[str, str] = {}
+        self._etags: Dict[int, str] = {}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _route(self, path: str) -> Optional[bytes]:
+        if path.startswith("/schedaManifestazione"):
+            return self.fixtures.events
+        if path.startswith("/football-data"):
+            return self.fixtures.football_data
+        match = _DETAIL_PATH.match(path)
+        return self.fixtures.event_details.get(match.group(1)) if match else None
+
+    def _etag(self, body: bytes) -> str:
+        # Calcolato una volta per fixture, per non pesare sui tempi misurati
+        etag = self._etags.get(id(body))
+        if etag is None:
+            etag = self._etags[id(body)] = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+        return etag
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, come i server reali
+            # Intestazioni e corpo sono scritti separatamente: senza questo Nagle aggiunge ~40 ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                body = stub._route(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                etag = stub._etag(body)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubServer":
+        import formazione.model as formazione_model
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+
+        self._saved_urls = {
+            "EVENTS_URL": Config.EVENTS_URL,
+            "EVENT_DETAIL_URL_TEMPLATE": Config.EVENT_DETAIL_URL_TEMPLATE,
+            "FOOTBALL_DATA_URL": formazione_model.FOOTBALL_DATA_URL,
+        }
+        Config.EVENTS_URL = f"{self.base_url}/schedaManifestazione"
+        Config.EVENT_DETAIL_URL_TEMPLATE = f"{self.base_url}/eventDetail/{{codice_palinsesto}}-{{match_id}}"
+        formazione_model.FOOTBALL_DATA_URL = f"{self.base_url}/football-data/matches"
+        return self
+
+    def stop(self) -> None:
+        import formazione.model as formazione_model
+
+        if self._saved_urls:
+            Config.EVENTS_URL = self._saved_urls["EVENTS_URL"]
+            Config.EVENT_DETAIL_URL_TEMPLATE = self._saved_urls["EVENT_DETAIL_URL_TEMPLATE"]
+            formazione_model.FOOTBALL_DATA_URL = self._saved_urls["FOOTBALL_DATA_URL"]
+            self._saved_urls = {}
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,38 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from metrics import registry
+
+COALESCED = registry.counter("fanta_coalesced_requests_total", "Comandi serviti, per comando e per esito (computed, shared).")
+
+
+class RequestCoalescer:
+    """
+    Condivide le elaborazioni identiche in corso: chi chiede una chiave già in
+    elaborazione attende lo stesso risultato invece di ricalcolarlo.
+    A elaborazione conclusa la chiave viene dimenticata (non è una cache).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]], label: str = "") -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            COALESCED.inc(command=label, result="computed")
+            task = asyncio.create_task(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            COALESCED.inc(command=label, result="shared")
+            logging.info(f"Richiesta '{label}' già in elaborazione: attendo lo stesso risultato.")
+        # `shield` evita che la cancellazione di un chiamante interrompa l'elaborazione per gli altri
+        return await asyncio.shield(task)
+
+
+# Condiviso da tutti i comandi del bot
+request_coalescer = RequestCoalescer()
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.json")
+LLM_CACHE_TTL = 24 * 3600  # secondi
+LLM_CACHE_MAX_ENTRIES = 256
+
+
+def cache_key(*parts: str) -> str:
+    """Chiave basata sul contenuto (modello, prompt, ...)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """
+    Cache delle risposte del modello linguistico, indicizzate per contenuto della richiesta.
+    Le voci scadono dopo `ttl` secondi; oltre `max_entries` si elimina la meno usata di recente (LRU).
+    La cache è salvata su un file JSON, quindi sopravvive ai riavvii.
+    """
+
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # chiave -> (istante di creazione, secondi dall'epoch; risposta)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = self._load()
+
+    def _load(self) -> "OrderedDict[str, Tuple[float, str]]":
+        if not self.path or not os.path.exists(self.path):
+            return OrderedDict()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Impossibile leggere la cache AI da '{self.path}': {e}")
+            return OrderedDict()
+
+        now = time.time()
+        return OrderedDict((key, (created, value)) for key, (created, value) in raw.items() if now - created < self.ttl)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        # Scrittura atomica: un crash a metà non lascia il file corrotto
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Impossibile salvare la cache AI in '{self.path}': {e}")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,51 +1,138 @@
+import asyncio
+import importlib.util
 import os
-import json
 import logging
-from typing import List, Dict, Tuple
-from openai import AsyncOpenAI, BadRequestError
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, List, Dict, Tuple, Optional, Union
 from dotenv import load_dotenv
 import httpx
 
+from formazione.optimizer import Lineup, best_lineups
+from formazione.llm_cache import LLMCache, cache_key
+from formazione.simulation import simulate_roster
+from metrics import registry, span, timed
+from quote.model import get_latest_snapshot, get_roster_quotes
+from workers import process_pool
+
 load_dotenv()
 
-# Configurazione del logging anche qui
-logging.basicConfig(level=logging.INFO)
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from quote.config import ProcessedData
 
 FOOTBALL_DATA_TOKEN = os.getenv("FOOTBALL_DATA_API_KEY")
 SERIE_A_ID = 2019
+FOOTBALL_DATA_URL = f"https://api.football-data.org/v4/competitions/{SERIE_A_ID}/matches?status=SCHEDULED"
+# Spiegazione della formazione tramite AI (facoltativa: la scelta è comunque fatta dall'ottimizzatore)
+LINEUP_EXPLANATION = os.getenv("LINEUP_EXPLANATION", "0") == "1"
+LINEUP_ALTERNATIVES = 2  # Formazioni alternative mostrate sotto quella consigliata
+# Il calendario di una giornata cambia poche volte a settimana: lo si riscarica solo
+# a giornata conclusa (ultimo calcio d'inizio + MATCH_DURATION) o dopo FIXTURES_TTL secondi
+FIXTURES_TTL = 24 * 3600
+MATCH_DURATION = timedelta(hours=2)
+FIXTURES_ERROR_TTL = 60  # secondi in cui un errore di Football-Data viene riusato senza richiamare l'API
 
-client = AsyncOpenAI(
-    api_key=os.getenv("GROQ_API_KEY"),
-    base_url="https://api.groq.com/openai/v1"
-)
+# Client HTTP condivisi (Football-Data e Groq): pool di connessioni keep-alive, HTTP/2 se disponibile
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+API_TIMEOUT = httpx.Timeout(15, connect=5)
+LLM_TIMEOUT = httpx.Timeout(60, connect=5)
+API_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=60)
 
+# Ultima giornata scaricata: (istante monotono dello scaricamento, dati)
+_fixtures_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+# Ultimo errore dello scaricamento: (istante monotono, messaggio)
+_fixtures_error: Optional[Tuple[float, str]] = None
+
+LLM_MODEL = "llama-3.3-70b-versatile"
+# Spiegazioni già generate, anche tra un riavvio e l'altro
+llm_cache = LLMCache()
+LLM_CACHE = registry.counter("fanta_llm_cache_total", "Richieste di spiegazione all'AI, per esito della cache (hit, miss).")
+
+_football_data_client: Optional[httpx.AsyncClient] = None
+_llm_client: Optional["AsyncOpenAI"] = None
+
+
+def get_football_data_client() -> httpx.AsyncClient:
+    """Client condiviso per Football-Data, creato al primo utilizzo."""
+    global _football_data_client
+    if _football_data_client is None or _football_data_client.is_closed:
+        _football_data_client = httpx.AsyncClient(
+            headers={"X-Auth-Token": FOOTBALL_DATA_TOKEN or ""},
+            timeout=API_TIMEOUT,
+            limits=API_LIMITS,
+            http2=HTTP2_AVAILABLE,
+        )
+    return _football_data_client
+
+
+def get_llm_client() -> "AsyncOpenAI":
+    """Client condiviso per Groq (API compatibile OpenAI), creato al primo utilizzo."""
+    global _llm_client
+    if _llm_client is None:
+        from openai import AsyncOpenAI  # importato solo quando serve: pesa sull'avvio del bot
+
+        _llm_client = AsyncOpenAI(
+            api_key=os.getenv("GROQ_API_KEY"),
+            base_url="https://api.groq.com/openai/v1",
+            timeout=LLM_TIMEOUT,
+            max_retries=1,
+            http_client=httpx.AsyncClient(timeout=LLM_TIMEOUT, limits=API_LIMITS, http2=HTTP2_AVAILABLE),
+        )
+    return _llm_client
+
+
+def open_http_clients() -> None:
+    """Crea i client condivisi (da chiamare allo startup dell'applicazione)."""
+    get_football_data_client()
+    if LINEUP_EXPLANATION:
+        get_llm_client()
+
+
+async def close_http_clients() -> None:
+    """Chiude i client condivisi (da chiamare allo shutdown dell'applicazione)."""
+    global _football_data_client, _llm_client
+    if _football_data_client is not None:
+        await _football_data_client.aclose()
+        _football_data_client = None
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
+
+
+@timed("fetch_next_matchday")
+async def fetch_next_matchday() -> Union[Dict[str, Any], str]:
+    """
+    Scarica le partite della prossima giornata di Serie A e aggiorna la cache.
+    Restituisce un dizionario {"matchday", "fixtures", "kickoffs"} oppure un messaggio di errore.
+    """
+    global _fixtures_cache
 
-async def get_next_matchday_fixtures():
-    """Recupera le partite della prossima giornata di Serie A."""
     if not FOOTBALL_DATA_TOKEN:
         return "Errore: Chiave API per i dati sul calcio non trovata."
 
-    url = f"https://api.football-data.org/v4/competitions/{SERIE_A_ID}/matches?status=SCHEDULED"
-    headers = {"X-Auth-Token": FOOTBALL_DATA_TOKEN}
-    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()  # Solleva un'eccezione per errori HTTP (4xx o 5xx)
-            data = response.json()
-            
-            if not data.get("matches"):
-                return "Nessuna partita programmata trovata per la Serie A."
-            
-            # Formatta le partite in una stringa leggibile
-            matchday = data['matches'][0]['matchday']
-            fixtures_list = [
-                f"{match['homeTeam']['name']} - {match['awayTeam']['name']}"
-                for match in data['matches'] if match['matchday'] == matchday
-            ]
-            logging.info(f"Partite della prossima giornata ({matchday}): {fixtures_list}")
-            return f"Giornata {matchday}, stagione 2025/2026:\n" + "\n".join(fixtures_list)
-            
+        response = await get_football_data_client().get(FOOTBALL_DATA_URL)
+        response.raise_for_status()  # Solleva un'eccezione per errori HTTP (4xx o 5xx)
+        data = response.json()
+
+        if not data.get("matches"):
+            return "Nessuna partita programmata trovata per la Serie A."
+
+        matchday = data['matches'][0]['matchday']
+        matches = [match for match in data['matches'] if match['matchday'] == matchday]
+        matchday_data = {
+            "matchday": matchday,
+            "fixtures": [f"{match['homeTeam']['name']} - {match['awayTeam']['name']}" for match in matches],
+            "kickoffs": sorted(
+                datetime.fromisoformat(match['utcDate'].replace("Z", "+00:00"))
+                for match in matches if match.get('utcDate')
+            ),
+        }
+        logging.info(f"Partite della prossima giornata ({matchday}): {matchday_data['fixtures']}")
+        _fixtures_cache = (time.monotonic(), matchday_data)
+        return matchday_data
+
     except httpx.HTTPStatusError as e:
         logging.error(f"Errore API Football-Data: {e.response.status_code} - {e.response.text}")
         return "Errore nel recuperare i dati delle partite dall'API."
@@ -54,75 +141,161 @@ async def get_next_matchday_fixtures():
         return "Errore sconosciuto durante il recupero delle partite."
 
 
-async def get_best_lineup(ROSTER: Dict[str, List[Tuple[str, str]]]):
-    """Genera la formazione tenendo conto delle partite della prossima giornata."""
-    
-    # 1. Recupera le partite
-    fixtures_info = await get_next_matchday_fixtures()
-    if fixtures_info.startswith("Errore"):
-        return fixtures_info # Restituisce direttamente il messaggio di errore
-
-    # 2. Crea il prompt con il nuovo contesto
-    prompt = f"""
-        Sei un esperto di fantacalcio. Il tuo compito è scegliere la migliore formazione per la prossima giornata.
-
-        LA MIA ROSA (Nome, Squadra):
-        Portieri: {ROSTER['Por']}
-        Difensori: {ROSTER['Dif']}
-        Centrocampisti: {ROSTER['Cen']}
-        Attaccanti: {ROSTER['Att']}
-
-        PARTITE DELLA PROSSIMA GIORNATA:
-        {fixtures_info}
-
-        ISTRUZIONI:
-        1. Scegli la migliore formazione (1 POR, 3 DIF, 4 CEN, 3 ATT).
-        2. Valuta la difficoltà delle partite: favorisci i giocatori di squadre forti che giocano contro squadre deboli, specialmente se giocano in casa.
-        4. Scegli un portiere che ha alte probabilità di non subire gol (clean sheet).
-        4. Considera centrocampisti e attaccanti che hanno buone probabilità di segnare o fornire assist.
-        5. Considera le quote dei bookmaker come indicatore di performance attesa.
-
-        Restituisci ESCLUSIVAMENTE un oggetto JSON valido con la seguente struttura, senza alcun testo aggiuntivo:
-        {{
-            "Por": ["nome"],
-            "Dif": ["nome1", "nome2", "nome3"],
-            "Cen": ["nome1", "nome2", "nome3", "nome4"],
-            "Att": ["nome1", "nome2", "nome3"]
-        }}
+def get_cached_matchday() -> Optional[Dict[str, Any]]:
+    """Restituisce l'ultima giornata scaricata (anche se scaduta), senza chiamare l'API."""
+    return _fixtures_cache[1] if _fixtures_cache else None
+
+
+def matchday_over(matchday_data: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """True se tutte le partite della giornata sono finite (serve il calendario della successiva)."""
+    kickoffs = matchday_data["kickoffs"]
+    return bool(kickoffs) and kickoffs[-1] + MATCH_DURATION < (now or datetime.now(timezone.utc))
+
+
+async def get_matchday() -> Union[Dict[str, Any], str]:
     """
+    La prossima giornata (dalla cache se recente), oppure un messaggio di errore.
+    Anche gli errori restano in cache per FIXTURES_ERROR_TTL secondi, così a giornata conclusa
+    e con Football-Data non disponibile i comandi non richiamano l'API ogni volta.
+    """
+    global _fixtures_error
+    now = time.monotonic()
+    if _fixtures_cache and now - _fixtures_cache[0] < FIXTURES_TTL and not matchday_over(_fixtures_cache[1]):
+        return _fixtures_cache[1]
+    if _fixtures_error and now - _fixtures_error[0] < FIXTURES_ERROR_TTL:
+        return _fixtures_error[1]
 
-    try:
-        response = await client.chat.completions.create(
-            model="llama-3.3-70b-versatile", 
-            messages=[
-                {"role": "system", "content": "Sei un assistente che risponde solo in formato JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1 # Abbassiamo la temperatura per risposte più prevedibili
-        )
+    result = await fetch_next_matchday()
+    _fixtures_error = (time.monotonic(), result) if isinstance(result, str) else None
+    return result
 
-        content = response.choices[0].message.content
-        lineup = json.loads(content)
 
-        formazione_text = (
-            f"\n🧤 *POR*: {', '.join(lineup.get('Por', []))}\n"
-            f"🛡️ *DIF*: {', '.join(lineup.get('Dif', []))}\n"
-            f"👟 *CEN*: {', '.join(lineup.get('Cen', []))}\n"
-            f"⚽ *ATT*: {', '.join(lineup.get('Att', []))}"
-        )
-        
-        return formazione_text
-
-    # Catturiamo l'errore specifico di OpenAI/Groq
-    except BadRequestError as e:
-        logging.error(f"Errore 400 da Groq: {e.body}")
-        # Restituiamo un testo pulito, senza caratteri speciali
-        return "Errore: la richiesta all'AI e' stata rifiutata. Controlla il prompt o i parametri del modello."
-    
-    except json.JSONDecodeError:
-        logging.error(f"Errore di parsing JSON. Risposta ricevuta: {content}")
-        return "Errore: l'AI non ha risposto con un JSON valido."
-        
+async def get_next_matchday_fixtures():
+    """Recupera le partite della prossima giornata di Serie A (dalla cache se recente)."""
+    matchday_data = await get_matchday()
+    if isinstance(matchday_data, str):
+        return matchday_data
+
+    # Formatta le partite in una stringa leggibile
+    return f"Giornata {matchday_data['matchday']}, stagione 2025/2026:\n" + "\n".join(matchday_data["fixtures"])
+
+
+def format_score(lineup: Lineup) -> str:
+    """Bonus attesi, con la deviazione standard se la formazione è stata simulata."""
+    if lineup.variance is None:
+        return f"{lineup.score:+.2f}"
+    return f"{lineup.score:+.2f} ± {lineup.variance ** 0.5:.2f}"
+
+
+def format_lineup(lineup: Lineup) -> str:
+    """Formatta una formazione per Telegram."""
+    def names(role):
+        return ', '.join(p.name for p in lineup.players.get(role, []))
+
+    return (
+        f"\n🧮 *Modulo*: {lineup.module} (bonus attesi {format_score(lineup)})\n"
+        f"🧤 *POR*: {names('Por')}\n"
+        f"🛡️ *DIF*: {names('Dif')}\n"
+        f"👟 *CEN*: {names('Cen')}\n"
+        f"⚽ *ATT*: {names('Att')}"
+    )
+
+
+def build_explanation_prompt(lineup: Lineup, matchday_data: Union[Dict[str, Any], str]) -> str:
+    """
+    Prompt compatto per la spiegazione: giocatori raggruppati per squadra con ruolo
+    (iniziale) e bonus attesi, e solo le partite delle squadre schierate.
+    """
+    by_team: Dict[str, List[str]] = {}
+    for role, players in lineup.players.items():
+        for p in players:
+            by_team.setdefault(p.team, []).append(f"{p.name} {role[0]} {p.score:+.2f}")
+    players_text = "\n".join(f"{team}: {', '.join(players)}" for team, players in by_team.items())
+
+    if isinstance(matchday_data, str):
+        fixtures_text = "non disponibili"
+    else:
+        teams = [team.lower() for team in by_team]
+        fixtures = [f.replace(" - ", "-") for f in matchday_data["fixtures"]]
+        relevant = [f for f in fixtures if any(team in f.lower() for team in teams)]
+        fixtures_text = f"G{matchday_data['matchday']}: " + ", ".join(relevant or fixtures)
+
+    return (
+        f"Fantacalcio. Formazione {lineup.module} scelta dalle quote dei bookmaker "
+        f"(ruolo P/D/C/A, bonus attesi):\n{players_text}\n"
+        f"Partite {fixtures_text}\n"
+        "Spiega in massimo 3 frasi, in italiano, perché è una buona scelta. Non proporre cambi."
+    )
+
+
+async def explain_lineup(lineup: Lineup) -> Optional[str]:
+    """
+    Chiede all'AI una breve spiegazione della formazione scelta. Restituisce None in caso di errore.
+    Le risposte sono in cache per contenuto del prompt (formazione, bonus attesi e partite).
+    """
+    prompt = build_explanation_prompt(lineup, await get_matchday())
+    key = cache_key(LLM_MODEL, prompt)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        LLM_CACHE.inc(result="hit")
+        return cached
+    LLM_CACHE.inc(result="miss")
+
+    try:
+        with span("groq_completion"):
+            response = await get_llm_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1
+            )
+        explanation = response.choices[0].message.content.strip()
     except Exception as e:
-        logging.error(f"Errore generico in get_best_lineup: {e}", exc_info=True)
-        return "Errore generico durante la generazione della formazione."
\ No newline at end of file
+        logging.error(f"Errore nella spiegazione della formazione: {e}", exc_info=True)
+        return None
+
+    # Il salvataggio su file avviene in un thread, fuori dall'event loop
+    await asyncio.to_thread(llm_cache.set, key, explanation)
+    return explanation
+
+
+@timed("compute_lineups")
+def compute_lineups(roster: Dict[str, List[Tuple[str, str]]], scraped_data: "ProcessedData") -> List[Lineup]:
+    """
+    Migliori formazioni della rosa: i punteggi dei giocatori sono le medie della simulazione
+    Monte Carlo, e di ogni formazione si riportano media e varianza dei punti totali.
+    """
+    roster_quotes = get_roster_quotes(roster, scraped_data)
+    simulation = simulate_roster(roster_quotes, scraped_data)
+    lineups = best_lineups(roster_quotes, k=LINEUP_ALTERNATIVES + 1, scores=simulation.player_scores())
+    for lineup in lineups:
+        lineup.score, lineup.variance = simulation.lineup_stats(lineup)
+    return lineups
+
+
+@timed("get_best_lineup")
+async def get_best_lineup(ROSTER: Dict[str, List[Tuple[str, str]]], explain: bool = LINEUP_EXPLANATION):
+    """
+    Calcola la formazione migliore a partire dalle probabilità dei bookmaker.
+    La scelta è deterministica (ottimizzatore locale); l'AI, se abilitata, aggiunge solo una spiegazione.
+    """
+    snapshot = await get_latest_snapshot()
+    if snapshot is None:
+        return "Errore: impossibile recuperare le quote per calcolare la formazione."
+
+    # Simulazione e ottimizzazione nel gruppo di processi, fuori dall'event loop
+    lineups = await process_pool.compute_lineups(snapshot, ROSTER)
+    if not lineups:
+        return "Errore: la rosa non ha abbastanza giocatori per nessun modulo."
+
+    formazione_text = format_lineup(lineups[0])
+
+    if len(lineups) > 1:
+        alternatives = "\n".join(f"{i}. {l.module} ({format_score(l)})" for i, l in enumerate(lineups[1:], start=2))
+        formazione_text += f"\n\n🔁 *Alternative*:\n{alternatives}"
+
+    if explain:
+        explanation = await explain_lineup(lineups[0])
+        if explanation:
+            formazione_text += f"\n\n💬 {explanation}"
+
+    return formazione_text
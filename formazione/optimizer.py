@@ -0,0 +1,132 @@
+import heapq
+import math
+from dataclasses import dataclass, field
+from itertools import combinations, product
+from typing import Any, Dict, List, Optional, Tuple
+
+from quote.config import Config
+
+# Moduli ammessi: numero di difensori, centrocampisti e attaccanti (il portiere è sempre 1)
+MODULES: Dict[str, Tuple[int, int, int]] = {
+    "3-4-3": (3, 4, 3),
+    "3-5-2": (3, 5, 2),
+    "4-3-3": (4, 3, 3),
+    "4-4-2": (4, 4, 2),
+    "4-5-1": (4, 5, 1),
+    "5-3-2": (5, 3, 2),
+    "5-4-1": (5, 4, 1),
+}
+
+# Punteggio di un portiere senza quote (la sua squadra non è nel palinsesto): in fondo alla lista
+UNKNOWN_KEEPER_SCORE = -3.0
+
+
+@dataclass
+class PlayerScore:
+    name: str
+    team: str
+    role: str
+    score: float  # bonus/malus attesi
+
+
+@dataclass
+class Lineup:
+    module: str
+    score: float
+    players: Dict[str, List[PlayerScore]] = field(default_factory=dict)
+    # Varianza dei punti della formazione, se stimata con la simulazione (formazione.simulation)
+    variance: Optional[float] = None
+
+
+def keeper_score(prob_concedes: Optional[float]) -> float:
+    """
+    Bonus/malus attesi di un portiere data la probabilità (in %) di subire almeno un gol.
+    Con un modello di Poisson, P(subire) = 1 - e^(-λ) e i gol subiti attesi sono λ.
+    """
+    if prob_concedes is None:
+        return UNKNOWN_KEEPER_SCORE
+    p = min(max(prob_concedes / 100, 0.0), Config.MAX_PROBABILITY)
+    expected_conceded = -math.log(1 - p)
+    return Config.GOAL_CONCEDED_MALUS * expected_conceded + Config.CLEAN_SHEET_BONUS * (1 - p)
+
+
+def outfield_score(player: Dict[str, Any]) -> float:
+    """
+    Bonus attesi di un giocatore di movimento.
+    Usa `expected_bonus` (calcolato sulle probabilità senza margine) se presente, altrimenti
+    le probabilità (in %) di gol e assist.
+    """
+    if player.get("expected_bonus") is not None:
+        return player["expected_bonus"]
+    return (Config.GOAL_BONUS * (player["prob_goal"] or 0) + Config.ASSIST_BONUS * (player["prob_assist"] or 0)) / 100
+
+
+def score_roster(roster_quotes: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[PlayerScore]]:
+    """Calcola il punteggio atteso di ogni giocatore a partire dall'output di `get_roster_quotes`."""
+    scores: Dict[str, List[PlayerScore]] = {}
+    for role, players in roster_quotes.items():
+        scores[role] = [
+            PlayerScore(
+                name=p["name"],
+                team=p["team"],
+                role=role,
+                score=keeper_score(p["prob_concedes"]) if role == "Por" else outfield_score(p),
+            )
+            for p in players
+        ]
+    return scores
+
+
+def _top_subsets(players: List[PlayerScore], size: int, k: int) -> List[Tuple[float, Tuple[PlayerScore, ...]]]:
+    """
+    Le `k` migliori scelte di `size` giocatori per somma dei punteggi.
+    Le rose hanno al massimo una decina di giocatori per ruolo, quindi l'enumerazione è esatta ed economica.
+    A parità di punteggio vince l'ordine della rosa, così il risultato è deterministico.
+    """
+    if len(players) < size:
+        return []
+    ranked = sorted(players, key=lambda p: -p.score)
+    return heapq.nlargest(
+        k,
+        ((sum(p.score for p in subset), subset) for subset in combinations(ranked, size)),
+        key=lambda item: item[0],
+    )
+
+
+def best_lineups(
+    roster_quotes: Dict[str, List[Dict[str, Any]]],
+    k: int = 3,
+    modules: Optional[List[str]] = None,
+    scores: Optional[Dict[str, List[PlayerScore]]] = None,
+) -> List[Lineup]:
+    """
+    Restituisce le `k` migliori formazioni legali (per bonus attesi) tra i moduli indicati.
+    Con punteggi additivi, le migliori formazioni di un modulo si ottengono combinando le
+    migliori `k` scelte di ogni ruolo, quindi il risultato è esatto.
+    `scores` sostituisce i punteggi calcolati dalle quote (es. le medie della simulazione).
+    """
+    scores = scores if scores is not None else score_roster(roster_quotes)
+    candidates: List[Tuple[float, int, Lineup]] = []
+
+    for module in modules or list(MODULES):
+        n_dif, n_cen, n_att = MODULES[module]
+        per_role = {
+            "Por": _top_subsets(scores.get("Por", []), 1, k),
+            "Dif": _top_subsets(scores.get("Dif", []), n_dif, k),
+            "Cen": _top_subsets(scores.get("Cen", []), n_cen, k),
+            "Att": _top_subsets(scores.get("Att", []), n_att, k),
+        }
+        if not all(per_role.values()):
+            continue  # Rosa insufficiente per questo modulo
+
+        for choice in product(*per_role.values()):
+            total = sum(role_score for role_score, _ in choice)
+            lineup = Lineup(
+                module=module,
+                score=total,
+                players={role: list(subset) for role, (_, subset) in zip(per_role, choice)},
+            )
+            # L'indice progressivo rende stabile l'ordinamento a parità di punteggio
+            candidates.append((total, -len(candidates), lineup))
+
+    return [lineup for _, _, lineup in heapq.nlargest(k, candidates, key=lambda item: item[:2])]
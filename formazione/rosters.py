@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+Roster = Dict[str, List[Tuple[str, str]]]
+
+ROLES = ["Por", "Dif", "Cen", "Att"]
+ROSTERS_PATH = os.getenv("ROSTERS_PATH", "rose.json")
+
+# Es: "Audero (Cremonese)"
+_PLAYER_PATTERN = re.compile(r"^\s*(?P<name>[^()]+?)\s*\((?P<team>[^()]+)\)\s*$")
+
+
+def parse_player(text: str) -> Tuple[str, str]:
+    """Interpreta un giocatore scritto come "Nome (Squadra)". Solleva ValueError se non è valido."""
+    match = _PLAYER_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Giocatore non valido '{text.strip()}'. Formato atteso: Nome (Squadra).")
+    return match["name"], match["team"].strip()
+
+
+def parse_roster(text: str) -> Roster:
+    """
+    Interpreta una rosa scritta come una riga per ruolo:
+
+        Por: Audero (Cremonese), Svilar (Roma)
+        Dif: Mancini (Roma), Pavlovic (Milan)
+        ...
+
+    Solleva ValueError con un messaggio leggibile se il testo non è valido.
+    """
+    roster: Roster = {role: [] for role in ROLES}
+    roles_lookup = {role.lower(): role for role in ROLES}
+
+    for line in text.strip().splitlines():
+        if not line.strip():
+            continue
+        if ":" not in line:
+            raise ValueError(f"Riga non valida (manca il ruolo): '{line.strip()}'")
+
+        role_text, players_text = line.split(":", 1)
+        role = roles_lookup.get(role_text.strip().lower())
+        if role is None:
+            raise ValueError(f"Ruolo sconosciuto '{role_text.strip()}'. Usa: {', '.join(ROLES)}.")
+
+        for player_text in players_text.split(","):
+            if not player_text.strip():
+                continue
+            roster[role].append(parse_player(player_text))
+
+    if not any(roster.values()):
+        raise ValueError("La rosa è vuota.")
+    return roster
+
+
+def format_roster(roster: Roster) -> str:
+    """Formatta una rosa nello stesso formato accettato da `parse_roster`."""
+    return "\n".join(
+        f"{role}: " + ", ".join(f"{name} ({team})" for name, team in roster.get(role, []))
+        for role in ROLES
+    )
+
+
+def roster_key(roster: Roster) -> str:
+    """Impronta della rosa: uguale per rose con gli stessi giocatori, indipendentemente dall'ordine."""
+    normalized = {
+        role: sorted((" ".join(name.lower().split()), " ".join(team.lower().split())) for name, team in roster.get(role, []))
+        for role in ROLES
+    }
+    return hashlib.blake2b(json.dumps(normalized, ensure_ascii=False).encode("utf-8"), digest_size=12).hexdigest()
+
+
+class RosterStore:
+    """Rose dei vari utenti, indicizzate per chat e salvate su un file JSON."""
+
+    def __init__(self, path: str = ROSTERS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._rosters: Dict[int, Roster] = self._load()
+
+    def _load(self) -> Dict[int, Roster]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Impossibile leggere le rose da '{self.path}': {e}")
+            return {}
+
+        return {
+            int(chat_id): {role: [tuple(player) for player in players] for role, players in roster.items()}
+            for chat_id, roster in raw.items()
+        }
+
+    def _save(self) -> None:
+        # Scrittura atomica: un crash a metà non lascia il file corrotto
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({str(chat_id): roster for chat_id, roster in self._rosters.items()}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, chat_id: int) -> Optional[Roster]:
+        return self._rosters.get(chat_id)
+
+    def set(self, chat_id: int, roster: Roster) -> None:
+        with self._lock:
+            self._rosters[chat_id] = roster
+            self._save()
+
+    def all(self) -> Dict[int, Roster]:
+        return dict(self._rosters)
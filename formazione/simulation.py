@@ -0,0 +1,180 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from formazione.optimizer import UNKNOWN_KEEPER_SCORE, Lineup, PlayerScore
+from quote.config import Config, ProcessedData
+from quote.matching import resolve_team
+
+N_SIMULATIONS = 10_000
+# Seme fisso: a parità di quote la simulazione (e quindi la formazione) non cambia tra una richiesta e l'altra
+SIMULATION_SEED = 0
+
+PlayerKey = Tuple[str, str, str]  # (ruolo, nome, squadra)
+
+
+def _rate(prob_percent: Optional[float]) -> float:
+    """Intensità di Poisson λ tale che P(almeno un evento) = prob (in %)."""
+    if not prob_percent:
+        return 0.0
+    p = min(max(prob_percent / 100, 0.0), Config.MAX_PROBABILITY)
+    return float(-np.log1p(-p))
+
+
+def _shares(rates: List[float], total: float) -> np.ndarray:
+    """Quote dei giocatori sul totale della squadra, con in fondo quella del resto della squadra."""
+    shares = np.asarray(rates, dtype=float) / total
+    if shares.sum() > 1:
+        shares /= shares.sum()
+    return np.append(shares, max(0.0, 1.0 - shares.sum()))
+
+
+def _allocate_team_goals(
+    rng: np.random.Generator, team_goals: np.ndarray, team_rate: float, goal_rates: List[float], assist_rates: List[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ripartisce i gol di una squadra tra i giocatori della rosa e il resto della squadra.
+
+    Ogni gol ha un solo marcatore (estrazione multinomiale) e, con probabilità
+    ASSISTED_GOAL_RATIO, un solo assistman diverso dal marcatore. Restituisce gol e assist
+    dei giocatori della rosa (una riga per giocatore, una colonna per giornata simulata).
+    """
+    n_players = len(goal_rates)
+    goal_shares = _shares(goal_rates, team_rate)
+    assist_shares = _shares(assist_rates, team_rate * Config.ASSISTED_GOAL_RATIO)
+
+    scored = rng.multinomial(team_goals, goal_shares)
+    assists = np.zeros((len(team_goals), n_players), dtype=np.int64)
+    for scorer in range(n_players + 1):
+        assisted = rng.binomial(scored[:, scorer], Config.ASSISTED_GOAL_RATIO)
+        if scorer == n_players:
+            # Marcatore fuori dalla rosa: può servire l'assist chiunque
+            shares = assist_shares
+        else:
+            # Il marcatore non può servire l'assist a se stesso: la sua quota va agli altri
+            others = assist_shares[:n_players].copy()
+            others[scorer] = 0.0
+            rest = 1.0 - assist_shares[scorer]
+            others = others / rest if rest > 0 else np.zeros(n_players)
+            shares = np.append(others, max(0.0, 1.0 - others.sum()))
+        assists += rng.multinomial(assisted, shares)[:, :n_players]
+    return scored[:, :n_players].T, assists.T
+
+
+@dataclass
+class SimulationResult:
+    """Punti bonus/malus simulati: una riga per giocatore, una colonna per giornata simulata."""
+    keys: List[PlayerKey]
+    points: np.ndarray
+    index: Dict[PlayerKey, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+    @property
+    def n_simulations(self) -> int:
+        return self.points.shape[1]
+
+    def mean(self, key: PlayerKey) -> float:
+        return float(self.points[self.index[key]].mean())
+
+    def std(self, key: PlayerKey) -> float:
+        return float(self.points[self.index[key]].std())
+
+    def player_scores(self) -> Dict[str, List[PlayerScore]]:
+        """Punteggi attesi nello stesso formato di `optimizer.score_roster`."""
+        means = self.points.mean(axis=1)
+        scores: Dict[str, List[PlayerScore]] = {}
+        for (role, name, team), mean in zip(self.keys, means):
+            scores.setdefault(role, []).append(PlayerScore(name=name, team=team, role=role, score=float(mean)))
+        return scores
+
+    def lineup_stats(self, lineup: Lineup) -> Tuple[float, float]:
+        """
+        Media e varianza dei punti della formazione. La varianza tiene conto delle correlazioni
+        (es. portiere e difensori della stessa squadra, attaccanti della stessa partita).
+        """
+        rows = [self.index[(role, p.name, p.team)] for role, players in lineup.players.items() for p in players]
+        totals = self.points[rows].sum(axis=0)
+        return float(totals.mean()), float(totals.var())
+
+
+def simulate_roster(
+    roster_quotes: Dict[str, List[Dict[str, Any]]],
+    scraped_data: ProcessedData,
+    n_simulations: int = N_SIMULATIONS,
+    seed: int = SIMULATION_SEED,
+) -> SimulationResult:
+    """
+    Simula `n_simulations` giornate per i giocatori della rosa.
+
+    Per ogni partita i gol delle due squadre sono estratti da una Poisson con l'intensità
+    implicita nelle quote "segna casa/ospite"; ogni gol della squadra è poi assegnato a un
+    solo marcatore (e, una frazione ASSISTED_GOAL_RATIO dei gol, a un solo assistman diverso
+    dal marcatore) tra i giocatori della rosa e il resto della squadra, in proporzione alle
+    loro intensità. Così i punti dei giocatori della stessa squadra e della stessa partita
+    sono correlati. I giocatori la cui squadra non è nel palinsesto sono simulati in modo
+    indipendente.
+    """
+    rng = np.random.default_rng(seed)
+    # Gol segnati per (partita, lato), estratti una sola volta e condivisi dai giocatori
+    team_goals: Dict[Tuple[str, str], np.ndarray] = {}
+    team_rates: Dict[Tuple[str, str], float] = {}
+
+    def goals_for(match_quotes, side: str) -> Optional[Tuple[np.ndarray, float]]:
+        stats = match_quotes.goal_stats
+        if not stats:
+            return None
+        key = (match_quotes.match.id, side)
+        if key not in team_goals:
+            # La probabilità che segni la squadra di casa è quella che subisca gol la squadra ospite
+            other = "away" if side == "home" else "home"
+            for s, o in ((side, other), (other, side)):
+                rate = _rate(stats[f"prob_{o}_concedes_goal"])
+                team_rates[(match_quotes.match.id, s)] = rate
+                team_goals[(match_quotes.match.id, s)] = rng.poisson(rate, n_simulations)
+        return team_goals[key], team_rates[key]
+
+    keys: List[PlayerKey] = []
+    rows: List[Optional[np.ndarray]] = []
+    # (partita, lato) -> giocatori della rosa in quella squadra: (riga, intensità gol, intensità assist)
+    team_players: Dict[Tuple[str, str], List[Tuple[int, float, float]]] = {}
+
+    for p in roster_quotes.get("Por", []):
+        keys.append(("Por", p["name"], p["team"]))
+        if p["prob_concedes"] is None:
+            rows.append(np.full(n_simulations, UNKNOWN_KEEPER_SCORE))
+            continue
+        # Gol subiti = gol segnati dall'avversario nella stessa giornata simulata
+        resolved = resolve_team(scraped_data, p["team"])
+        goals = goals_for(resolved[0], "away" if resolved[1] == "home" else "home") if resolved else None
+        conceded = goals[0] if goals else rng.poisson(_rate(p["prob_concedes"]), n_simulations)
+        rows.append(Config.GOAL_CONCEDED_MALUS * conceded + Config.CLEAN_SHEET_BONUS * (conceded == 0))
+
+    for role in ["Dif", "Cen", "Att"]:
+        for p in roster_quotes.get(role, []):
+            keys.append((role, p["name"], p["team"]))
+            goal_rate = _rate(p.get("prob_goal_fair") if p.get("prob_goal_fair") is not None else p["prob_goal"])
+            assist_rate = _rate(p.get("prob_assist_fair") if p.get("prob_assist_fair") is not None else p["prob_assist"])
+
+            resolved = resolve_team(scraped_data, p["team"])
+            goals = goals_for(*resolved) if resolved else None
+            if goals is not None and goals[1] > 0:
+                # Ripartiti più sotto, insieme ai compagni di squadra
+                team_players.setdefault((resolved[0].match.id, resolved[1]), []).append((len(rows), goal_rate, assist_rate))
+                rows.append(None)
+                continue
+            player_goals = rng.poisson(goal_rate, n_simulations)
+            player_assists = rng.poisson(assist_rate, n_simulations)
+            rows.append(Config.GOAL_BONUS * player_goals + Config.ASSIST_BONUS * player_assists)
+
+    for key, players in team_players.items():
+        goals, assists = _allocate_team_goals(
+            rng, team_goals[key], team_rates[key], [goal_rate for _, goal_rate, _ in players], [assist_rate for _, _, assist_rate in players]
+        )
+        for (row, _, _), player_goals, player_assists in zip(players, goals, assists):
+            rows[row] = Config.GOAL_BONUS * player_goals + Config.ASSIST_BONUS * player_assists
+
+    points = np.vstack(rows).astype(float) if rows else np.zeros((0, n_simulations))
+    return SimulationResult(keys=keys, points=points)
@@ -1,25 +1,46 @@
 import os
 import asyncio
-from fastapi import FastAPI, Request
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
-from dotenv import load_dotenv
-from formazione.model import get_best_lineup
 import logging
+import signal
+from typing import Optional
 
-from quote.model import run_scraper_for_roster, format_roster_quotes_for_telegram
-
-# Configura il logging di base per vedere più informazioni
+# Unica configurazione del logging dell'applicazione, prima di importare gli altri moduli
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
     level=logging.INFO
 )
 
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import Application, ApplicationBuilder, CallbackQueryHandler, CommandHandler, ContextTypes
+from dotenv import load_dotenv
+from formazione.model import LINEUP_EXPLANATION, close_http_clients, get_best_lineup, open_http_clients
+from formazione.rosters import RosterStore, parse_player, parse_roster, format_roster, roster_key
+
+from quote.model import get_latest_snapshot, format_stale_notice, render_roster_quotes
+from quote.render import RenderedQuotes, quotes_renderer
+from workers import process_pool
+from quote.client import close_scraper_client
+from quote.store import close_odds_store, get_odds_store
+from quote.identity import close_player_registry, get_player_registry
+from quote.cache import snapshot_cache
+from scheduler import SCHEDULER_ENABLED, refresh_scheduler
+from metrics import PROFILER_ENABLED, profiler, registry
+from update_queue import UpdateQueue
+from coalescing import request_coalescer
+from alerts import ALERT_THRESHOLD, AlertManager
+
 load_dotenv()
 
 RENDER_URL = "fanta-formazione.onrender.com"
 WEBHOOK_URL = f"https://{RENDER_URL}/webhook"
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+# Se impostato, Telegram lo invia in ogni richiesta al webhook e le richieste senza vengono rifiutate
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Chat che possono modificare gli alias con /alias (separate da virgole): l'anagrafica è condivisa da tutte le chat
+ALIAS_ADMIN_CHAT_IDS = {int(chat_id) for chat_id in os.getenv("ALIAS_ADMIN_CHAT_IDS", "").split(",") if chat_id.strip()}
 print(f"--- TOKEN LETTO: {'Sì, è presente' if TELEGRAM_TOKEN else 'NO, MANCANTE!'} ---") # CONTROLLO 1
 
 if not TELEGRAM_TOKEN:
@@ -44,63 +65,322 @@ ROSTER = {
     ],
 }
 
+# Rose dei singoli utenti (per chat); chi non ha ancora impostato la propria usa ROSTER
+roster_store = RosterStore()
+
+def get_chat_roster(chat_id: int):
+    return roster_store.get(chat_id) or ROSTER
+
+# Avvisi push sulle variazioni delle quote: lo scheduler li calcola a ogni aggiornamento,
+# e aggiorna le quote più spesso vicino alle partite se qualche chat è iscritta
+alert_manager = AlertManager(get_chat_roster)
+refresh_scheduler.add_listener(alert_manager.on_snapshot, streaming=alert_manager.has_subscribers)
+
 # Setup FastAPI
 app = FastAPI()
 
-# Setup Telegram Bot (variabile globale per gestirla negli eventi)
-telegram_app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+# Setup Telegram Bot (variabile globale per gestirla negli eventi).
+# Viene costruito all'avvio, in background: la costruzione crea i client HTTPS ed è lenta
+telegram_app: Optional[Application] = None
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Ciao! Usa /formazione per generare la tua squadra.")
+    await update.message.reply_text(
+        "Ciao! Usa /rosa per impostare la tua rosa, /formazione per generare la tua squadra, "
+        "/quote per vedere le probabilità dei tuoi giocatori e /avvisi per ricevere le variazioni delle quote."
+    )
+
+async def rosa_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    # Il testo dopo il comando, su più righe: una per ruolo
+    parts = update.message.text.split(maxsplit=1)
+    roster_text = parts[1] if len(parts) > 1 else ""
+
+    if not roster_text.strip():
+        current = roster_store.get(chat_id)
+        header = "📋 La tua rosa:" if current else "📋 Non hai ancora impostato una rosa, uso quella predefinita:"
+        await update.message.reply_text(
+            f"{header}\n{format_roster(get_chat_roster(chat_id))}\n\n"
+            "Per cambiarla invia /rosa seguito da una riga per ruolo, ad esempio:\n"
+            "/rosa\nPor: Svilar (Roma), Audero (Cremonese)\nDif: Mancini (Roma), Pavlovic (Milan)\n..."
+        )
+        return
+
+    try:
+        roster = parse_roster(roster_text)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    # Scrittura del file JSON in un thread, per non bloccare l'event loop
+    await asyncio.to_thread(roster_store.set, chat_id, roster)
+    n_players = sum(len(players) for players in roster.values())
+    await update.message.reply_text(f"✅ Rosa salvata ({n_players} giocatori).")
+
+async def avvisi_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    arg = context.args[0].lower() if context.args else ""
+
+    if arg == "off":
+        await alert_manager.unsubscribe(chat_id)
+        await update.message.reply_text("🔕 Avvisi disattivati.")
+        return
+
+    threshold = alert_manager.store.get(chat_id)
+    if not arg and threshold is not None:
+        await update.message.reply_text(
+            f"🔔 Avvisi attivi: ti scrivo quando la probabilità di un tuo giocatore cambia di almeno {threshold:g} punti.\n"
+            "Usa /avvisi <soglia> per cambiarla o /avvisi off per disattivarli."
+        )
+        return
+
+    try:
+        threshold = float(arg.replace(",", ".")) if arg else ALERT_THRESHOLD
+    except ValueError:
+        threshold = 0
+    if threshold <= 0:
+        await update.message.reply_text("❌ Soglia non valida: indica i punti percentuali, ad esempio /avvisi 5.")
+        return
+
+    await alert_manager.subscribe(chat_id, threshold)
+    if not SCHEDULER_ENABLED:
+        logging.warning("Avvisi richiesti ma lo scheduler è disattivato: non verranno inviati.")
+    await update.message.reply_text(
+        f"🔔 Avvisi attivati: ti scrivo quando la probabilità di un tuo giocatore cambia di almeno {threshold:g} punti."
+    )
+
+async def alias_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mostra o corregge il nome usato da Sisal per un giocatore: /alias Nome (Squadra) [= NOME SISAL | = auto]."""
+    parts = update.message.text.split(maxsplit=1)
+    player_text, _, alias = (parts[1] if len(parts) > 1 else "").partition("=")
+    try:
+        name, team = parse_player(player_text)
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ {e}\n\nUso: /alias Nome (Squadra) = NOME SISAL, ad esempio /alias Pezzella Giu. (Parma) = PEZZELLA GIUSEPPE.\n"
+            "Con = auto si torna all'abbinamento automatico."
+        )
+        return
+
+    registry = get_player_registry()
+    alias = alias.strip()
+    if not alias:
+        # Gli abbinamenti possono essere stati imparati nei worker: prima si ricarica l'anagrafica
+        await asyncio.to_thread(registry.sync)
+        known = registry.lookup(name, team)
+        if known is None:
+            await update.message.reply_text(f"ℹ️ {name} ({team}) non è ancora abbinato a un nome Sisal.")
+        else:
+            origin = "impostato a mano" if known.manual else f"abbinamento automatico, similarità {known.score}"
+            await update.message.reply_text(f"ℹ️ {name} ({team}) → {known.alias} ({origin}).")
+        return
+
+    if update.effective_chat.id not in ALIAS_ADMIN_CHAT_IDS:
+        await update.message.reply_text("⛔ Solo gli amministratori possono modificare gli abbinamenti: valgono per tutte le chat.")
+        return
+
+    if alias.lower() == "auto":
+        await asyncio.to_thread(registry.reset, name, team)
+        reply = f"🔄 {name} ({team}) verrà abbinato di nuovo automaticamente."
+    else:
+        # Si usa la grafia di Sisal se il nome è tra le quote attuali
+        snapshot = await get_latest_snapshot()
+        quoted = {p.player_name.lower(): p.player_name for p in snapshot.data.scorers + snapshot.data.assists} if snapshot else {}
+        alias = quoted.get(alias.lower(), alias)
+        await asyncio.to_thread(registry.set_alias, name, team, alias)
+        reply = f"✅ {name} ({team}) → {alias}."
+        if snapshot and alias.lower() not in quoted:
+            reply += "\n⚠️ Il nome non compare tra le quote attuali: controlla che sia scritto come su Sisal."
+    # I messaggi delle quote già renderizzati usano l'abbinamento precedente
+    quotes_renderer.clear()
+    await update.message.reply_text(reply)
 
 async def formazione_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = await update.message.reply_text("🤔 Sto analizzando la rosa...")
-    lineup_text = await get_best_lineup(ROSTER)
+    roster = get_chat_roster(update.effective_chat.id)
+    # Richieste identiche in corso (stessa rosa, stesse quote) condividono il calcolo
+    snapshot = await get_latest_snapshot()
+    key = ("formazione", roster_key(roster), snapshot.version if snapshot else None, LINEUP_EXPLANATION)
+    lineup_text = await request_coalescer.run(key, lambda: get_best_lineup(roster), label="formazione")
+    notice = format_stale_notice(snapshot) if snapshot else ""
     await context.bot.edit_message_text(
         chat_id=update.effective_chat.id,
         message_id=msg.message_id,
-        text=f"📋 *Formazione Consigliata:*\n{lineup_text}",
+        text=f"{notice}📋 *Formazione Consigliata:*\n{lineup_text}",
         parse_mode="Markdown"
     )
 
+def quote_page_markup(rendered: RenderedQuotes, page: int) -> Optional[InlineKeyboardMarkup]:
+    """Pulsanti per scorrere le pagine del messaggio delle quote (nessuno se c'è una sola pagina)."""
+    total = len(rendered.pages)
+    if total < 2:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(f"◀️ {page}/{total}", callback_data=f"quote:{rendered.token}:{page - 1}"))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton(f"{page + 2}/{total} ▶️", callback_data=f"quote:{rendered.token}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
 async def quote_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = await update.message.reply_text("⏳ Recupero le quote…")
-    roster_quotes = await asyncio.to_thread(run_scraper_for_roster, ROSTER)
-    final_text = format_roster_quotes_for_telegram(roster_quotes)
+    roster = get_chat_roster(update.effective_chat.id)
+    snapshot = await get_latest_snapshot()
+    markup = None
+    if snapshot is None:
+        final_text = "❌ Impossibile recuperare le quote in questo momento. Riprova più tardi."
+    else:
+        # Rendering in cache per (istantanea, rosa) e condiviso dalle richieste identiche in corso
+        roster_hash = roster_key(roster)
+        rendered = await request_coalescer.run(
+            ("quote", roster_hash, snapshot.version), lambda: render_roster_quotes(roster, roster_hash, snapshot), label="quote"
+        )
+        # Se Sisal non risponde serviamo le ultime quote valide, segnalandolo
+        final_text = format_stale_notice(snapshot) + rendered.pages[0]
+        markup = quote_page_markup(rendered, 0)
     await context.bot.edit_message_text(
         chat_id=update.effective_chat.id,
         message_id=msg.message_id,
         text=final_text,
-        parse_mode="Markdown"
+        parse_mode="Markdown",
+        reply_markup=markup,
     )
 
-telegram_app.add_handler(CommandHandler("start", start_command))
-telegram_app.add_handler(CommandHandler("formazione", formazione_command))
-telegram_app.add_handler(CommandHandler("quote", quote_command))
+async def quote_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Cambio pagina del messaggio delle quote: la pagina è già pronta in cache."""
+    query = update.callback_query
+    _, token, page_text = query.data.split(":", 2)
+    rendered = quotes_renderer.get(token)
+    page = int(page_text) if page_text.isdigit() else -1
+    if rendered is None or not 0 <= page < len(rendered.pages):
+        await query.answer("Le quote sono state aggiornate: usa di nuovo /quote.")
+        return
+    await query.answer()
+    # Anche le pagine successive segnalano se le quote sono vecchie
+    snapshot = snapshot_cache.find_version(rendered.version)
+    notice = format_stale_notice(snapshot) if snapshot else ""
+    await query.edit_message_text(text=notice + rendered.pages[page], parse_mode="Markdown", reply_markup=quote_page_markup(rendered, page))
+
+def build_telegram_app() -> Application:
+    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("formazione", formazione_command))
+    application.add_handler(CommandHandler("quote", quote_command))
+    application.add_handler(CommandHandler("rosa", rosa_command))
+    application.add_handler(CommandHandler("avvisi", avvisi_command))
+    application.add_handler(CommandHandler("alias", alias_command))
+    application.add_handler(CallbackQueryHandler(quote_page_callback, pattern=r"^quote:"))
+    return application
+
+async def process_update(data):
+    await telegram_app.process_update(Update.de_json(data, telegram_app.bot))
+
+# Gli update ricevuti dal webhook vengono elaborati in background da un gruppo di worker
+update_queue = UpdateQueue(process_update)
 
 # ----- FASTAPI ENDPOINTS -----
 
+# Avvio del bot in background: /health risponde subito, anche mentre il bot si inizializza
+_bot_startup: Optional[asyncio.Task] = None
+# Tentativi di avvio del bot, con attesa crescente; poi il processo termina e viene riavviato
+BOT_STARTUP_ATTEMPTS = 5
+BOT_STARTUP_BACKOFF = 2  # secondi prima del secondo tentativo (raddoppia a ogni tentativo)
+BOT_STARTUP_MAX_BACKOFF = 60
+
+
+def bot_ready() -> bool:
+    """True se l'avvio del bot è terminato con successo."""
+    return _bot_startup is not None and _bot_startup.done() and not _bot_startup.cancelled() and _bot_startup.result()
+
+
+async def _start_bot_once():
+    global telegram_app
+    if telegram_app is None:
+        # In un thread, per non bloccare l'event loop (e /health) durante la costruzione
+        telegram_app = await asyncio.to_thread(build_telegram_app)
+    await telegram_app.initialize()  # non fa nulla se già inizializzato
+    if not telegram_app.running:
+        await telegram_app.start()
+    # Gli update ricevuti nel frattempo sono già in coda: i worker partono a bot pronto
+    update_queue.start()
+    alert_manager.start(lambda chat_id, text: telegram_app.bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown"))
+    await telegram_app.bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+
+
+async def start_bot() -> bool:
+    logging.info("Imposto webhook su Telegram…")
+    delay = BOT_STARTUP_BACKOFF
+    for attempt in range(1, BOT_STARTUP_ATTEMPTS + 1):
+        try:
+            await _start_bot_once()
+            logging.info("Bot pronto.")
+            return True
+        except Exception as e:
+            if attempt == BOT_STARTUP_ATTEMPTS:
+                # Come prima dell'avvio in background: senza bot il processo non deve restare su
+                logging.critical(f"Avvio del bot fallito dopo {attempt} tentativi: {e}. Termino il processo.", exc_info=True)
+                os.kill(os.getpid(), signal.SIGTERM)
+                return False
+            logging.error(f"Errore durante l'avvio del bot (tentativo {attempt}/{BOT_STARTUP_ATTEMPTS}): {e}. Riprovo tra {delay}s.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BOT_STARTUP_MAX_BACKOFF)
+    return False
+
+
 @app.on_event("startup")
 async def startup():
-    logging.info("Imposto webhook su Telegram…")
-    await telegram_app.initialize()
-    await telegram_app.start()
-    await telegram_app.bot.set_webhook(WEBHOOK_URL)
+    global _bot_startup
+    open_http_clients()
+    # Lo storico quote si apre in un thread: creazione dello schema e lettura delle ultime quote
+    await asyncio.to_thread(get_odds_store)
+    # Anagrafica dei giocatori in memoria prima delle prime richieste
+    await asyncio.to_thread(get_player_registry)
+    # Processi per il lavoro CPU: partono subito, in parallelo all'avvio del bot
+    process_pool.start()
+    _bot_startup = asyncio.create_task(start_bot())
+    if SCHEDULER_ENABLED:
+        refresh_scheduler.start()
+    if PROFILER_ENABLED:
+        # Avviato qui, quindi campiona il thread dell'event loop
+        profiler.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
     logging.info("Rimuovo webhook e chiudo bot…")
-    await telegram_app.bot.delete_webhook()
-    await telegram_app.stop()
-    await telegram_app.shutdown()
+    await refresh_scheduler.stop()
+    await alert_manager.stop()
+    profiler.stop()
+    if _bot_startup is not None and not _bot_startup.done():
+        _bot_startup.cancel()
+    if telegram_app is not None and telegram_app.running:
+        await telegram_app.bot.delete_webhook()
+        await update_queue.stop()
+        await telegram_app.stop()
+    if telegram_app is not None:
+        await telegram_app.shutdown()
+    await close_scraper_client()
+    await close_http_clients()
+    await process_pool.stop()
+    await asyncio.to_thread(close_odds_store)
+    await asyncio.to_thread(close_player_registry)
 
 
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
-    data = await request.json()
-    update = Update.de_json(data, telegram_app.bot)
-    await telegram_app.process_update(update)
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return Response(status_code=403)
+    try:
+        data = await request.json()
+    except ValueError as e:
+        logging.warning(f"Update non valido ricevuto sul webhook: {e}")
+        return Response(status_code=400)
+    if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+        return Response(status_code=400)
+
+    # Risponde subito: il comando viene eseguito da un worker. Con la coda piena
+    # rispondiamo 503 e Telegram reinvia l'update più tardi.
+    if not update_queue.submit(data):
+        return Response(status_code=503)
     return {"ok": True}
 
 logging.info("!!! Rotta /webhook registrata correttamente. !!!")
@@ -109,13 +389,48 @@ logging.info("!!! Rotta /webhook registrata correttamente. !!!")
 def health_check():
     """
     Endpoint leggero per il keep-alive. 
-    Risponde immediatamente senza fare nulla.
+    Risponde immediatamente senza fare nulla, anche mentre il bot si sta ancora avviando
+    ("starting"); per sapere se il bot è pronto c'è /ready.
     """
     logging.info("Health check ping ricevuto.") # Utile per vedere nei log che UptimeRobot sta funzionando
+    if not bot_ready():
+        return {"status": "starting"}
     return {"status": "I'm alive!"}
 
+@app.api_route("/ready", methods=["GET", "HEAD"])
+def readiness_check():
+    """Prontezza del bot: 503 finché l'avvio non è terminato con successo."""
+    if not bot_ready():
+        return JSONResponse({"ready": False}, status_code=503)
+    return {"ready": True}
+
 logging.info("!!! Rotta /health registrata correttamente. !!!")
 
+SNAPSHOT_AGE = registry.gauge("fanta_snapshot_age_seconds", "Età dell'istantanea delle quote in cache.")
+
+@app.get("/metrics")
+def metrics():
+    """Metriche in formato Prometheus (tempi delle fasi, richieste allo scraper, ...)."""
+    snapshot = snapshot_cache.latest()
+    if snapshot is not None:
+        SNAPSHOT_AGE.set(snapshot.age)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profile")
+def profile(request: Request, reset: bool = False):
+    """
+    Stack più frequenti del profiler a campionamento (formato collapsed), se attivo (PROFILER_ENABLED=1).
+    Gli stack rivelano il codice: serve l'intestazione X-Profile-Token uguale a WEBHOOK_SECRET.
+    """
+    if not WEBHOOK_SECRET or request.headers.get("X-Profile-Token") != WEBHOOK_SECRET:
+        return Response(status_code=403)
+    if not profiler.running:
+        return PlainTextResponse("Profiler non attivo: avvia l'applicazione con PROFILER_ENABLED=1.\n", status_code=404)
+    text = profiler.collapsed()
+    if reset:
+        profiler.reset()
+    return PlainTextResponse(text)
+
 @app.get("/")
 def home():
     return {"status": "online"}
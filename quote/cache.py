@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from quote.config import Config, ProcessedData
+
+
+def fingerprint(data: ProcessedData) -> str:
+    """Impronta del contenuto delle quote: cambia solo se cambia almeno una quota."""
+    digest = hashlib.blake2b(digest_size=16)
+    for quotes in (data.scorers, data.assists):
+        for p in quotes:
+            digest.update(f"{p.match_id}|{p.player_name}|{p.quote};".encode())
+        digest.update(b"#")
+    for stats in data.team_goal_stats:
+        digest.update(f"{stats['match_id']}|{stats['prob_home_concedes_goal']}|{stats['prob_away_concedes_goal']};".encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class Snapshot:
+    """Istantanea delle quote scaricate per un certo codice palinsesto."""
+    codice_palinsesto: str
+    data: ProcessedData
+    fetched_at: float = field(default_factory=time.monotonic)
+    # Istante dello scraping in secondi dall'epoch, da mostrare agli utenti
+    scraped_at: float = field(default_factory=time.time)
+    # Versione del contenuto (vedi `fingerprint`)
+    version: str = ""
+
+    @property
+    def age(self) -> float:
+        """Secondi trascorsi dallo scraping."""
+        return time.monotonic() - self.fetched_at
+
+
+# Funzione asincrona che esegue lo scraping e restituisce (codice_palinsesto, dati) oppure None
+SnapshotLoader = Callable[[], Awaitable[Optional[Tuple[str, ProcessedData]]]]
+
+
+class SnapshotCache:
+    """
+    Cache condivisa a livello di processo per i dati delle quote.
+
+    - Le istantanee sono indicizzate per codice palinsesto.
+    - Entro `ttl` secondi l'ultima istantanea viene restituita senza contattare Sisal.
+    - Tra `ttl` e `ttl + stale_ttl` viene restituita subito l'istantanea scaduta e
+      l'aggiornamento parte in background (stale-while-revalidate).
+    - Chiamanti concorrenti condividono un unico scraping in corso (single-flight).
+    - Se lo scraping fallisce o supera `wait_timeout` secondi viene restituita l'ultima
+      istantanea valida, anche se vecchia (modalità degradata, vedi `is_stale`).
+    """
+
+    def __init__(
+        self,
+        ttl: float = Config.SNAPSHOT_TTL,
+        stale_ttl: float = Config.SNAPSHOT_STALE_TTL,
+        max_entries: int = Config.SNAPSHOT_MAX_ENTRIES,
+        wait_timeout: float = Config.SNAPSHOT_WAIT_TIMEOUT,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._entries: Dict[str, Snapshot] = {}
+        self._latest: Optional[str] = None
+        self._inflight: Optional[asyncio.Task] = None
+
+    def get(self, codice_palinsesto: str) -> Optional[Snapshot]:
+        """Restituisce l'istantanea per un codice palinsesto, se presente."""
+        return self._entries.get(codice_palinsesto)
+
+    def latest(self) -> Optional[Snapshot]:
+        """Restituisce l'istantanea più recente, anche se scaduta."""
+        return self._entries.get(self._latest) if self._latest else None
+
+    def last_good(self) -> Optional[Snapshot]:
+        """Ultima istantanea scaricata con successo, anche se invalidata."""
+        return next(reversed(self._entries.values()), None)
+
+    def find_version(self, version: str) -> Optional[Snapshot]:
+        """Istantanea con la versione indicata, se ancora in cache."""
+        return next((snapshot for snapshot in self._entries.values() if snapshot.version == version), None)
+
+    def is_stale(self, snapshot: Snapshot) -> bool:
+        """
+        True se l'ultimo scraping riuscito è più vecchio di `ttl + stale_ttl` (modalità degradata).
+        Gli scraping falliti non creano istantanee, quindi l'età è quella dell'ultimo riuscito.
+        `ttl` è quello corrente: lo scheduler lo allunga tra un aggiornamento e l'altro e lo
+        riporta a `Config.SNAPSHOT_TTL` se un aggiornamento fallisce.
+        """
+        return snapshot.age >= self.ttl + self.stale_ttl
+
+    def invalidate(self) -> None:
+        """Marca l'istantanea corrente come da aggiornare alla prossima richiesta."""
+        self._latest = None
+
+    async def get_or_load(self, loader: SnapshotLoader) -> Optional[Snapshot]:
+        """Restituisce un'istantanea valida, eseguendo lo scraping solo se necessario."""
+        snapshot = self.latest()
+        if snapshot is not None:
+            if snapshot.age < self.ttl:
+                return snapshot
+            if snapshot.age < self.ttl + self.stale_ttl:
+                logging.info(f"Quote scadute da {snapshot.age - self.ttl:.0f}s: le servo e aggiorno in background.")
+                self._refresh(loader)
+                return snapshot
+
+        # Nessun dato utilizzabile: aspettiamo lo scraping (condiviso con gli altri chiamanti),
+        # ma al più `wait_timeout` secondi. `shield` evita che la cancellazione di un chiamante
+        # (o il timeout) interrompa lo scraping, che prosegue in background.
+        try:
+            fresh = await asyncio.wait_for(asyncio.shield(self._refresh(loader)), self.wait_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Scraping in corso da oltre {self.wait_timeout:.0f}s: non lo aspetto.")
+            fresh = None
+        if fresh is not None:
+            return fresh
+
+        fallback = self.last_good()
+        if fallback is not None:
+            logging.warning(f"Quote non aggiornate: servo l'ultima istantanea valida ({fallback.age:.0f}s fa).")
+        return fallback
+
+    async def refresh(self, loader: SnapshotLoader) -> Optional[Snapshot]:
+        """Forza l'aggiornamento (o si unisce a quello in corso) e restituisce la nuova istantanea."""
+        return await asyncio.shield(self._refresh(loader))
+
+    def _refresh(self, loader: SnapshotLoader) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._load(loader))
+        return self._inflight
+
+    async def _load(self, loader: SnapshotLoader) -> Optional[Snapshot]:
+        try:
+            result = await loader()
+        except Exception as e:
+            logging.error(f"Errore durante l'aggiornamento delle quote: {e}", exc_info=True)
+            result = None
+
+        if result is None:
+            return None
+
+        codice_palinsesto, data = result
+        snapshot = Snapshot(codice_palinsesto, data, version=fingerprint(data))
+        # Reinseriamo la chiave in coda per mantenere l'ordine di inserimento come ordine di età
+        self._entries.pop(codice_palinsesto, None)
+        self._entries[codice_palinsesto] = snapshot
+        self._latest = codice_palinsesto
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+        logging.info(f"Istantanea quote aggiornata (palinsesto {codice_palinsesto}).")
+        return snapshot
+
+
+# Cache condivisa da tutti i comandi del bot
+snapshot_cache = SnapshotCache()
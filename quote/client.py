@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import random
+from typing import Any, Dict, Optional
+
+import httpx
+
+from metrics import registry
+from quote.config import Config
+from quote.resilience import CircuitBreaker, CircuitOpenError, TokenBucket
+
+HTTP_REQUESTS = registry.counter("fanta_scraper_requests_total", "Richieste HTTP dello scraper, per esito.")
+
+
+class ScraperClient:
+    """
+    Client HTTP asincrono per lo scraping.
+    Mantiene un pool di connessioni keep-alive, limita le richieste parallele con un
+    semaforo e la frequenza con un token bucket, ripete le richieste fallite con un
+    backoff esponenziale e smette di contattare un host che continua a fallire (circuit breaker).
+    """
+
+    def __init__(self, max_concurrency: int = Config.MAX_WORKERS):
+        self.http = httpx.AsyncClient(
+            headers=Config.HEADERS,
+            timeout=httpx.Timeout(Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            follow_redirects=True,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rate_limiter = TokenBucket(Config.RATE_LIMIT, Config.RATE_LIMIT_BURST)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def is_closed(self) -> bool:
+        return self.http.is_closed
+
+    async def get_json(self, url: str) -> Any:
+        """
+        Esegue una GET e restituisce il JSON decodificato.
+        Solleva `httpx.HTTPError` se tutti i tentativi falliscono.
+        """
+        return json.loads(await self.get_bytes(url))
+
+    async def get_bytes(self, url: str) -> bytes:
+        """
+        Esegue una GET e restituisce il corpo grezzo della risposta.
+        Solleva `httpx.HTTPError` se tutti i tentativi falliscono.
+        """
+        return (await self._get(url)).content
+
+    async def get_conditional(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> httpx.Response:
+        """
+        GET condizionale: con `etag`/`last_modified` della risposta precedente il server
+        può rispondere 304 (Not Modified) senza corpo.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return await self._get(url, headers)
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """Circuit breaker dell'host dell'URL."""
+        host = httpx.URL(url).host
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(host, Config.CIRCUIT_FAILURE_THRESHOLD, Config.CIRCUIT_RESET_TIMEOUT)
+        return self._breakers[host]
+
+    async def _get(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        breaker = self.breaker(url)
+        for attempt in range(Config.HTTP_RETRIES + 1):
+            if not breaker.allow():
+                HTTP_REQUESTS.inc(status="circuit_open")
+                raise CircuitOpenError(f"Circuit breaker aperto per {breaker.name}: richiesta non eseguita ({url})")
+            await self._rate_limiter.acquire()
+            try:
+                async with self._semaphore:
+                    response = await self.http.get(url, headers=headers)
+                HTTP_REQUESTS.inc(status=str(response.status_code))
+                if response.status_code != 304:
+                    response.raise_for_status()
+                breaker.record_success()
+                return response
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if isinstance(e, httpx.TransportError):
+                    HTTP_REQUESTS.inc(status="error")
+                # Un 404 o un 400 indicano comunque che l'host risponde
+                if _is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not _is_retryable(e) or attempt == Config.HTTP_RETRIES:
+                    raise
+                delay = Config.HTTP_BACKOFF * (2 ** attempt) * (1 + random.random())
+                logging.warning(f"Richiesta fallita ({e!r}), nuovo tentativo tra {delay:.2f}s: {url}")
+                await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+    async def __aenter__(self) -> "ScraperClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+
+def _is_retryable(error: httpx.HTTPError) -> bool:
+    """Ripete errori di rete, timeout, rate limiting ed errori 5xx."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return True
+
+
+# --- Client condiviso per tutta la vita del processo ---
+
+_shared_client: Optional[ScraperClient] = None
+
+
+def get_scraper_client() -> ScraperClient:
+    """Restituisce il client condiviso, creandolo al primo utilizzo."""
+    global _shared_client
+    if _shared_client is None or _shared_client.is_closed:
+        _shared_client = ScraperClient()
+    return _shared_client
+
+
+async def close_scraper_client() -> None:
+    """Chiude il client condiviso (da chiamare allo shutdown dell'applicazione)."""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
@@ -1,5 +1,6 @@
+import os
 from dataclasses import dataclass, field
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
 
 class Config:
@@ -16,12 +17,50 @@ class Config:
 
     # Impostazioni per le richieste HTTP
     HTTP_TIMEOUT = 10  # secondi
+    HTTP_CONNECT_TIMEOUT = 5  # secondi
+    HTTP_RETRIES = 2  # tentativi aggiuntivi per errori di rete, 429 e 5xx
+    HTTP_BACKOFF = 0.5  # secondi di attesa base prima di un nuovo tentativo (raddoppia a ogni tentativo)
     HEADERS = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
-    MAX_WORKERS = 10 # Numero di thread paralleli per lo scraping
+    MAX_WORKERS = 10 # Numero massimo di richieste parallele per lo scraping
+    MAX_FAILED_MATCHES_RATIO = 0.5  # oltre questa frazione di partite non scaricate lo scraping è considerato fallito
+    # Bookmaker da cui scaricare le quote (il primo è il riferimento per partite e nomi)
+    QUOTE_PROVIDERS = [name.strip() for name in os.getenv("QUOTE_PROVIDERS", "sisal").split(",") if name.strip()]
+    PROVIDER_DEADLINE = 12  # secondi entro cui i bookmaker oltre al primo devono rispondere (il primo viene sempre atteso)
+    RATE_LIMIT = 10  # richieste al secondo verso Sisal (token bucket)
+    RATE_LIMIT_BURST = 20  # richieste consentite di fila prima che intervenga il rate limiter
+    CIRCUIT_FAILURE_THRESHOLD = 5  # errori consecutivi (rete, 429, 5xx) che aprono il circuit breaker
+    CIRCUIT_RESET_TIMEOUT = 60  # secondi di pausa prima di riprovare un host che non risponde
     SIMILARITY_THRESHOLD = 70  # Soglia di similarità per il matching dei nomi dei giocatori
 
+    # Modello probabilistico e bonus/malus del fantacalcio classico
+    MAX_PROBABILITY = 0.99  # limite alle probabilità per evitare intensità infinite
+    ASSISTED_GOAL_RATIO = 0.75  # frazione dei gol che hanno un assist
+    # Margine tipico del mercato "segna casa/ospite" (somma delle probabilità di SI e NO): i bookmaker
+    # espongono solo il SI, quindi nella fusione il margine si toglie dividendo per questo valore
+    TEAM_SCORES_OVERROUND = 1.06
+    GOAL_BONUS = 3.0
+    ASSIST_BONUS = 1.0
+    GOAL_CONCEDED_MALUS = -1.0
+    CLEAN_SHEET_BONUS = 1.0
+
+    # Cache delle quote scaricate
+    SNAPSHOT_TTL = 300  # secondi in cui le quote sono considerate fresche
+    SNAPSHOT_STALE_TTL = 1800  # secondi oltre il TTL in cui servire le quote scadute mentre si aggiornano
+    SNAPSHOT_MAX_ENTRIES = 4  # numero massimo di palinsesti tenuti in memoria
+    SNAPSHOT_TIMEZONE = "Europe/Rome"  # fuso orario con cui mostrare l'ora dello scraping
+    SNAPSHOT_WAIT_TIMEOUT = 15  # secondi massimi di attesa dello scraping prima di servire l'ultima istantanea valida
+
+    # Storico delle quote (SQLite)
+    ODDS_DB_PATH = os.getenv("ODDS_DB_PATH", "quote_storico.db")
+    STORE_BATCH_SIZE = 20  # istantanee scritte al massimo in una transazione
+    STORE_FLUSH_INTERVAL = 2  # secondi di attesa per raccogliere altre istantanee nello stesso blocco
+
+    # Anagrafica dei giocatori: nomi della rosa -> nomi dei bookmaker (SQLite)
+    IDENTITY_DB_PATH = os.getenv("IDENTITY_DB_PATH", "giocatori.db")
+    IDENTITY_MIN_SCORE = 90  # similarità minima perché un abbinamento fuzzy venga salvato nell'anagrafica
+
 # --- 2. Strutture Dati (Dataclasses) ---
 
 @dataclass
@@ -31,20 +70,45 @@ class Match:
     home_team: str
     away_team: str
 
-@dataclass
+@dataclass(slots=True)
 class PlayerQuote:
     player_name: str
     quote: float
+    match_id: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class MatchGoalQuotes:
     match_id: str
     home_team_scores_quote: float
     away_team_scores_quote: float
 
+@dataclass
+class MatchQuotes:
+    """
+    Quote di una singola partita.
+    Sisal non indica la squadra dei giocatori nei mercati marcatore/assist, quindi
+    la tabella più fine disponibile è quella per partita (entrambe le squadre).
+    """
+    match: Match
+    scorers: List[PlayerQuote] = field(default_factory=list)
+    assists: List[PlayerQuote] = field(default_factory=list)
+    goal_stats: Optional[dict] = None
+    # Quote già senza margine (consenso tra bookmaker): la tabella non le ripulisce una seconda volta
+    fair: bool = False
+    # Indici dei nomi (marcatori, assist) della sola partita, costruiti al primo matching
+    name_indexes: Optional[Tuple[Any, Any]] = field(default=None, repr=False, compare=False)
+
 @dataclass
 class ProcessedData:
     """Contenitore per tutti i dati finali elaborati."""
     scorers: List[PlayerQuote] = field(default_factory=list)
     assists: List[PlayerQuote] = field(default_factory=list)
-    team_goal_stats: List[dict] = field(default_factory=list)
\ No newline at end of file
+    team_goal_stats: List[dict] = field(default_factory=list)
+    # Quote per partita, indicizzate per match_id
+    match_quotes: Dict[str, MatchQuotes] = field(default_factory=dict)
+    # Nome squadra normalizzato -> (match_id, "home"/"away"); None se la squadra non gioca
+    team_index: Dict[str, Optional[Tuple[str, str]]] = field(default_factory=dict)
+    # Indici dei nomi (marcatori, assist), costruiti al primo matching e riusati per tutta la vita dell'istantanea
+    name_indexes: Optional[Tuple[Any, Any]] = field(default=None, repr=False, compare=False)
+    # Rappresentazione colonnare (vedi quote.table), costruita al primo utilizzo
+    table: Optional[Any] = field(default=None, repr=False, compare=False)
\ No newline at end of file
@@ -0,0 +1,74 @@
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+
+from quote.client import ScraperClient
+from quote.config import ProcessedData
+
+T = TypeVar("T")
+
+
+@dataclass
+class CachedResponse:
+    """Ultima risposta vista per un URL, con i validatori HTTP e il risultato già elaborato."""
+    etag: Optional[str]
+    last_modified: Optional[str]
+    digest: str
+    parsed: Any
+
+
+class DeltaState:
+    """
+    Stato dello scraping incrementale, conservato tra un aggiornamento e il successivo.
+    Per ogni URL ricorda ETag / Last-Modified e l'hash del contenuto insieme al risultato
+    elaborato, così le pagine non modificate non vengono né riscaricate né rielaborate.
+    """
+
+    def __init__(self):
+        self.responses: Dict[str, CachedResponse] = {}
+        # Ultimo risultato aggregato, riusato se nessuna partita è cambiata
+        self.last_data: Optional[ProcessedData] = None
+        self.last_match_ids: Tuple[str, ...] = ()
+
+    def parsed(self, url: str) -> Any:
+        cached = self.responses.get(url)
+        return cached.parsed if cached else None
+
+    def prune(self, urls: Iterable[str]) -> None:
+        """Dimentica gli URL non più presenti nel palinsesto."""
+        keep = set(urls)
+        for url in list(self.responses):
+            if url not in keep:
+                del self.responses[url]
+
+
+async def get_with_delta(client: ScraperClient, url: str, parse: Callable[[bytes], T], state: Optional[DeltaState]) -> Tuple[T, bool]:
+    """
+    Scarica ed elabora un URL riusando il risultato precedente se la pagina non è cambiata.
+    Restituisce (risultato, cambiato). Senza `state` equivale a una GET seguita da `parse`.
+    """
+    if state is None:
+        return parse(await client.get_bytes(url)), True
+
+    cached = state.responses.get(url)
+    response = await client.get_conditional(
+        url,
+        etag=cached.etag if cached else None,
+        last_modified=cached.last_modified if cached else None,
+    )
+    if response.status_code == 304 and cached:
+        return cached.parsed, False
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    digest = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+    if cached and cached.digest == digest:
+        # Il server non supporta le richieste condizionali, ma il contenuto è identico
+        cached.etag, cached.last_modified = etag, last_modified
+        return cached.parsed, False
+
+    parsed = parse(response.content)
+    state.responses[url] = CachedResponse(etag, last_modified, digest, parsed)
+    logging.debug(f"Contenuto cambiato: {url}")
+    return parsed, True
@@ -0,0 +1,148 @@
+import dataclasses
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from quote.config import Config, MatchQuotes, PlayerQuote, ProcessedData
+from quote.matching import PlayerNameIndex, resolve_team, team_key
+from quote.providers import ProviderSnapshot
+from quote.table import get_quotes_table
+
+# Probabilità (in %) senza margine per nome del giocatore: (marcatori, assist)
+FairProbabilities = Tuple[Dict[str, float], Dict[str, float]]
+
+
+def _provider_data(snapshot: ProviderSnapshot) -> ProcessedData:
+    """Dati aggregati di un bookmaker: quelli del fornitore se presenti, altrimenti costruiti dalle partite."""
+    if snapshot.data is not None:
+        return snapshot.data
+    team_index: Dict[str, Optional[Tuple[str, str]]] = {}
+    for m in snapshot.match_quotes:
+        team_index[team_key(m.match.home_team)] = (m.match.id, "home")
+        team_index[team_key(m.match.away_team)] = (m.match.id, "away")
+    return ProcessedData(
+        scorers=[p for m in snapshot.match_quotes for p in m.scorers],
+        assists=[p for m in snapshot.match_quotes for p in m.assists],
+        match_quotes={m.match.id: m for m in snapshot.match_quotes},
+        team_index=team_index,
+    )
+
+
+def _fixture_key(reference: ProcessedData, match_quotes: MatchQuotes) -> Hashable:
+    """
+    Partita del bookmaker di riferimento che corrisponde a `match_quotes`, trovata per squadre
+    come per le rose (`resolve_team`, con i nomi parziali). Se non c'è, le due squadre normalizzate.
+    """
+    match = match_quotes.match
+    for team, side in ((match.home_team, "home"), (match.away_team, "away")):
+        resolved = resolve_team(reference, team)
+        if resolved and resolved[1] == side:
+            return resolved[0].match.id
+    return team_key(match.home_team), team_key(match.away_team)
+
+
+def _with_team_stats(snapshot: ProviderSnapshot, keys: List[Hashable], team_stats: Dict[Hashable, dict]) -> ProviderSnapshot:
+    """
+    Per le partite senza il mercato "segna casa/ospite" usa quello di un altro bookmaker: senza,
+    il margine delle quote dei giocatori non si potrebbe togliere.
+    """
+    if all(m.goal_stats or key not in team_stats for m, key in zip(snapshot.match_quotes, keys)):
+        return snapshot
+    match_quotes = [
+        m if m.goal_stats or key not in team_stats else dataclasses.replace(m, goal_stats=team_stats[key], name_indexes=None)
+        for m, key in zip(snapshot.match_quotes, keys)
+    ]
+    return dataclasses.replace(snapshot, match_quotes=match_quotes, data=None)
+
+
+def fair_team_probability(prob_percent: float) -> float:
+    """Probabilità (in %) che una squadra segni, senza il margine del bookmaker (vedi `Config.TEAM_SCORES_OVERROUND`)."""
+    return prob_percent / Config.TEAM_SCORES_OVERROUND
+
+
+def fair_probabilities(snapshot: ProviderSnapshot) -> Dict[str, FairProbabilities]:
+    """
+    Probabilità senza margine di un bookmaker, per match_id.
+    Il margine è rimosso partita per partita con lo stesso modello di `quote.table`.
+    """
+    table = get_quotes_table(_provider_data(snapshot))
+
+    result: Dict[str, FairProbabilities] = {m.match.id: ({}, {}) for m in snapshot.match_quotes}
+    for (match_id, name), row in table.rows.items():
+        if match_id not in result:
+            continue
+        for target, prob in zip(result[match_id], (table.prob_goal_fair[row], table.prob_assist_fair[row])):
+            if not np.isnan(prob):
+                target[name] = float(prob)
+    return result
+
+
+def _consensus(values: List[float]) -> Optional[float]:
+    return float(np.mean(values)) if values else None
+
+
+def fuse_match_quotes(snapshots: List[ProviderSnapshot]) -> List[MatchQuotes]:
+    """
+    Quote di consenso tra più bookmaker.
+
+    Ogni bookmaker viene ripulito dal proprio margine (giocatori e squadre), poi per ogni
+    giocatore si fa la media delle probabilità dei bookmaker che lo quotano; la quota risultante
+    è quella equa (100 / p) e la partita è marcata come `fair`. Partite e nomi seguono il primo
+    bookmaker: quelli degli altri vengono abbinati per squadre (`resolve_team`) e per nome
+    (fuzzy, dentro la stessa partita).
+    """
+    reference = _provider_data(snapshots[0])
+    keys = [
+        [_fixture_key(reference, m) if book_number else m.match.id for m in snapshot.match_quotes]
+        for book_number, snapshot in enumerate(snapshots)
+    ]
+    # Mercato "segna casa/ospite" di ogni partita, dal primo bookmaker che lo quota
+    team_stats: Dict[Hashable, dict] = {}
+    for snapshot, snapshot_keys in zip(snapshots, keys):
+        for match_quotes, key in zip(snapshot.match_quotes, snapshot_keys):
+            if match_quotes.goal_stats:
+                team_stats.setdefault(key, match_quotes.goal_stats)
+
+    # Partite nell'ordine del primo bookmaker che le quota
+    fixtures: Dict[Hashable, List[Tuple[MatchQuotes, FairProbabilities]]] = {}
+    for snapshot, snapshot_keys in zip(snapshots, keys):
+        probabilities = fair_probabilities(_with_team_stats(snapshot, snapshot_keys, team_stats))
+        for match_quotes, key in zip(snapshot.match_quotes, snapshot_keys):
+            fixtures.setdefault(key, []).append((match_quotes, probabilities[match_quotes.match.id]))
+
+    fused = []
+    for books in fixtures.values():
+        reference = books[0][0]
+        match = reference.match
+        index = PlayerNameIndex([p.player_name for p in reference.scorers + reference.assists])
+
+        # Nome (del bookmaker di riferimento) -> probabilità dei vari bookmaker
+        goal_probs: Dict[str, List[float]] = {}
+        assist_probs: Dict[str, List[float]] = {}
+        for book_number, (_, (goals, assists)) in enumerate(books):
+            for source, target in ((goals, goal_probs), (assists, assist_probs)):
+                for name, prob in source.items():
+                    best = index.match(name) if book_number else None
+                    target.setdefault(best[0] if best else name, []).append(prob)
+
+        goal_stats = None
+        stats = [m.goal_stats for m, _ in books if m.goal_stats]
+        if stats:
+            goal_stats = {
+                "match_id": match.id,
+                "home_team": match.home_team,
+                "away_team": match.away_team,
+                "prob_home_concedes_goal": _consensus([fair_team_probability(s["prob_home_concedes_goal"]) for s in stats]),
+                "prob_away_concedes_goal": _consensus([fair_team_probability(s["prob_away_concedes_goal"]) for s in stats]),
+            }
+
+        def quotes(probs: Dict[str, List[float]]) -> List[PlayerQuote]:
+            result = []
+            for name, values in probs.items():
+                prob = _consensus(values)
+                if prob:
+                    result.append(PlayerQuote(player_name=name, quote=100 / prob, match_id=match.id))
+            return result
+
+        fused.append(MatchQuotes(match, quotes(goal_probs), quotes(assist_probs), goal_stats, fair=True))
+    return fused
@@ -0,0 +1,200 @@
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from quote.config import Config
+from quote.matching import normalize_name
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    team TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS aliases (
+    player_id TEXT NOT NULL REFERENCES players (id),
+    source TEXT NOT NULL,
+    alias TEXT NOT NULL,
+    manual INTEGER NOT NULL DEFAULT 0,
+    score INTEGER,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (player_id, source, alias)
+);
+"""
+
+# Fonti dei nomi: l'identità è il giocatore della rosa, i bookmaker ne conoscono alias
+SISAL_SOURCE = "sisal"
+
+
+def player_id(name: str, team: str) -> str:
+    """Identificativo canonico di un giocatore: nome e squadra della rosa, normalizzati."""
+    return f"{' '.join(normalize_name(team))}/{' '.join(normalize_name(name))}"
+
+
+@dataclass
+class Alias:
+    """Nome di un giocatore presso una fonte."""
+    alias: str
+    manual: bool = False
+    score: Optional[int] = None
+
+
+class PlayerRegistry:
+    """
+    Anagrafica dei giocatori (SQLite): per ogni giocatore della rosa, il nome usato da ogni fonte.
+
+    - All'avvio gli alias vengono caricati in un dizionario: la ricerca è O(1) e il matching
+      fuzzy serve solo per i nomi mai visti.
+    - Gli abbinamenti fuzzy sicuri (`Config.IDENTITY_MIN_SCORE`) vengono imparati e salvati in
+      blocco con `flush`; quelli impostati a mano hanno sempre la precedenza.
+    - Più processi (il gruppo di processi del bot) condividono il database: `sync` ricarica il
+      dizionario solo se un altro processo lo ha modificato.
+    """
+
+    def __init__(self, path: str = Config.IDENTITY_DB_PATH, min_score: int = Config.IDENTITY_MIN_SCORE):
+        self.path = path
+        self.min_score = min_score
+        self._lock = threading.RLock()
+        # (id giocatore, fonte) -> nome preferito
+        self._aliases: Dict[Tuple[str, str], Alias] = {}
+        # Righe imparate e non ancora salvate: (id, nome, squadra), (id, fonte, alias, punteggio)
+        self._pending_players: Dict[str, Tuple[str, str]] = {}
+        self._pending_aliases: List[Tuple[str, str, str, int]] = []
+
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._data_version = self._current_data_version()
+        self._load()
+
+    def _current_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load(self) -> None:
+        # Gli alias manuali e poi i più recenti sovrascrivono gli altri
+        rows = self._conn.execute("SELECT player_id, source, alias, manual, score FROM aliases ORDER BY manual, updated_at")
+        self._aliases = {(pid, source): Alias(alias, bool(manual), score) for pid, source, alias, manual, score in rows}
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    # --- Letture ---
+
+    def lookup(self, name: str, team: str, source: str = SISAL_SOURCE) -> Optional[Alias]:
+        """Nome del giocatore della rosa presso `source`, se noto."""
+        return self._aliases.get((player_id(name, team), source))
+
+    def sync(self) -> None:
+        """Ricarica gli alias se il database è stato modificato da un'altra connessione."""
+        with self._lock:
+            version = self._current_data_version()
+            if version != self._data_version:
+                self.flush()
+                self._load()
+                self._data_version = version
+
+    # --- Scritture ---
+
+    def learn(self, name: str, team: str, alias: str, score: int, source: str = SISAL_SOURCE) -> bool:
+        """
+        Registra un abbinamento trovato con il matching fuzzy, se abbastanza sicuro e se non
+        c'è un alias manuale. Viene salvato al prossimo `flush`. Restituisce True se imparato.
+        """
+        if score < self.min_score:
+            return False
+        pid = player_id(name, team)
+        with self._lock:
+            current = self._aliases.get((pid, source))
+            if current is not None and (current.manual or current.alias == alias):
+                return False
+            self._aliases[(pid, source)] = Alias(alias, score=score)
+            self._pending_players[pid] = (name, team)
+            self._pending_aliases.append((pid, source, alias, score))
+        return True
+
+    def flush(self) -> None:
+        """Salva in un'unica transazione gli abbinamenti imparati."""
+        with self._lock:
+            if not self._pending_aliases:
+                return
+            now = time.time()
+            players = [(pid, name, team, now) for pid, (name, team) in self._pending_players.items()]
+            aliases = [(*row, now) for row in self._pending_aliases]
+            self._pending_players.clear()
+            self._pending_aliases.clear()
+            try:
+                with self._conn:
+                    self._conn.executemany("INSERT OR IGNORE INTO players VALUES (?, ?, ?, ?)", players)
+                    self._conn.executemany(
+                        """
+                        INSERT INTO aliases VALUES (?, ?, ?, 0, ?, ?)
+                        ON CONFLICT (player_id, source, alias) DO UPDATE SET score = excluded.score, updated_at = excluded.updated_at
+                        """,
+                        aliases,
+                    )
+                logging.info(f"Anagrafica giocatori: salvati {len(aliases)} nuovi abbinamenti.")
+            except sqlite3.Error as e:
+                logging.error(f"Errore durante il salvataggio dell'anagrafica giocatori: {e}", exc_info=True)
+
+    def set_alias(self, name: str, team: str, alias: str, source: str = SISAL_SOURCE) -> None:
+        """Imposta a mano il nome di un giocatore presso `source`: ha la precedenza sul matching."""
+        pid = player_id(name, team)
+        now = time.time()
+        with self._lock:
+            self.flush()
+            with self._conn:
+                self._conn.execute("INSERT OR IGNORE INTO players VALUES (?, ?, ?, ?)", (pid, name, team, now))
+                # Un solo alias manuale per fonte
+                self._conn.execute("UPDATE aliases SET manual = 0 WHERE player_id = ? AND source = ?", (pid, source))
+                self._conn.execute(
+                    """
+                    INSERT INTO aliases VALUES (?, ?, ?, 1, NULL, ?)
+                    ON CONFLICT (player_id, source, alias) DO UPDATE SET manual = 1, updated_at = excluded.updated_at
+                    """,
+                    (pid, source, alias, now),
+                )
+            self._aliases[(pid, source)] = Alias(alias, manual=True)
+
+    def reset(self, name: str, team: str, source: str = SISAL_SOURCE) -> bool:
+        """Dimentica il nome di un giocatore presso `source` (manuale o imparato). True se era noto."""
+        pid = player_id(name, team)
+        with self._lock:
+            self.flush()
+            with self._conn:
+                deleted = self._conn.execute("DELETE FROM aliases WHERE player_id = ? AND source = ?", (pid, source)).rowcount
+            return self._aliases.pop((pid, source), None) is not None or deleted > 0
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+
+# --- Anagrafica condivisa dal bot ---
+
+_shared_registry: Optional[PlayerRegistry] = None
+_shared_lock = threading.Lock()
+
+
+def get_player_registry() -> PlayerRegistry:
+    """Restituisce l'anagrafica condivisa (una per processo), caricandola al primo utilizzo."""
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            _shared_registry = PlayerRegistry()
+            logging.info(f"Anagrafica giocatori caricata: {len(_shared_registry)} alias noti.")
+        return _shared_registry
+
+
+def close_player_registry() -> None:
+    """Salva gli abbinamenti in sospeso (da chiamare allo shutdown dell'applicazione)."""
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is not None:
+            _shared_registry.close()
+            _shared_registry = None
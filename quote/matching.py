@@ -0,0 +1,177 @@
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from thefuzz import fuzz
+
+from quote.config import Config, MatchQuotes, PlayerQuote, ProcessedData
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name: str) -> List[str]:
+    """Normalizza un nome in token minuscoli senza accenti né punteggiatura."""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALNUM.sub(" ", ascii_name.lower()).split()
+
+
+_SIMILAR_SOUNDS = str.maketrans({"c": "k", "q": "k", "z": "s", "x": "s", "w": "v", "j": "i", "y": "i"})
+_VOWELS_AND_H = re.compile(r"[aeiouh]")
+_REPEATED = re.compile(r"(.)\1+")
+
+
+def consonant_skeleton(token: str) -> str:
+    """
+    Scheletro consonantico di un token: prima lettera, poi le consonanti con i suoni simili
+    unificati (c/k/q, s/z/x) e senza doppie. "vasquez" e "vazquez" danno entrambi "vsks".
+    """
+    rest = _VOWELS_AND_H.sub("", token[1:].translate(_SIMILAR_SOUNDS))
+    return _REPEATED.sub(r"\1", token[:1].translate(_SIMILAR_SOUNDS) + rest)
+
+
+def _blocking_keys(tokens: List[str]) -> Set[str]:
+    """
+    Chiavi di blocking: prefisso di 3 lettere di ogni token (cognome, nome esteso) e
+    scheletro consonantico, che raccoglie le varianti di grafia (Vasquez/Vazquez).
+    Le iniziali ("D." in "Zapata D.") da sole non bastano a trovare candidati,
+    quindi vengono usate solo se il nome non ha altri token.
+    """
+    keys = set()
+    for token in tokens:
+        if len(token) > 1:
+            keys.add(token[:3])
+            keys.add("#" + consonant_skeleton(token)[:4])
+    return keys or set(tokens)
+
+
+class PlayerNameIndex:
+    """
+    Indice per il matching fuzzy dei nomi dei giocatori, costruito una volta per istantanea.
+
+    I nomi vengono normalizzati e i loro token ordinati in fase di costruzione, così il
+    punteggio `fuzz.ratio` sulle chiavi equivale al `token_sort_ratio` usato da
+    `find_best_match`, ma senza ripetere la normalizzazione a ogni confronto.
+    Per ogni ricerca si confrontano solo i candidati che condividono una chiave di
+    blocking; per restringere la ricerca a una squadra si usa l'indice della sua partita
+    (`get_match_indexes`).
+    """
+
+    def __init__(self, names: Iterable[str], threshold: int = Config.SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._names: List[str] = []
+        self._keys: List[str] = []
+        self._blocks: Dict[str, List[int]] = defaultdict(list)
+        self._memo: Dict[str, Optional[Tuple[str, int]]] = {}
+        # Quote associate ai nomi, se l'indice è stato costruito con `from_quotes`
+        self.quotes: Dict[str, PlayerQuote] = {}
+
+        seen = set()
+        for name in names:
+            if name in seen:
+                continue
+            seen.add(name)
+
+            tokens = normalize_name(name)
+            position = len(self._names)
+            self._names.append(name)
+            self._keys.append(" ".join(sorted(tokens)))
+            for key in _blocking_keys(tokens):
+                self._blocks[key].append(position)
+
+    @classmethod
+    def from_quotes(cls, quotes: Iterable[PlayerQuote], threshold: int = Config.SIMILARITY_THRESHOLD) -> "PlayerNameIndex":
+        """Costruisce l'indice da una lista di quote, mantenendo la quota di ogni nome."""
+        quotes = list(quotes)
+        index = cls((p.player_name for p in quotes), threshold=threshold)
+        for p in quotes:
+            index.quotes.setdefault(p.player_name, p)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def match(self, name: str) -> Optional[Tuple[str, int]]:
+        """
+        Trova il nome più simile nell'indice.
+        Restituisce una tupla (nome_trovato, punteggio_similarità) o None.
+        """
+        tokens = normalize_name(name)
+        query_key = " ".join(sorted(tokens))
+        if query_key in self._memo:
+            return self._memo[query_key]
+
+        candidates: Set[int] = set()
+        for key in _blocking_keys(tokens):
+            candidates.update(self._blocks.get(key, ()))
+
+        best: Optional[Tuple[str, int]] = None
+        # Ordine di inserimento: a parità di punteggio vince il primo, come in `process.extractOne`
+        for position in sorted(candidates):
+            score = fuzz.ratio(query_key, self._keys[position])
+            if best is None or score > best[1]:
+                best = (self._names[position], score)
+
+        result = best if best and best[1] >= self.threshold else None
+        self._memo[query_key] = result
+        return result
+
+    def match_many(self, names: Iterable[str]) -> Dict[str, Optional[Tuple[str, int]]]:
+        """Esegue `match` per una lista di nomi (es. una rosa) e restituisce un dizionario nome -> risultato."""
+        return {name: self.match(name) for name in names}
+
+    def find(self, name: str) -> Optional[PlayerQuote]:
+        """Restituisce la quota del nome più simile, o None se non c'è corrispondenza."""
+        best = self.match(name)
+        return self.quotes.get(best[0]) if best else None
+
+
+def get_name_indexes(scraped_data: ProcessedData) -> Tuple[PlayerNameIndex, PlayerNameIndex]:
+    """Restituisce gli indici (marcatori, assist) di tutto il campionato, costruendoli una sola volta."""
+    if scraped_data.name_indexes is None:
+        scraped_data.name_indexes = (
+            PlayerNameIndex.from_quotes(scraped_data.scorers),
+            PlayerNameIndex.from_quotes(scraped_data.assists),
+        )
+    return scraped_data.name_indexes
+
+
+def get_match_indexes(match_quotes: MatchQuotes) -> Tuple[PlayerNameIndex, PlayerNameIndex]:
+    """Restituisce gli indici (marcatori, assist) di una sola partita, costruendoli una sola volta."""
+    if match_quotes.name_indexes is None:
+        match_quotes.name_indexes = (
+            PlayerNameIndex.from_quotes(match_quotes.scorers),
+            PlayerNameIndex.from_quotes(match_quotes.assists),
+        )
+    return match_quotes.name_indexes
+
+
+def team_key(team: str) -> str:
+    """Chiave normalizzata di una squadra per `ProcessedData.team_index`."""
+    return " ".join(normalize_name(team))
+
+
+def resolve_team(scraped_data: ProcessedData, team: str) -> Optional[Tuple[MatchQuotes, str]]:
+    """
+    Trova la partita giocata da una squadra.
+    Restituisce (quote della partita, "home"/"away") oppure None se la squadra non gioca.
+    """
+    key = team_key(team)
+    if not key:
+        return None
+
+    if key not in scraped_data.team_index:
+        # Nome parziale (es. "Roma" vs "AS Roma"): cerchiamo per contenimento una sola volta
+        # e memorizziamo il risultato come alias nell'indice
+        found = None
+        for known, entry in list(scraped_data.team_index.items()):
+            if entry is not None and (key in known or known in key):
+                found = entry
+                break
+        scraped_data.team_index[key] = found
+
+    entry = scraped_data.team_index[key]
+    if entry is None:
+        return None
+    match_id, side = entry
+    return scraped_data.match_quotes[match_id], side
@@ -1,159 +1,283 @@
-import requests
+import asyncio
+import httpx
 import json
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional, List, Dict, Tuple, Any
-from quote.config import Config, Match, PlayerQuote, MatchGoalQuotes, ProcessedData
+import math
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Optional, List, Dict, Tuple, Any, Hashable
+from quote.config import Config, Match, PlayerQuote, MatchGoalQuotes, MatchQuotes, ProcessedData
 from thefuzz import process, fuzz
-from quote.save import save_all_quotes_to_dataframe
-
-# --- 1. Configurazione e Setup del Logging ---
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+from quote.store import get_odds_store
+from quote.cache import Snapshot, snapshot_cache
+from quote.client import ScraperClient, get_scraper_client
+from quote.delta import DeltaState, get_with_delta
+from quote.fusion import fuse_match_quotes
+from quote.providers import ProviderSnapshot, QuoteProvider, get_providers, register_provider, scrape_providers
+from metrics import span, timed
+from quote.matching import PlayerNameIndex, get_match_indexes, get_name_indexes, resolve_team, team_key
+from quote.identity import PlayerRegistry, get_player_registry
+from quote.table import get_quotes_table
+from quote.render import HEADER, RenderedQuotes, quotes_renderer, render_blocks
+from quote.parser import parse_events, parse_event_detail_raw
 
 
 # --- 3. Logica di Scraping ---
 
-def get_next_events(session: requests.Session) -> Tuple[List[Match], Optional[str]]:
+@timed("get_next_events")
+async def get_next_events_async(client: ScraperClient, delta: Optional[DeltaState] = None) -> Tuple[List[Match], Optional[str]]:
     """Recupera la lista delle prossime partite e il codice palinsesto."""
     logging.info("Recupero della lista delle prossime partite...")
     try:
-        response = session.get(Config.EVENTS_URL, timeout=Config.HTTP_TIMEOUT)
-        response.raise_for_status()
-        data = response.json()
-
-        matches = []
-        codice_palinsesto = None
-
-        scommessa_map = data.get('scommessaMap', {})
-        if not scommessa_map:
-            logging.warning("Nessuna 'scommessaMap' trovata nella risposta API degli eventi.")
-            return [], None
-
-        for value in scommessa_map.values():
-            if not codice_palinsesto and value.get('codicePalinsesto'):
-                codice_palinsesto = str(value['codicePalinsesto'])
-            
-            description = value.get('descrizioneAvvenimento', '')
-            teams = description.split(" - ")
-            if len(teams) == 2:
-                matches.append(Match(
-                    id=str(value['codiceAvvenimento']),
-                    description=description,
-                    home_team=teams[0],
-                    away_team=teams[1]
-                ))
-        
-        logging.info(f"Trovate {len(matches)} partite. Codice Palinsesto: {codice_palinsesto}")
-        return matches, codice_palinsesto
-
-    except requests.exceptions.RequestException as e:
+        (matches, codice_palinsesto), _ = await get_with_delta(
+            client, Config.EVENTS_URL, lambda raw: parse_events(json.loads(raw)), delta
+        )
+    except (httpx.HTTPError, ValueError) as e:
         logging.error(f"Errore critico durante il recupero degli eventi: {e}")
         return [], None
 
-def get_quotes_for_match(session: requests.Session, match_id: str, codice_palinsesto: str) -> Tuple[List[PlayerQuote], List[PlayerQuote], Optional[MatchGoalQuotes]]:
+    logging.info(f"Trovate {len(matches)} partite. Codice Palinsesto: {codice_palinsesto}")
+    return matches, codice_palinsesto
+
+
+@timed("get_quotes_for_match")
+async def get_quotes_for_match_async(client: ScraperClient, match_id: str, codice_palinsesto: str) -> Tuple[List[PlayerQuote], List[PlayerQuote], Optional[MatchGoalQuotes]]:
     """Ottiene le quote per marcatori, assist e gol per una singola partita."""
     url = Config.EVENT_DETAIL_URL_TEMPLATE.format(codice_palinsesto=codice_palinsesto, match_id=match_id)
-    
-    scorers = []
-    assists = []
-    goal_quotes = None
-
     try:
-        response = session.get(url, timeout=Config.HTTP_TIMEOUT)
-        response.raise_for_status()
-        data = response.json()
-
-        info_map = data.get('infoAggiuntivaMap', {})
-        if not info_map:
-            return [], [], None
-
-        segna_casa_q = 1.0
-        segna_ospite_q = 1.0
-
-        for key, value in info_map.items():
-            desc = value.get('descrizione', 'N/A')
-            quota_raw = value.get('esitoList', [{}])[0].get('quota', 100)
-            quota = quota_raw / 100.0
-            
-            # Es: "12345-67890-28231-1"
-            key_parts = key.split('-')
-            if len(key_parts) < 3: continue
-            
-            bet_type_id = key_parts[2]
-
-            if bet_type_id == Config.MARCATORE_KEY_PREFIX:
-                player_name = desc.replace(" SEGNA O SUO SOSTITUTO INCL. T.S.", "")
-                scorers.append(PlayerQuote(player_name, quota))
-            elif bet_type_id == Config.ASSIST_KEY_PREFIX:
-                player_name = desc.replace(" ASSIST O SUO SOSTITUTO INCL. T.S.", "")
-                assists.append(PlayerQuote(player_name, quota))
-            elif bet_type_id == Config.SEGNA_CASA_KEY_PREFIX:
-                segna_casa_q = quota
-            elif bet_type_id == Config.SEGNA_OSPITE_KEY_PREFIX:
-                segna_ospite_q = quota
-
-        goal_quotes = MatchGoalQuotes(match_id, segna_casa_q, segna_ospite_q)
-        return scorers, assists, goal_quotes
-
-    except requests.exceptions.RequestException as e:
+        raw = await client.get_bytes(url)
+        return parse_event_detail_raw(raw, match_id)
+    except (httpx.HTTPError, ValueError) as e:
         logging.warning(f"Errore recupero quote per match {match_id}: {e}")
         return [], [], None
 
-def fetch_and_process_all_data(matches: List[Match], codice_palinsesto: str) -> ProcessedData:
-    """Coordina il download parallelo di tutte le quote e processa i dati aggregati."""
-    logging.info(f"Recupero dettagli per {len(matches)} partite in parallelo (max {Config.MAX_WORKERS} workers)...")
-    
+
+def build_match_quotes(match: Match, scorers: List[PlayerQuote], assists: List[PlayerQuote], goal_quotes: Optional[MatchGoalQuotes]) -> MatchQuotes:
+    """Costruisce la tabella delle quote di una partita, con le probabilità di gol delle squadre."""
+    # Combina info partite con quote gol
+    goal_stats = None
+    if goal_quotes:
+        goal_stats = {
+            "match_id": match.id,
+            "home_team": match.home_team,
+            "away_team": match.away_team,
+            "prob_home_concedes_goal": 100 / goal_quotes.away_team_scores_quote if goal_quotes.away_team_scores_quote > 0 else 0,
+            "prob_away_concedes_goal": 100 / goal_quotes.home_team_scores_quote if goal_quotes.home_team_scores_quote > 0 else 0
+        }
+    return MatchQuotes(match, scorers, assists, goal_stats)
+
+
+def aggregate_match_quotes(all_match_quotes: List[MatchQuotes]) -> ProcessedData:
+    """
+    Aggrega le quote delle singole partite.
+    Le tabelle per partita (con i loro indici dei nomi) vengono riusate così come sono:
+    solo le liste globali e l'indice delle squadre vengono ricostruiti.
+    """
+    logging.info("Elaborazione e aggregazione dei dati raccolti...")
+
     all_scorers: List[PlayerQuote] = []
     all_assists: List[PlayerQuote] = []
-    all_goal_quotes: Dict[str, MatchGoalQuotes] = {}
-
-    with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS) as executor:
-        with requests.Session() as session:
-            session.headers.update(Config.HEADERS)
-            
-            future_to_match = {
-                executor.submit(get_quotes_for_match, session, match.id, codice_palinsesto): match
-                for match in matches
-            }
-            
-            for i, future in enumerate(as_completed(future_to_match)):
-                match = future_to_match[future]
-                logging.info(f"Processata partita {i+1}/{len(matches)}: {match.description}")
-                try:
-                    scorers, assists, goal_quotes = future.result()
-                    all_scorers.extend(scorers)
-                    all_assists.extend(assists)
-                    if goal_quotes:
-                        all_goal_quotes[goal_quotes.match_id] = goal_quotes
-                except Exception as exc:
-                    logging.error(f'Match {match.id} ha generato un\'eccezione: {exc}')
-    
-    logging.info("Elaborazione e aggregazione dei dati raccolti...")
-    
-    # Rimuovi duplicati mantenendo l'ultimo valore e ordina
-    unique_scorers = sorted(list({p.player_name: p for p in all_scorers}.values()), key=lambda p: p.player_name)
-    unique_assists = sorted(list({p.player_name: p for p in all_assists}.values()), key=lambda p: p.player_name)
-    
-    # Combina info partite con quote gol
     team_goal_stats = []
-    for match in matches:
-        quotes = all_goal_quotes.get(match.id)
-        if quotes:
-            team_goal_stats.append({
-                "match_id": match.id,
-                "home_team": match.home_team,
-                "away_team": match.away_team,
-                "prob_home_concedes_goal": 100 / quotes.away_team_scores_quote if quotes.away_team_scores_quote > 0 else 0,
-                "prob_away_concedes_goal": 100 / quotes.home_team_scores_quote if quotes.home_team_scores_quote > 0 else 0
-            })
-            
+    match_quotes: Dict[str, MatchQuotes] = {}
+    team_index: Dict[str, Optional[Tuple[str, str]]] = {}
+
+    for quotes in all_match_quotes:
+        match = quotes.match
+        all_scorers.extend(quotes.scorers)
+        all_assists.extend(quotes.assists)
+        if quotes.goal_stats:
+            team_goal_stats.append(quotes.goal_stats)
+
+        match_quotes[match.id] = quotes
+        team_index[team_key(match.home_team)] = (match.id, "home")
+        team_index[team_key(match.away_team)] = (match.id, "away")
+
+    # Rimuovi duplicati (stesso giocatore nella stessa partita) mantenendo l'ultimo valore e ordina.
+    # Omonimi in partite diverse restano distinti.
+    unique_scorers = sorted(list({(p.player_name, p.match_id): p for p in all_scorers}.values()), key=lambda p: p.player_name)
+    unique_assists = sorted(list({(p.player_name, p.match_id): p for p in all_assists}.values()), key=lambda p: p.player_name)
+
     logging.info("Elaborazione completata.")
-    return ProcessedData(scorers=unique_scorers, assists=unique_assists, team_goal_stats=team_goal_stats)
+    return ProcessedData(
+        scorers=unique_scorers,
+        assists=unique_assists,
+        team_goal_stats=team_goal_stats,
+        match_quotes=match_quotes,
+        team_index=team_index,
+    )
+
+
+async def fetch_and_process_all_data_async(client: ScraperClient, matches: List[Match], codice_palinsesto: str, delta: Optional[DeltaState] = None) -> Optional[ProcessedData]:
+    """
+    Coordina il download concorrente di tutte le quote e processa i dati aggregati.
+    Con `delta`, le partite le cui quote non sono cambiate dall'ultimo aggiornamento
+    vengono riusate senza riscaricarle né rielaborarle.
+    Restituisce None se il download fallisce per più di `Config.MAX_FAILED_MATCHES_RATIO` delle partite.
+    """
+    logging.info(f"Recupero dettagli per {len(matches)} partite in parallelo (max {Config.MAX_WORKERS} richieste)...")
+
+    completed = 0
+
+    # Ogni partita dà (quote, cambiata, fallita): un errore non conta come "invariata"
+    async def fetch(match: Match) -> Tuple[MatchQuotes, bool, bool]:
+        nonlocal completed
+        url = Config.EVENT_DETAIL_URL_TEMPLATE.format(codice_palinsesto=codice_palinsesto, match_id=match.id)
+        try:
+            with span("get_quotes_for_match"):
+                result = (*await get_with_delta(
+                    client, url, lambda raw: build_match_quotes(match, *parse_event_detail_raw(raw, match.id)), delta
+                ), False)
+        except (httpx.HTTPError, ValueError) as e:
+            previous = delta.parsed(url) if delta else None
+            logging.warning(f"Errore recupero quote per match {match.id}: {e}" + (" (uso le quote precedenti)" if previous else ""))
+            result = (previous, False, True) if previous else (MatchQuotes(match), True, True)
+        completed += 1
+        logging.info(f"Processata partita {completed}/{len(matches)}: {match.description}")
+        return result
+
+    results = await asyncio.gather(*(fetch(match) for match in matches), return_exceptions=True)
+
+    all_match_quotes = []
+    changed = failed = 0
+    for match, result in zip(matches, results):
+        if isinstance(result, Exception):
+            logging.error(f'Match {match.id} ha generato un\'eccezione: {result}')
+            result = (MatchQuotes(match), True, True)
+        all_match_quotes.append(result[0])
+        changed += result[1]
+        failed += result[2]
+
+    if failed > len(matches) * Config.MAX_FAILED_MATCHES_RATIO:
+        # Sisal non risponde per i dettagli: meglio nessuna istantanea (la cache tiene la precedente,
+        # con la sua età) che una con quote vecchie o vuote presentata come appena aggiornata
+        logging.error(f"Scraping fallito: quote non disponibili per {failed}/{len(matches)} partite.")
+        return None
+
+    if delta is None:
+        return aggregate_match_quotes(all_match_quotes)
+
+    match_ids = tuple(match.id for match in matches)
+    logging.info(f"Partite con quote cambiate: {changed}/{len(matches)}, non scaricate: {failed}.")
+    if changed == 0 and failed == 0 and delta.last_data is not None and delta.last_match_ids == match_ids:
+        # Nessuna quota cambiata: riusiamo i dati aggregati (e tabella e indici già costruiti)
+        return delta.last_data
+
+    delta.prune([Config.EVENTS_URL] + [
+        Config.EVENT_DETAIL_URL_TEMPLATE.format(codice_palinsesto=codice_palinsesto, match_id=match_id) for match_id in match_ids
+    ])
+    delta.last_data = aggregate_match_quotes(all_match_quotes)
+    delta.last_match_ids = match_ids
+    return delta.last_data
+
+
+async def scrape_snapshot_async(client: ScraperClient, delta: Optional[DeltaState] = None) -> Optional[Tuple[str, ProcessedData]]:
+    """
+    Esegue lo scraping completo del palinsesto.
+    Restituisce una tupla (codice_palinsesto, dati) oppure None in caso di errore.
+    Con `delta` lo scraping è incrementale (vedi `fetch_and_process_all_data_async`).
+    """
+    previous_data = delta.last_data if delta else None
+    matches, codice_palinsesto = await get_next_events_async(client, delta)
+
+    if not matches or not codice_palinsesto:
+        logging.error("Scraping fallito: non sono stati trovati match o il codice palinsesto.")
+        return None
+
+    scraped_data = await fetch_and_process_all_data_async(client, matches, codice_palinsesto, delta)
+
+    if not scraped_data:
+        return None
+
+    # Salvataggio nello storico delle quote, in background (solo se qualcosa è cambiato)
+    if scraped_data is not previous_data:
+        get_odds_store().record_snapshot(codice_palinsesto, scraped_data)
+
+    return codice_palinsesto, scraped_data
+
+
+# --- Fornitori di quote ---
+
+class SisalProvider(QuoteProvider):
+    """Quote Sisal, con scraping incrementale tra un aggiornamento e l'altro."""
+    name = "sisal"
+
+    def __init__(self):
+        self.delta = DeltaState()
+
+    async def get_next_events(self, client: ScraperClient) -> Tuple[List[Match], Optional[str]]:
+        return await get_next_events_async(client, self.delta)
+
+    async def get_quotes_for_match(self, client: ScraperClient, match: Match, codice_palinsesto: str) -> MatchQuotes:
+        return build_match_quotes(match, *await get_quotes_for_match_async(client, match.id, codice_palinsesto))
+
+    async def scrape(self, client: ScraperClient, expires: Optional[float] = None) -> Optional[ProviderSnapshot]:
+        if expires is not None:
+            # Come fornitore secondario, con una scadenza: lo scraping generico tiene le partite arrivate in tempo
+            return await super().scrape(client, expires)
+        result = await scrape_snapshot_async(client, self.delta)
+        if result is None:
+            return None
+        codice_palinsesto, data = result
+        return ProviderSnapshot(self.name, codice_palinsesto, list(data.match_quotes.values()), data)
+
+
+sisal_provider = register_provider(SisalProvider())
+
+
+async def scrape_consensus_snapshot_async(
+    client: ScraperClient,
+    providers: Optional[List[QuoteProvider]] = None,
+    deadline: float = Config.PROVIDER_DEADLINE,
+) -> Optional[Tuple[str, ProcessedData]]:
+    """
+    Scarica le quote di tutti i bookmaker attivi (vedi `Config.QUOTE_PROVIDERS`) e le fonde in
+    probabilità di consenso; i bookmaker oltre al primo hanno `deadline` secondi (vedi
+    `scrape_providers`). Con un solo bookmaker i suoi dati sono restituiti così come sono.
+    Il codice palinsesto è quello del primo bookmaker che ha risposto.
+    """
+    snapshots = await scrape_providers(providers if providers is not None else get_providers(), client, deadline)
+    if not snapshots:
+        return None
+    if len(snapshots) == 1 and snapshots[0].data is not None:
+        return snapshots[0].codice_palinsesto, snapshots[0].data
+
+    logging.info(f"Fusione delle quote di {len(snapshots)} bookmaker: {', '.join(s.provider for s in snapshots)}.")
+    with span("fuse_quotes"):
+        data = aggregate_match_quotes(fuse_match_quotes(snapshots))
+    return snapshots[0].codice_palinsesto, data
+
+
+# --- Wrapper sincroni (client temporaneo, per script e utilizzo fuori dal bot) ---
+
+async def _with_temporary_client(func, *args):
+    async with ScraperClient() as client:
+        return await func(client, *args)
+
+
+def get_next_events(session: Any = None) -> Tuple[List[Match], Optional[str]]:
+    """
+    Versione sincrona di `get_next_events_async`.
+    `session` è mantenuto per compatibilità con i chiamanti esistenti ed è ignorato.
+    """
+    return asyncio.run(_with_temporary_client(get_next_events_async))
+
+
+def get_quotes_for_match(session: Any, match_id: str, codice_palinsesto: str) -> Tuple[List[PlayerQuote], List[PlayerQuote], Optional[MatchGoalQuotes]]:
+    """
+    Versione sincrona di `get_quotes_for_match_async`.
+    `session` è mantenuto per compatibilità con i chiamanti esistenti ed è ignorato.
+    """
+    return asyncio.run(_with_temporary_client(get_quotes_for_match_async, match_id, codice_palinsesto))
+
+
+def fetch_and_process_all_data(matches: List[Match], codice_palinsesto: str) -> Optional[ProcessedData]:
+    """Versione sincrona di `fetch_and_process_all_data_async`."""
+    return asyncio.run(_with_temporary_client(fetch_and_process_all_data_async, matches, codice_palinsesto))
+
+
+def scrape_snapshot() -> Optional[Tuple[str, ProcessedData]]:
+    """Versione sincrona di `scrape_snapshot_async`."""
+    return asyncio.run(_with_temporary_client(scrape_snapshot_async))
 
 
 def find_best_match(name_to_find: str, choices: List[str]) -> Optional[Tuple[str, int]]:
@@ -171,6 +295,37 @@ def find_best_match(name_to_find: str, choices: List[str]) -> Optional[Tuple[str
     return None
 
 
+def _probability(value: float) -> float:
+    """Converte una probabilità della tabella in float; le quote non valide (NaN) valgono 0."""
+    return 0.0 if math.isnan(value) else float(value)
+
+
+def _find_player_quotes(
+    registry: PlayerRegistry, name: str, team: str, scorer_index: PlayerNameIndex, assist_index: PlayerNameIndex,
+) -> Tuple[Optional[PlayerQuote], Optional[PlayerQuote]]:
+    """
+    Quote (marcatore, assist) di un giocatore della rosa.
+    Il nome usato da Sisal si legge dall'anagrafica; il matching fuzzy serve solo per i giocatori
+    non ancora noti (o il cui nome non è più quotato) e gli abbinamenti sicuri vengono imparati.
+    """
+    known = registry.lookup(name, team)
+    if known is not None:
+        scorer, assist = scorer_index.quotes.get(known.alias), assist_index.quotes.get(known.alias)
+        # Un alias manuale vale anche se il giocatore non è quotato in questo palinsesto
+        if scorer or assist or known.manual:
+            return scorer, assist
+
+    best_scorer, best_assist = scorer_index.match(name), assist_index.match(name)
+    best = max((b for b in (best_scorer, best_assist) if b), key=lambda b: b[1], default=None)
+    if best:
+        registry.learn(name, team, *best)
+    return (
+        scorer_index.quotes.get(best_scorer[0]) if best_scorer else None,
+        assist_index.quotes.get(best_assist[0]) if best_assist else None,
+    )
+
+
+@timed("get_roster_quotes")
 def get_roster_quotes(roster: Dict[str, List[Tuple[str, str]]], scraped_data: ProcessedData) -> Dict[str, List[Dict[str, Any]]]:
     """
     Filtra e abbina i dati scaricati con i giocatori e le squadre del roster fornito.
@@ -179,114 +334,141 @@ def get_roster_quotes(roster: Dict[str, List[Tuple[str, str]]], scraped_data: Pr
         "Por": [], "Dif": [], "Cen": [], "Att": []
     }
 
-    # Prepara le liste di nomi e squadre dai dati scaricati per il matching
-    scorer_names = [p.player_name for p in scraped_data.scorers]
-    assist_names = [p.player_name for p in scraped_data.assists]
-    
-    # Crea dizionari per un accesso rapido alle quote
-    scorer_quotes_map = {p.player_name: p.quote for p in scraped_data.scorers}
-    assist_quotes_map = {p.player_name: p.quote for p in scraped_data.assists}
-    
+    table = get_quotes_table(scraped_data)
+    registry = get_player_registry()
+    registry.sync()
+
     # --- Processa Portieri ---
     for name, team in roster.get("Por", []):
-        team_stats = None
+        prob_concedes = None
         # Trova la partita che coinvolge la squadra del portiere
-        for stats in scraped_data.team_goal_stats:
-             # Usiamo `in` per gestire nomi parziali (es. "Roma" vs "AS Roma")
-            if team.lower() in stats["home_team"].lower():
-                team_stats = { "prob_concedes": stats["prob_home_concedes_goal"] }
-                break
-            elif team.lower() in stats["away_team"].lower():
-                team_stats = { "prob_concedes": stats["prob_away_concedes_goal"] }
-                break
-        
+        resolved = resolve_team(scraped_data, team)
+        if resolved and resolved[0].goal_stats:
+            match_quotes, side = resolved
+            prob_concedes = match_quotes.goal_stats[f"prob_{side}_concedes_goal"]
+
         roster_quotes["Por"].append({
             "name": name,
             "team": team,
-            "prob_concedes": team_stats["prob_concedes"] if team_stats else None
+            "prob_concedes": prob_concedes
         })
 
     # --- Processa Giocatori di Movimento (Dif, Cen, Att) ---
     for role in ["Dif", "Cen", "Att"]:
         for name, team in roster.get(role, []):
-            player_data = {"name": name, "team": team, "prob_goal": None, "prob_assist": None}
-
-            # Cerca il marcatore più simile
-            best_scorer_match = find_best_match(name, scorer_names)
-            if best_scorer_match:
-                matched_name = best_scorer_match[0]
-                quote = scorer_quotes_map.get(matched_name, 0)
-                player_data["prob_goal"] = 100 / quote if quote > 0 else 0
-
-            # Cerca l'assist-man più simile
-            best_assist_match = find_best_match(name, assist_names)
-            if best_assist_match:
-                matched_name = best_assist_match[0]
-                quote = assist_quotes_map.get(matched_name, 0)
-                player_data["prob_assist"] = 100 / quote if quote > 0 else 0
-            
+            player_data = {
+                "name": name, "team": team, "prob_goal": None, "prob_assist": None,
+                "prob_goal_fair": None, "prob_assist_fair": None,
+            }
+
+            # Cerca solo tra i giocatori della partita della sua squadra; se la squadra
+            # non è stata trovata nel palinsesto si ricade sull'intero campionato
+            resolved = resolve_team(scraped_data, team)
+            if resolved:
+                scorer_index, assist_index = get_match_indexes(resolved[0])
+            else:
+                scorer_index, assist_index = get_name_indexes(scraped_data)
+
+            # Trova il marcatore e l'assist-man e leggi le loro righe nella tabella colonnare
+            scorer, assist = _find_player_quotes(registry, name, team, scorer_index, assist_index)
+            if scorer:
+                row = table.rows[(scorer.match_id, scorer.player_name)]
+                player_data["prob_goal"] = _probability(table.prob_goal[row])
+                player_data["prob_goal_fair"] = _probability(table.prob_goal_fair[row])
+
+            if assist:
+                row = table.rows[(assist.match_id, assist.player_name)]
+                player_data["prob_assist"] = _probability(table.prob_assist[row])
+                player_data["prob_assist_fair"] = _probability(table.prob_assist_fair[row])
+
+            player_data["expected_bonus"] = (
+                Config.GOAL_BONUS * (player_data["prob_goal_fair"] or 0)
+                + Config.ASSIST_BONUS * (player_data["prob_assist_fair"] or 0)
+            ) / 100
+
             roster_quotes[role].append(player_data)
 
+    registry.flush()
     return roster_quotes
 
 
+def get_roster_quotes_many(rosters: Dict[Hashable, Dict[str, List[Tuple[str, str]]]], scraped_data: ProcessedData) -> Dict[Hashable, Dict[str, List[Dict[str, Any]]]]:
+    """
+    Abbina più rose alla stessa istantanea.
+    Gli indici dei nomi sono condivisi dall'istantanea e i giocatori presenti in più
+    rose (stesso ruolo, nome e squadra) vengono abbinati una sola volta.
+    """
+    player_cache: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    results: Dict[Hashable, Dict[str, List[Dict[str, Any]]]] = {}
+
+    for key, roster in rosters.items():
+        missing = {
+            role: [player for player in roster.get(role, []) if (role, *player) not in player_cache]
+            for role in roster
+        }
+        if any(missing.values()):
+            for role, players in get_roster_quotes(missing, scraped_data).items():
+                for (name, team), player_data in zip(missing.get(role, []), players):
+                    player_cache[(role, name, team)] = player_data
+
+        results[key] = {
+            role: [dict(player_cache[(role, name, team)]) for name, team in roster.get(role, [])]
+            for role in ["Por", "Dif", "Cen", "Att"]
+        }
+
+    return results
+
+
 def format_roster_quotes_for_telegram(roster_quotes: Dict[str, List[Dict[str, Any]]]) -> str:
-    """Formatta le quote del roster in un messaggio per Telegram."""
-    message = "📊 *Probabilità per la tua rosa*\n\n"
-
-    def format_prob(value, suffix='%'):
-        return f"{value:.2f}{suffix}" if value is not None else "N/D"
-    
-    # Formatta Portieri
-    message += "🧤 *PORTIERI* (Prob. subire gol)\n```\n"
-    sorted_gks = sorted(roster_quotes.get("Por", []), key=lambda p: p["prob_concedes"] if p["prob_concedes"] is not None else 999)
-    for p in sorted_gks:
-        message += f"{p['name']:<15} {format_prob(p['prob_concedes']):>6}\n" # Aumenta lo spazio per N/D
-    message += "```\n"
-
-    for role_info in [
-        ("🛡️ *DIFENSORI*", "Dif"),
-        ("🧠 *CENTROCAMPISTI*", "Cen"),
-        ("⚽️ *ATTACCANTI*", "Att")
-    ]:
-        title, role = role_info
-        message += f"{title} (Gol% / Assist%)\n```\n"
-        
-        # Ordina per somma di probabilità, trattando None come 0
-        players = roster_quotes.get(role, [])
-        sorted_players = sorted(players, key=lambda p: (p["prob_goal"] or 0) + (p["prob_assist"] or 0), reverse=True)
-        
-        for p in sorted_players:
-            goal_prob_str = format_prob(p['prob_goal'])
-            assist_prob_str = format_prob(p['prob_assist'])
-            message += f"{p['name']:<15} {goal_prob_str:>6} / {assist_prob_str:>6}\n"
-        message += "```\n"
-
-    return message
+    """Formatta le quote del roster in un messaggio per Telegram (senza cache né paginazione, vedi `render_roster_quotes`)."""
+    return HEADER + "".join(render_blocks(roster_quotes))
+
+
+async def render_roster_quotes(roster: Dict[str, List[Tuple[str, str]]], roster_hash: str, snapshot: Snapshot) -> RenderedQuotes:
+    """
+    Messaggio delle quote di una rosa (identificata da `roster_hash`), diviso in pagine entro
+    il limite di Telegram. Il rendering è in cache per (istantanea, rosa): l'abbinamento dei
+    giocatori gira nel gruppo di processi solo la prima volta.
+    """
+    from workers import process_pool  # workers importa questo modulo
 
+    rendered = quotes_renderer.cached(snapshot.version, roster_hash)
+    if rendered is None:
+        roster_quotes = (await process_pool.match_rosters(snapshot, {roster_hash: roster}))[roster_hash]
+        rendered = quotes_renderer.render(snapshot.version, roster_hash, lambda: roster_quotes)
+    return rendered
 
 
 def run_scraper_for_roster(roster: Dict[str, List[Tuple[str, str]]]) -> Optional[Dict[str, List[Dict[str, Any]]]]:
     """
     Esegue lo scraping e abbina i risultati al roster fornito.
     """
-    with requests.Session() as session:
-        session.headers.update(Config.HEADERS)
-        matches, codice_palinsesto = get_next_events(session)
+    result = scrape_snapshot()
+    if result is None:
+        return None
 
-        if not matches or not codice_palinsesto:
-            logging.error("Scraping fallito: non sono stati trovati match o il codice palinsesto.")
-            return None
+    _, scraped_data = result
+    return get_roster_quotes(roster, scraped_data)
+
+
+def _load_snapshot():
+    return scrape_consensus_snapshot_async(get_scraper_client())
+
+
+async def get_latest_snapshot() -> Optional[Snapshot]:
+    """Restituisce l'istantanea delle quote dalla cache condivisa, aggiornandola se necessario."""
+    return await snapshot_cache.get_or_load(_load_snapshot)
+
+
+async def refresh_snapshot() -> Optional[Snapshot]:
+    """Forza lo scraping e aggiorna la cache condivisa (usato dallo scheduler)."""
+    return await snapshot_cache.refresh(_load_snapshot)
+
+
+def format_stale_notice(snapshot: Snapshot) -> str:
+    """Avviso per Telegram se le quote servite sono vecchie (Sisal non raggiungibile), altrimenti stringa vuota."""
+    if not snapshot_cache.is_stale(snapshot):
+        return ""
+    scraped_at = datetime.fromtimestamp(snapshot.scraped_at, ZoneInfo(Config.SNAPSHOT_TIMEZONE))
+    return f"⚠️ _Quote non aggiornate: ultimo aggiornamento il {scraped_at:%d/%m alle %H:%M}._\n\n"
 
-        scraped_data = fetch_and_process_all_data(matches, codice_palinsesto)
-        
-        if not scraped_data:
-            return None
-        
-        # ==============================================================================
-        #SALVATAGGIO DEL DATAFRAME CON TUTTE LE QUOTE
-        save_all_quotes_to_dataframe(scraped_data)
-        # ==============================================================================
-            
-        roster_quotes = get_roster_quotes(roster, scraped_data)
-        return roster_quotes
\ No newline at end of file
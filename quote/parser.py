@@ -0,0 +1,168 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from quote.config import Config, Match, PlayerQuote, MatchGoalQuotes
+
+
+def parse_events(data: Dict[str, Any]) -> Tuple[List[Match], Optional[str]]:
+    """Estrae la lista delle partite e il codice palinsesto dalla risposta `schedaManifestazione`."""
+    matches = []
+    codice_palinsesto = None
+
+    scommessa_map = data.get('scommessaMap', {})
+    if not scommessa_map:
+        logging.warning("Nessuna 'scommessaMap' trovata nella risposta API degli eventi.")
+        return [], None
+
+    for value in scommessa_map.values():
+        if not codice_palinsesto and value.get('codicePalinsesto'):
+            codice_palinsesto = str(value['codicePalinsesto'])
+
+        description = value.get('descrizioneAvvenimento', '')
+        teams = description.split(" - ")
+        if len(teams) == 2:
+            matches.append(Match(
+                id=str(value['codiceAvvenimento']),
+                description=description,
+                home_team=teams[0],
+                away_team=teams[1]
+            ))
+
+    return matches, codice_palinsesto
+
+
+def parse_event_detail(data: Dict[str, Any], match_id: str) -> Tuple[List[PlayerQuote], List[PlayerQuote], Optional[MatchGoalQuotes]]:
+    """Estrae le quote per marcatori, assist e gol dalla risposta `eventDetail` di una partita."""
+    scorers = []
+    assists = []
+
+    info_map = data.get('infoAggiuntivaMap', {})
+    if not info_map:
+        return [], [], None
+
+    segna_casa_q = 1.0
+    segna_ospite_q = 1.0
+
+    for key, value in info_map.items():
+        desc = value.get('descrizione', 'N/A')
+        quota_raw = value.get('esitoList', [{}])[0].get('quota', 100)
+        quota = quota_raw / 100.0
+
+        # Es: "12345-67890-28231-1"
+        key_parts = key.split('-')
+        if len(key_parts) < 3: continue
+
+        bet_type_id = key_parts[2]
+
+        if bet_type_id == Config.MARCATORE_KEY_PREFIX:
+            player_name = desc.replace(" SEGNA O SUO SOSTITUTO INCL. T.S.", "")
+            scorers.append(PlayerQuote(player_name, quota, match_id))
+        elif bet_type_id == Config.ASSIST_KEY_PREFIX:
+            player_name = desc.replace(" ASSIST O SUO SOSTITUTO INCL. T.S.", "")
+            assists.append(PlayerQuote(player_name, quota, match_id))
+        elif bet_type_id == Config.SEGNA_CASA_KEY_PREFIX:
+            segna_casa_q = quota
+        elif bet_type_id == Config.SEGNA_OSPITE_KEY_PREFIX:
+            segna_ospite_q = quota
+
+    goal_quotes = MatchGoalQuotes(match_id, segna_casa_q, segna_ospite_q)
+    return scorers, assists, goal_quotes
+
+
+# --- Parser veloce per eventDetail ---
+
+_SCORER_SUFFIX = " SEGNA O SUO SOSTITUTO INCL. T.S."
+_ASSIST_SUFFIX = " ASSIST O SUO SOSTITUTO INCL. T.S."
+_WANTED_BET_TYPES = (
+    Config.MARCATORE_KEY_PREFIX,
+    Config.ASSIST_KEY_PREFIX,
+    Config.SEGNA_CASA_KEY_PREFIX,
+    Config.SEGNA_OSPITE_KEY_PREFIX,
+)
+_INFO_MAP_PATTERN = re.compile(r'"infoAggiuntivaMap"\s*:\s*(\{\s*\}|null|\{)')
+# Chiavi come "12345-67890-28231-1": il terzo segmento è il tipo di scommessa.
+# La ricerca parte dal segmento del tipo di scommessa (molto più selettivo delle virgolette),
+# poi la chiave intera viene verificata con la seconda regex.
+_WANTED_SEGMENT_PATTERN = re.compile(r'-(?:' + "|".join(_WANTED_BET_TYPES) + r')(?:-[^"]*)?"\s*:\s*(?=\{)')
+_WANTED_KEY_PATTERN = re.compile(r'"[^"\-]*-[^"\-]*-(' + "|".join(_WANTED_BET_TYPES) + r')(?:-[^"]*)?"\s*:\s*(?=\{)')
+# Byte da eliminare per tenere solo le graffe
+_NOT_BRACES = bytes(b for b in range(256) if b not in b"{}")
+_decoder = json.JSONDecoder()
+
+
+def _unbalanced_braces(source: bytes, start: int, end: int) -> bytes:
+    """
+    Graffe di `source[start:end]` rimaste senza corrispondenza ("}}{{"): vuoto se il tratto
+    contiene solo oggetti completi. Le graffe dentro le stringhe non vengono distinte.
+    """
+    braces = source[start:end].translate(None, _NOT_BRACES)
+    while b"{}" in braces:
+        braces = braces.replace(b"{}", b"")
+    return braces
+
+
+def parse_event_detail_raw(raw: bytes, match_id: str) -> Tuple[List[PlayerQuote], List[PlayerQuote], Optional[MatchGoalQuotes]]:
+    """
+    Come `parse_event_detail`, ma lavora sul testo JSON grezzo senza decodificare tutto il documento.
+    Le chiavi di `infoAggiuntivaMap` vengono filtrate con una regex sul tipo di scommessa e
+    solo i valori dei quattro mercati che ci interessano vengono decodificati; le centinaia
+    di altri mercati vengono saltati senza creare oggetti Python. La ricerca si ferma alla
+    fine della mappa.
+    """
+    text = raw.decode("utf-8")
+    info_map_match = _INFO_MAP_PATTERN.search(text)
+    if info_map_match is None:
+        # Struttura inattesa: ripieghiamo sul parser completo
+        return parse_event_detail(json.loads(text), match_id)
+    if info_map_match.group(1) != "{":
+        return [], [], None
+
+    scorers = []
+    assists = []
+    segna_casa_q = 1.0
+    segna_ospite_q = 1.0
+
+    # Stessa lunghezza del testo (un byte per carattere): serve solo a contare le graffe
+    braces_source = raw if len(raw) == len(text) else text.encode("ascii", "replace")
+    # `position` è sempre al primo livello della mappa: inizio o fine dell'ultimo valore decodificato
+    position = search_from = info_map_match.end()
+    while True:
+        segment_match = _WANTED_SEGMENT_PATTERN.search(text, search_from)
+        if segment_match is None:
+            break
+        search_from = segment_match.start() + 1
+        key_start = text.rfind('"', position, segment_match.start())
+        key_match = _WANTED_KEY_PATTERN.match(text, key_start) if key_start >= 0 else None
+        if key_match is None or key_match.end() != segment_match.end():
+            # Il tipo di scommessa non è il terzo segmento della chiave: può esserlo più avanti
+            continue
+
+        depth = _unbalanced_braces(braces_source, position, key_start)
+        if depth.startswith(b"}"):
+            # La mappa si chiude prima di questa chiave
+            break
+        if depth:
+            # Chiave annidata nel valore di un mercato saltato
+            continue
+        value, position = _decoder.raw_decode(text, key_match.end())
+        search_from = position
+        # Solo gli elementi di infoAggiuntivaMap hanno un esitoList: ignora altre mappe con chiavi simili
+        esiti = value.get('esitoList')
+        if not isinstance(esiti, list):
+            continue
+
+        quota = (esiti[0] if esiti else {}).get('quota', 100) / 100.0
+        bet_type_id = key_match.group(1)
+
+        if bet_type_id == Config.MARCATORE_KEY_PREFIX:
+            scorers.append(PlayerQuote(value.get('descrizione', 'N/A').removesuffix(_SCORER_SUFFIX), quota, match_id))
+        elif bet_type_id == Config.ASSIST_KEY_PREFIX:
+            assists.append(PlayerQuote(value.get('descrizione', 'N/A').removesuffix(_ASSIST_SUFFIX), quota, match_id))
+        elif bet_type_id == Config.SEGNA_CASA_KEY_PREFIX:
+            segna_casa_q = quota
+        else:
+            segna_ospite_q = quota
+
+    return scorers, assists, MatchGoalQuotes(match_id, segna_casa_q, segna_ospite_q)
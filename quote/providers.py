@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import registry
+from quote.client import ScraperClient
+from quote.config import Config, Match, MatchQuotes, ProcessedData
+
+PROVIDER_RESULTS = registry.counter("fanta_provider_results_total", "Scraping dei bookmaker, per fornitore ed esito (ok, partial, failed, late).")
+
+
+@dataclass
+class ProviderSnapshot:
+    """Quote scaricate da un bookmaker."""
+    provider: str
+    codice_palinsesto: str
+    match_quotes: List[MatchQuotes]
+    # Dati già aggregati dal fornitore, se disponibili: riusati tali e quali se è l'unico a rispondere
+    data: Optional[ProcessedData] = None
+    # Partite le cui quote non sono arrivate entro la scadenza (restano senza quote)
+    late_matches: int = 0
+
+
+class QuoteProvider(ABC):
+    """
+    Fornitore di quote (un bookmaker). Basta implementare la coppia
+    `get_next_events` / `get_quotes_for_match`; `scrape` le combina.
+    """
+    name: str = ""
+
+    @abstractmethod
+    async def get_next_events(self, client: ScraperClient) -> Tuple[List[Match], Optional[str]]:
+        """Prossime partite e codice del palinsesto; ([], None) in caso di errore."""
+
+    @abstractmethod
+    async def get_quotes_for_match(self, client: ScraperClient, match: Match, codice_palinsesto: str) -> MatchQuotes:
+        """Quote marcatori, assist e gol di una partita."""
+
+    async def scrape(self, client: ScraperClient, expires: Optional[float] = None) -> Optional[ProviderSnapshot]:
+        """
+        Scarica le quote di tutte le partite in parallelo. None se il palinsesto non è disponibile.
+
+        Con `expires` (orario dell'event loop) le partite le cui quote non arrivano in tempo
+        restano senza quote; se non arriva in tempo nemmeno il palinsesto solleva `TimeoutError`.
+        """
+        loop = asyncio.get_running_loop()
+
+        def remaining() -> Optional[float]:
+            return None if expires is None else max(0.0, expires - loop.time())
+
+        matches, codice_palinsesto = await asyncio.wait_for(self.get_next_events(client), remaining())
+        if not matches or not codice_palinsesto:
+            return None
+
+        tasks = [asyncio.create_task(self.get_quotes_for_match(client, match, codice_palinsesto)) for match in matches]
+        _, pending = await asyncio.wait(tasks, timeout=remaining())
+        for task in pending:
+            task.cancel()
+
+        match_quotes = []
+        for match, task in zip(matches, tasks):
+            result = MatchQuotes(match)
+            if task not in pending:
+                if task.exception() is not None:
+                    logging.warning(f"{self.name}: errore recupero quote per match {match.id}: {task.exception()}")
+                else:
+                    result = task.result()
+            match_quotes.append(result)
+        if pending:
+            logging.warning(f"{self.name}: quote di {len(pending)} partite su {len(matches)} non arrivate entro la scadenza.")
+        return ProviderSnapshot(self.name, codice_palinsesto, match_quotes, late_matches=len(pending))
+
+
+_providers: Dict[str, QuoteProvider] = {}
+
+
+def register_provider(provider: QuoteProvider) -> QuoteProvider:
+    """Registra un fornitore, selezionabile per nome in `Config.QUOTE_PROVIDERS`."""
+    _providers[provider.name] = provider
+    return provider
+
+
+def get_providers(names: Optional[Sequence[str]] = None) -> List[QuoteProvider]:
+    """Fornitori attivi, nell'ordine indicato (il primo è quello di riferimento per partite e nomi)."""
+    providers = []
+    for name in names or Config.QUOTE_PROVIDERS:
+        if name in _providers:
+            providers.append(_providers[name])
+        else:
+            logging.warning(f"Fornitore di quote sconosciuto: '{name}'.")
+    return providers
+
+
+async def scrape_providers(
+    providers: Sequence[QuoteProvider],
+    client: ScraperClient,
+    deadline: float = Config.PROVIDER_DEADLINE,
+) -> List[ProviderSnapshot]:
+    """
+    Esegue lo scraping di tutti i fornitori in parallelo, nell'ordine di `providers`.
+
+    Il primo fornitore (di riferimento per partite e nomi) non viene mai interrotto. Gli altri
+    hanno `deadline` secondi: le partite non arrivate in tempo restano senza quote, mentre i
+    fornitori senza palinsesto entro la scadenza, o falliti, vengono scartati.
+    """
+    if not providers:
+        return []
+    reference, others = providers[0], providers[1:]
+    expires = asyncio.get_running_loop().time() + deadline
+    tasks = {reference: asyncio.create_task(reference.scrape(client), name=f"provider-{reference.name}")}
+    for provider in others:
+        tasks[provider] = asyncio.create_task(provider.scrape(client, expires), name=f"provider-{provider.name}")
+    await asyncio.wait(tasks.values())
+
+    snapshots = []
+    for provider, task in tasks.items():
+        error = task.exception()
+        if isinstance(error, asyncio.TimeoutError):
+            PROVIDER_RESULTS.inc(provider=provider.name, result="late")
+            logging.warning(f"{provider.name}: palinsesto non arrivato entro {deadline:g}s, scartato.")
+            continue
+        if error is not None or task.result() is None:
+            PROVIDER_RESULTS.inc(provider=provider.name, result="failed")
+            logging.warning(f"{provider.name}: scraping fallito" + (f": {error}" if error else "."))
+            continue
+        snapshot = task.result()
+        PROVIDER_RESULTS.inc(provider=provider.name, result="partial" if snapshot.late_matches else "ok")
+        snapshots.append(snapshot)
+    return snapshots
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+RosterQuotes = Dict[str, List[Dict[str, Any]]]
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Caratteri lasciati liberi in ogni pagina per ciò che viene aggiunto dopo (es. avviso di quote non aggiornate)
+PAGE_RESERVE = 256
+RENDER_CACHE_SIZE = 256  # messaggi renderizzati tenuti in memoria (per istantanea e rosa)
+
+HEADER = "📊 *Probabilità per la tua rosa*\n\n"
+ROLE_TITLES = {
+    "Por": "🧤 *PORTIERI* (Prob. subire gol)",
+    "Dif": "🛡️ *DIFENSORI* (Gol% / Assist%)",
+    "Cen": "🧠 *CENTROCAMPISTI* (Gol% / Assist%)",
+    "Att": "⚽️ *ATTACCANTI* (Gol% / Assist%)",
+}
+_CODE = "```\n"
+
+
+def format_prob(value: Optional[float], suffix: str = "%") -> str:
+    return f"{value:.2f}{suffix}" if value is not None else "N/D"
+
+
+def player_line(role: str, p: Dict[str, Any]) -> Tuple[float, str]:
+    """Riga di un giocatore e chiave di ordinamento nel suo ruolo."""
+    if role == "Por":
+        # Portieri: prima chi ha meno probabilità di subire gol, N/D in fondo
+        sort_key = p["prob_concedes"] if p["prob_concedes"] is not None else 999
+        return sort_key, f"{p['name']:<15} {format_prob(p['prob_concedes']):>6}\n"
+    # Movimento: per somma di probabilità decrescente, trattando None come 0
+    sort_key = -((p["prob_goal"] or 0) + (p["prob_assist"] or 0))
+    return sort_key, f"{p['name']:<15} {format_prob(p['prob_goal']):>6} / {format_prob(p['prob_assist']):>6}\n"
+
+
+def role_block(role: str, lines: List[Tuple[float, str]]) -> str:
+    """Blocco di un ruolo: titolo e righe ordinate in un blocco di codice."""
+    ordered = sorted(lines, key=lambda line: line[0])
+    return f"{ROLE_TITLES[role]}\n{_CODE}{''.join(line for _, line in ordered)}{_CODE}"
+
+
+def render_blocks(roster_quotes: RosterQuotes) -> List[str]:
+    """Blocchi di tutti i ruoli, senza cache."""
+    return [
+        role_block(role, [player_line(role, p) for p in roster_quotes.get(role, [])])
+        for role in ROLE_TITLES
+    ]
+
+
+def _split_block(block: str, limit: int) -> List[str]:
+    """Divide un blocco troppo lungo tra le righe, riaprendo il blocco di codice in ogni parte."""
+    title, body = block.split(_CODE, 1)
+    head = f"{title}{_CODE}"
+    pieces: List[str] = []
+    chunk: List[str] = []
+    size = len(head) + len(_CODE)
+    for row in body[: -len(_CODE)].splitlines(keepends=True):
+        if chunk and size + len(row) > limit:
+            pieces.append(head + "".join(chunk) + _CODE)
+            chunk, size = [], len(head) + len(_CODE)
+        chunk.append(row)
+        size += len(row)
+    pieces.append(head + "".join(chunk) + _CODE)
+    return pieces
+
+
+def paginate(blocks: List[str], limit: int = TELEGRAM_MESSAGE_LIMIT - PAGE_RESERVE) -> List[str]:
+    """
+    Divide i blocchi in pagine di al più `limit` caratteri, senza spezzare i blocchi se possibile.
+    Solo la prima pagina ha l'intestazione.
+    """
+    pages: List[str] = []
+    current: List[str] = [HEADER]
+    size = len(HEADER)
+    has_blocks = False
+    for block in blocks:
+        pieces = [block] if len(block) <= limit - len(HEADER) else _split_block(block, limit - len(HEADER))
+        for piece in pieces:
+            if has_blocks and size + len(piece) > limit:
+                pages.append("".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece)
+            has_blocks = True
+    pages.append("".join(current))
+    return pages
+
+
+@dataclass
+class RenderedQuotes:
+    """Messaggio delle quote di una rosa, già diviso in pagine."""
+    token: str
+    pages: List[str]
+    # Versione dell'istantanea da cui è stato generato
+    version: str = ""
+
+
+def render_token(version: str, roster_hash: str) -> str:
+    """Identificativo breve (per i pulsanti di Telegram) di un messaggio renderizzato."""
+    return hashlib.blake2b(f"{version}|{roster_hash}".encode(), digest_size=8).hexdigest()
+
+
+class QuotesRenderer:
+    """
+    Rendering delle quote con cache, per istantanea.
+
+    - Le righe dei giocatori e i blocchi ordinati dei ruoli si calcolano una volta per
+      istantanea e si riusano tra le rose che condividono giocatori o interi reparti.
+    - I messaggi completi (già paginati) restano in cache per (istantanea, rosa), con LRU:
+      cambiare pagina non ricalcola nulla.
+    """
+
+    def __init__(self, max_messages: int = RENDER_CACHE_SIZE):
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._lines: Dict[Tuple[str, str, str], Tuple[float, str]] = {}
+        self._blocks: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], str] = {}
+        self._messages: "OrderedDict[str, RenderedQuotes]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[RenderedQuotes]:
+        with self._lock:
+            rendered = self._messages.get(token)
+            if rendered is not None:
+                self._messages.move_to_end(token)
+            return rendered
+
+    def cached(self, version: str, roster_hash: str) -> Optional[RenderedQuotes]:
+        """Messaggio già renderizzato per (istantanea, rosa), se in cache."""
+        return self.get(render_token(version, roster_hash))
+
+    def clear(self) -> None:
+        """Svuota la cache (es. dopo una correzione manuale degli abbinamenti)."""
+        with self._lock:
+            self._version = None
+            self._lines.clear()
+            self._blocks.clear()
+            self._messages.clear()
+
+    def render(self, version: str, roster_hash: str, roster_quotes: Callable[[], RosterQuotes]) -> RenderedQuotes:
+        """Messaggio paginato di una rosa; `roster_quotes` viene chiamata solo se il messaggio non è in cache."""
+        token = render_token(version, roster_hash)
+        rendered = self.get(token)
+        if rendered is not None:
+            return rendered
+
+        quotes = roster_quotes()
+        with self._lock:
+            if version != self._version:
+                # Nuova istantanea: righe e blocchi precedenti non sono più validi
+                self._version = version
+                self._lines.clear()
+                self._blocks.clear()
+            blocks = [self._block(role, quotes.get(role, [])) for role in ROLE_TITLES]
+            rendered = RenderedQuotes(token, paginate(blocks), version)
+            self._messages[token] = rendered
+            while len(self._messages) > self.max_messages:
+                self._messages.popitem(last=False)
+        return rendered
+
+    def _block(self, role: str, players: List[Dict[str, Any]]) -> str:
+        key = (role, tuple((p["name"], p["team"]) for p in players))
+        block = self._blocks.get(key)
+        if block is None:
+            lines = []
+            for p in players:
+                line_key = (role, p["name"], p["team"])
+                if line_key not in self._lines:
+                    self._lines[line_key] = player_line(role, p)
+                lines.append(self._lines[line_key])
+            block = self._blocks[key] = role_block(role, lines)
+        return block
+
+
+quotes_renderer = QuotesRenderer()
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from metrics import Histogram, registry
+
+RATE_LIMIT_WAIT = registry.histogram("fanta_scraper_rate_limit_wait_seconds", "Attesa imposta dal rate limiter prima di una richiesta a Sisal.")
+CIRCUIT_OPEN = registry.gauge("fanta_scraper_circuit_open", "Stato del circuit breaker per host (1 = aperto, richieste bloccate).")
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Richiesta non eseguita perché il circuit breaker dell'host è aperto."""
+
+
+class TokenBucket:
+    """
+    Rate limiter a token bucket: al massimo `burst` richieste di fila, poi `rate` al secondo.
+    I chiamanti in attesa vengono serviti in ordine di arrivo; l'attesa è registrata in `wait_metric`.
+    """
+
+    def __init__(self, rate: float, burst: int, wait_metric: Histogram = RATE_LIMIT_WAIT):
+        self.rate = rate
+        self.burst = burst
+        self.wait_metric = wait_metric
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        start = time.monotonic()
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+        self.wait_metric.observe(time.monotonic() - start)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per un host.
+
+    - Chiuso: le richieste passano; dopo `failure_threshold` errori consecutivi si apre.
+    - Aperto: le richieste falliscono subito (`CircuitOpenError`) per `reset_timeout` secondi.
+    - Trascorso il timeout passa una sola richiesta di prova (half-open): se riesce il
+      circuito si richiude, altrimenti resta aperto per un altro `reset_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """True se la richiesta può partire."""
+        if self._opened_at is None:
+            return True
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            # Richiesta di prova: le altre restano bloccate fino al prossimo timeout
+            self._opened_at = time.monotonic()
+            logging.info(f"Circuit breaker '{self.name}': provo una richiesta.")
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logging.info(f"Circuit breaker '{self.name}' chiuso: l'host risponde di nuovo.")
+            CIRCUIT_OPEN.set(0, host=self.name)
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logging.warning(
+                    f"Circuit breaker '{self.name}' aperto dopo {self._failures} errori consecutivi: "
+                    f"richieste sospese per {self.reset_timeout:.0f}s."
+                )
+                CIRCUIT_OPEN.set(1, host=self.name)
+            self._opened_at = time.monotonic()
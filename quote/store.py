@@ -0,0 +1,272 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from quote.config import Config, ProcessedData
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS player_odds (
+    scraped_at REAL NOT NULL,
+    palinsesto TEXT NOT NULL,
+    match_id TEXT NOT NULL,
+    player_name TEXT NOT NULL COLLATE NOCASE,
+    market TEXT NOT NULL,
+    quote REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_player_odds_player ON player_odds (player_name, palinsesto);
+CREATE INDEX IF NOT EXISTS idx_player_odds_palinsesto ON player_odds (palinsesto, scraped_at);
+
+CREATE TABLE IF NOT EXISTS team_odds (
+    scraped_at REAL NOT NULL,
+    palinsesto TEXT NOT NULL,
+    match_id TEXT NOT NULL,
+    home_team TEXT NOT NULL,
+    away_team TEXT NOT NULL,
+    home_scores_quote REAL,
+    away_scores_quote REAL
+);
+CREATE INDEX IF NOT EXISTS idx_team_odds_palinsesto ON team_odds (palinsesto, match_id);
+"""
+
+# Mercati salvati in player_odds
+GOAL_MARKET = "goal"
+ASSIST_MARKET = "assist"
+
+
+@dataclass
+class OddsPoint:
+    scraped_at: float
+    palinsesto: str
+    match_id: str
+    player_name: str
+    market: str
+    quote: float
+
+
+@dataclass
+class LineMove:
+    palinsesto: str
+    match_id: str
+    player_name: str
+    market: str
+    first_quote: float
+    last_quote: float
+    first_seen: float
+    last_seen: float
+
+    @property
+    def change(self) -> float:
+        """Variazione della probabilità implicita in punti percentuali (positiva se la quota è scesa)."""
+        return 100 / self.last_quote - 100 / self.first_quote
+
+
+class OddsStore:
+    """
+    Storico delle quote in un database SQLite, solo in aggiunta.
+
+    Le scritture vengono accodate e un thread in background le esegue a blocchi,
+    quindi `record_snapshot` non fa I/O sul percorso della richiesta. Per ogni
+    (palinsesto, partita, giocatore, mercato) viene salvata una nuova riga solo
+    quando la quota cambia, così lo storico contiene esattamente i movimenti delle linee.
+    """
+
+    def __init__(self, path: str = Config.ODDS_DB_PATH):
+        self.path = path
+        self._queue: "queue.Queue[Optional[Tuple[float, str, ProcessedData]]]" = queue.Queue()
+        # Ultime quote scritte, per salvare solo le variazioni
+        self._last_quotes: Dict[Tuple[str, str, str, str], float] = {}
+        self._last_team_quotes: Dict[Tuple[str, str], Tuple[Optional[float], Optional[float]]] = {}
+        # Palinsesto a cui si riferiscono le ultime quote tenute in memoria
+        self._palinsesto: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+            self._load_last_quotes(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _load_last_quotes(self, conn: sqlite3.Connection) -> None:
+        """
+        Ricarica l'ultima quota nota per ogni giocatore dell'ultimo palinsesto salvato,
+        per non duplicare righe dopo un riavvio.
+        """
+        row = conn.execute("SELECT palinsesto FROM player_odds ORDER BY rowid DESC LIMIT 1").fetchone()
+        if row is None:
+            return
+        self._palinsesto = row[0]
+        rows = conn.execute(
+            """
+            SELECT palinsesto, match_id, player_name, market, quote FROM player_odds
+            WHERE rowid IN (
+                SELECT MAX(rowid) FROM player_odds WHERE palinsesto = ? GROUP BY match_id, player_name, market
+            )
+            """,
+            (self._palinsesto,),
+        )
+        for palinsesto, match_id, player_name, market, quote in rows:
+            self._last_quotes[(palinsesto, match_id, player_name, market)] = quote
+
+        rows = conn.execute(
+            """
+            SELECT palinsesto, match_id, home_scores_quote, away_scores_quote FROM team_odds
+            WHERE rowid IN (SELECT MAX(rowid) FROM team_odds WHERE palinsesto = ? GROUP BY match_id)
+            """,
+            (self._palinsesto,),
+        )
+        for palinsesto, match_id, home_quote, away_quote in rows:
+            self._last_team_quotes[(palinsesto, match_id)] = (home_quote, away_quote)
+
+    # --- Scritture ---
+
+    def record_snapshot(self, codice_palinsesto: str, data: ProcessedData, scraped_at: Optional[float] = None) -> None:
+        """Accoda un'istantanea per il salvataggio in background. Non blocca."""
+        self._ensure_writer()
+        self._queue.put((scraped_at or time.time(), codice_palinsesto, data))
+
+    def _ensure_writer(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._writer_loop, name="odds-store-writer", daemon=True)
+                self._thread.start()
+
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                batch = [item]
+                # Raccoglie le istantanee arrivate nel frattempo per scriverle in un'unica transazione
+                deadline = time.monotonic() + Config.STORE_FLUSH_INTERVAL
+                while item is not None and len(batch) < Config.STORE_BATCH_SIZE:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    batch.append(item)
+
+                self._write_batch(conn, [snapshot for snapshot in batch if snapshot is not None])
+                if batch[-1] is None:
+                    return
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple[float, str, ProcessedData]]) -> None:
+        player_rows = []
+        team_rows = []
+        for scraped_at, palinsesto, data in batch:
+            if palinsesto != self._palinsesto:
+                self._prune(palinsesto)
+            for market, quotes in ((GOAL_MARKET, data.scorers), (ASSIST_MARKET, data.assists)):
+                for p in quotes:
+                    key = (palinsesto, p.match_id or "", p.player_name, market)
+                    if self._last_quotes.get(key) != p.quote:
+                        self._last_quotes[key] = p.quote
+                        player_rows.append((scraped_at, *key, p.quote))
+            for match_quotes in data.match_quotes.values():
+                stats = match_quotes.goal_stats
+                if not stats:
+                    continue
+                # prob_away_concedes_goal è la probabilità che la squadra di casa segni, e viceversa
+                team_quotes = (
+                    100 / stats["prob_away_concedes_goal"] if stats["prob_away_concedes_goal"] else None,
+                    100 / stats["prob_home_concedes_goal"] if stats["prob_home_concedes_goal"] else None,
+                )
+                key = (palinsesto, match_quotes.match.id)
+                if self._last_team_quotes.get(key) != team_quotes:
+                    self._last_team_quotes[key] = team_quotes
+                    team_rows.append((
+                        scraped_at, *key, match_quotes.match.home_team, match_quotes.match.away_team, *team_quotes,
+                    ))
+
+        if not player_rows and not team_rows:
+            return
+        try:
+            with conn:
+                conn.executemany("INSERT INTO player_odds VALUES (?, ?, ?, ?, ?, ?)", player_rows)
+                conn.executemany("INSERT INTO team_odds VALUES (?, ?, ?, ?, ?, ?, ?)", team_rows)
+            logging.info(f"Storico quote: salvate {len(player_rows)} variazioni da {len(batch)} istantanee.")
+        except sqlite3.Error as e:
+            logging.error(f"Errore durante il salvataggio dello storico quote: {e}", exc_info=True)
+
+    def _prune(self, palinsesto: str) -> None:
+        """Nuovo palinsesto: le ultime quote degli altri non servono più e vengono scartate."""
+        self._palinsesto = palinsesto
+        self._last_quotes = {key: quote for key, quote in self._last_quotes.items() if key[0] == palinsesto}
+        self._last_team_quotes = {key: quotes for key, quotes in self._last_team_quotes.items() if key[0] == palinsesto}
+
+    def close(self, timeout: float = 10) -> None:
+        """Scrive le istantanee in coda e ferma il thread di scrittura."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    # --- Letture ---
+
+    def get_player_history(self, player_name: str, market: Optional[str] = None, palinsesto: Optional[str] = None) -> List[OddsPoint]:
+        """Tutte le quote registrate per un giocatore (nome come scritto dal bookmaker), in ordine di tempo."""
+        query = "SELECT scraped_at, palinsesto, match_id, player_name, market, quote FROM player_odds WHERE player_name = ?"
+        params: list = [player_name]
+        if market:
+            query += " AND market = ?"
+            params.append(market)
+        if palinsesto:
+            query += " AND palinsesto = ?"
+            params.append(palinsesto)
+        query += " ORDER BY scraped_at"
+
+        with closing(self._connect()) as conn:
+            return [OddsPoint(*row) for row in conn.execute(query, params)]
+
+    def get_line_moves(self, palinsesto: str, market: Optional[str] = None, min_change: float = 0.0) -> List[LineMove]:
+        """
+        Prima e ultima quota di ogni giocatore in un palinsesto, ordinate per variazione
+        della probabilità implicita (in valore assoluto).
+        """
+        query = """
+            SELECT palinsesto, match_id, player_name, market,
+                   FIRST_VALUE(quote) OVER w, LAST_VALUE(quote) OVER w,
+                   MIN(scraped_at) OVER w, MAX(scraped_at) OVER w
+            FROM player_odds
+            WHERE palinsesto = ? {market_filter}
+            WINDOW w AS (PARTITION BY match_id, player_name, market ORDER BY scraped_at
+                         ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        """.format(market_filter="AND market = ?" if market else "")
+        params = [palinsesto, market] if market else [palinsesto]
+
+        with closing(self._connect()) as conn:
+            # La finestra restituisce gli stessi valori per tutte le righe di un giocatore: ne teniamo una
+            unique = {(row[1], row[2], row[3]): LineMove(*row) for row in conn.execute(query, params)}
+        moves = [m for m in unique.values() if m.first_quote > 0 and m.last_quote > 0 and abs(m.change) >= min_change]
+        return sorted(moves, key=lambda m: abs(m.change), reverse=True)
+
+
+# --- Storico condiviso dal bot ---
+
+_shared_store: Optional[OddsStore] = None
+
+
+def get_odds_store() -> OddsStore:
+    """Restituisce lo storico condiviso, aprendo il database al primo utilizzo."""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = OddsStore()
+    return _shared_store
+
+
+def close_odds_store() -> None:
+    """Completa le scritture in coda (da chiamare allo shutdown dell'applicazione)."""
+    global _shared_store
+    if _shared_store is not None:
+        _shared_store.close()
+        # Un uso successivo riapre il database con un nuovo thread di scrittura
+        _shared_store = None
@@ -0,0 +1,152 @@
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+import numpy as np
+
+from quote.config import Config, ProcessedData
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class QuotesTable:
+    """
+    Rappresentazione colonnare delle quote di tutti i giocatori: una riga per (partita, giocatore).
+    Le probabilità sono in percentuale; le colonne mancanti (es. nessuna quota assist) valgono NaN.
+    Per le partite con quote già senza margine (`MatchQuotes.fair`) le probabilità "fair" sono quelle implicite.
+    """
+    player_name: np.ndarray
+    match_id: np.ndarray
+    home_team: np.ndarray
+    away_team: np.ndarray
+    goal_quote: np.ndarray
+    assist_quote: np.ndarray
+    prob_goal: np.ndarray
+    prob_assist: np.ndarray
+    # Probabilità ripulite dal margine del bookmaker, partita per partita
+    prob_goal_fair: np.ndarray
+    prob_assist_fair: np.ndarray
+    # Bonus attesi al fantacalcio (gol + assist)
+    expected_bonus: np.ndarray
+    # (match_id, player_name) -> indice di riga
+    rows: Dict[Tuple[str, str], int] = field(default_factory=dict, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.player_name)
+
+    def to_frame(self) -> "pd.DataFrame":
+        """Restituisce la tabella come DataFrame pandas (le colonne riusano gli array esistenti)."""
+        import pandas as pd  # importato solo quando serve: pesa sull'avvio del bot
+
+        return pd.DataFrame({
+            "player_name": self.player_name,
+            "match_id": self.match_id,
+            "home_team": self.home_team,
+            "away_team": self.away_team,
+            "goal_quote": self.goal_quote,
+            "assist_quote": self.assist_quote,
+            "prob_goal": self.prob_goal,
+            "prob_assist": self.prob_assist,
+            "prob_goal_fair": self.prob_goal_fair,
+            "prob_assist_fair": self.prob_assist_fair,
+            "expected_bonus": self.expected_bonus,
+        }, copy=False)
+
+
+def implied_probability(quotes: np.ndarray) -> np.ndarray:
+    """Probabilità implicita (in %) di un array di quote decimali; NaN per quote mancanti o non valide."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(quotes > 0, 100 / quotes, np.nan)
+
+
+def _rate(prob_percent: np.ndarray) -> np.ndarray:
+    """Intensità di Poisson λ tale che P(almeno un evento) = prob: λ = -ln(1 - p)."""
+    p = np.clip(np.nan_to_num(prob_percent / 100, nan=0.0), 0.0, Config.MAX_PROBABILITY)
+    return -np.log1p(-p)
+
+
+def _devig(prob_percent: np.ndarray, match_codes: np.ndarray, target_rate: np.ndarray) -> np.ndarray:
+    """
+    Rimuove il margine dalle quote "in qualsiasi momento" di una partita.
+    La somma delle intensità dei giocatori non può superare quella attesa per la partita
+    (gol totali, o gol con assist): se la supera, le intensità vengono scalate in proporzione.
+    """
+    rates = _rate(prob_percent)
+    totals = np.bincount(match_codes, weights=rates, minlength=len(target_rate))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factors = np.where((totals > 0) & (target_rate > 0), np.minimum(1.0, target_rate / totals), 1.0)
+    fair = 100 * -np.expm1(-rates * factors[match_codes])
+    return np.where(np.isnan(prob_percent), np.nan, fair)
+
+
+def build_quotes_table(scraped_data: ProcessedData) -> QuotesTable:
+    """Costruisce la tabella colonnare in un'unica passata sui dati elaborati."""
+    rows: Dict[Tuple[str, str], int] = {}
+    names: List[str] = []
+    match_ids: List[str] = []
+    goal_quotes: List[float] = []
+    assist_quotes: List[float] = []
+
+    for quotes, target in ((scraped_data.scorers, goal_quotes), (scraped_data.assists, assist_quotes)):
+        for p in quotes:
+            key = (p.match_id, p.player_name)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = len(names)
+                names.append(p.player_name)
+                match_ids.append(p.match_id)
+                goal_quotes.append(np.nan)
+                assist_quotes.append(np.nan)
+            target[row] = p.quote
+
+    # Intensità di gol attese per partita, dai mercati "segna casa" / "segna ospite"
+    match_order = list(scraped_data.match_quotes)
+    match_positions = {match_id: i for i, match_id in enumerate(match_order)}
+    match_rate = np.zeros(len(match_order) + 1)  # l'ultima posizione raccoglie le partite sconosciute
+    match_fair = np.zeros(len(match_order) + 1, dtype=bool)
+    home_teams = np.empty(len(match_order) + 1, dtype=object)
+    away_teams = np.empty(len(match_order) + 1, dtype=object)
+    for i, match_id in enumerate(match_order):
+        match_quotes = scraped_data.match_quotes[match_id]
+        home_teams[i] = match_quotes.match.home_team
+        away_teams[i] = match_quotes.match.away_team
+        match_fair[i] = match_quotes.fair
+        stats = match_quotes.goal_stats
+        if stats:
+            # prob_away_concedes_goal = probabilità che la squadra di casa segni, e viceversa
+            match_rate[i] = _rate(np.array([stats["prob_away_concedes_goal"], stats["prob_home_concedes_goal"]])).sum()
+
+    match_codes = np.fromiter((match_positions.get(m, len(match_order)) for m in match_ids), dtype=np.intp, count=len(match_ids))
+    goal_quote = np.array(goal_quotes, dtype=float)
+    assist_quote = np.array(assist_quotes, dtype=float)
+    prob_goal = implied_probability(goal_quote)
+    prob_assist = implied_probability(assist_quote)
+    fair_rows = match_fair[match_codes]
+    prob_goal_fair = np.where(fair_rows, prob_goal, _devig(prob_goal, match_codes, match_rate))
+    prob_assist_fair = np.where(fair_rows, prob_assist, _devig(prob_assist, match_codes, match_rate * Config.ASSISTED_GOAL_RATIO))
+    expected_bonus = (
+        Config.GOAL_BONUS * np.nan_to_num(prob_goal_fair) + Config.ASSIST_BONUS * np.nan_to_num(prob_assist_fair)
+    ) / 100
+
+    return QuotesTable(
+        player_name=np.array(names, dtype=object),
+        match_id=np.array(match_ids, dtype=object),
+        home_team=home_teams[match_codes],
+        away_team=away_teams[match_codes],
+        goal_quote=goal_quote,
+        assist_quote=assist_quote,
+        prob_goal=prob_goal,
+        prob_assist=prob_assist,
+        prob_goal_fair=prob_goal_fair,
+        prob_assist_fair=prob_assist_fair,
+        expected_bonus=expected_bonus,
+        rows=rows,
+    )
+
+
+def get_quotes_table(scraped_data: ProcessedData) -> QuotesTable:
+    """Restituisce la tabella colonnare di un'istantanea, costruendola una sola volta."""
+    if scraped_data.table is None:
+        scraped_data.table = build_quotes_table(scraped_data)
+    return scraped_data.table
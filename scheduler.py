@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional
+
+from formazione.model import get_cached_matchday, get_matchday
+from quote.cache import Snapshot, snapshot_cache
+from quote.config import Config
+from quote.model import refresh_snapshot
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+
+# Intervallo di aggiornamento delle quote in base alle ore mancanti al prossimo calcio d'inizio:
+# (entro ore, intervallo in secondi). Oltre l'ultima soglia si usa FAR_REFRESH_INTERVAL.
+REFRESH_TIERS = [(1, 5 * 60), (6, 10 * 60), (24, 30 * 60), (48, 60 * 60)]
+FAR_REFRESH_INTERVAL = 2 * 3600
+DEFAULT_REFRESH_INTERVAL = 15 * 60  # senza calendario (es. chiave Football-Data mancante)
+RETRY_INTERVAL = 60  # dopo uno scraping fallito
+# Se il palinsesto non cambia, l'intervallo viene moltiplicato per BACKOFF_FACTOR a ogni giro (fino a MAX_BACKOFF),
+# tranne a ridosso delle partite (entro KICKOFF_WINDOW), quando le quote possono cambiare da un momento all'altro
+BACKOFF_FACTOR = 1.5
+MAX_BACKOFF = 4
+KICKOFF_WINDOW = timedelta(hours=REFRESH_TIERS[0][0])
+# Margine aggiunto al TTL della cache oltre l'intervallo dello scheduler, così i comandi non avviano scraping
+CACHE_TTL_SLACK = 120
+# Modalità streaming: se un listener la richiede (es. chat iscritte agli avvisi) e manca meno di
+# STREAM_WINDOW al prossimo calcio d'inizio, le quote vengono aggiornate con un intervallo adattivo
+# (vedi `stream_interval`): STREAM_INTERVAL secondi al calcio d'inizio, fino a STREAM_MAX_INTERVAL
+# lontano dalla partita o con il palinsesto fermo. Le richieste condizionali (ETag) rendono
+# economici i giri in cui il palinsesto non cambia.
+STREAM_INTERVAL = int(os.getenv("STREAM_INTERVAL", "60"))
+STREAM_MAX_INTERVAL = 5 * 60
+STREAM_WINDOW = timedelta(hours=3)
+
+# Funzione chiamata con ogni nuova istantanea aggiornata dallo scheduler
+SnapshotListener = Callable[[Snapshot], Awaitable[None]]
+
+
+def interval_for_kickoff(next_kickoff: Optional[datetime], now: Optional[datetime] = None) -> float:
+    """Intervallo di base: più breve man mano che si avvicina il calcio d'inizio."""
+    if next_kickoff is None:
+        return DEFAULT_REFRESH_INTERVAL
+    hours_left = (next_kickoff - (now or datetime.now(timezone.utc))).total_seconds() / 3600
+    for max_hours, interval in REFRESH_TIERS:
+        if hours_left <= max_hours:
+            return interval
+    return FAR_REFRESH_INTERVAL
+
+
+def stream_interval(next_kickoff: datetime, unchanged_runs: int, now: Optional[datetime] = None) -> float:
+    """
+    Intervallo in modalità streaming: cresce linearmente con il tempo mancante al calcio d'inizio
+    (da STREAM_INTERVAL a STREAM_MAX_INTERVAL all'inizio della finestra) e rallenta finché il
+    palinsesto non cambia; alla prima variazione torna al passo pieno. Mai oltre l'intervallo di base.
+    """
+    left = (next_kickoff - (now or datetime.now(timezone.utc))) / STREAM_WINDOW
+    interval = STREAM_INTERVAL + (STREAM_MAX_INTERVAL - STREAM_INTERVAL) * min(max(left, 0.0), 1.0)
+    interval *= min(BACKOFF_FACTOR ** unchanged_runs, MAX_BACKOFF)
+    return min(interval, STREAM_MAX_INTERVAL, interval_for_kickoff(next_kickoff, now))
+
+
+class RefreshScheduler:
+    """
+    Aggiorna periodicamente in background le quote e il calendario della prossima giornata,
+    così i comandi del bot leggono sempre dati già pronti.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._last_version: Optional[str] = None
+        self._unchanged_runs = 0
+        self._listeners: List[SnapshotListener] = []
+        self._streaming_checks: List[Callable[[], bool]] = []
+
+    def add_listener(self, listener: SnapshotListener, streaming: Optional[Callable[[], bool]] = None) -> None:
+        """
+        Registra una funzione da chiamare dopo ogni aggiornamento delle quote.
+        `streaming`, se indicato, dice se il listener vuole aggiornamenti frequenti vicino alle partite.
+        """
+        self._listeners.append(listener)
+        if streaming is not None:
+            self._streaming_checks.append(streaming)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            logging.info("Avvio dello scheduler di aggiornamento quote e calendario.")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        snapshot_cache.ttl = Config.SNAPSHOT_TTL
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delay = await self.run_once()
+            except Exception as e:
+                logging.error(f"Errore nello scheduler: {e}", exc_info=True)
+                snapshot_cache.ttl = Config.SNAPSHOT_TTL
+                delay = RETRY_INTERVAL
+            await asyncio.sleep(delay)
+
+    async def run_once(self) -> float:
+        """Esegue un giro di aggiornamento e restituisce i secondi di attesa prima del prossimo."""
+        await self._refresh_fixtures()
+
+        snapshot = await refresh_snapshot()
+        if snapshot is None:
+            # Senza aggiornamenti dello scheduler le quote tornano a scadere normalmente
+            snapshot_cache.ttl = Config.SNAPSHOT_TTL
+            logging.warning(f"Scheduler: aggiornamento quote fallito, riprovo tra {RETRY_INTERVAL}s.")
+            return RETRY_INTERVAL
+
+        if snapshot.version == self._last_version:
+            self._unchanged_runs += 1
+        else:
+            self._unchanged_runs = 0
+            self._last_version = snapshot.version
+
+        for listener in self._listeners:
+            try:
+                await listener(snapshot)
+            except Exception as e:
+                logging.error(f"Scheduler: errore in un listener delle quote: {e}", exc_info=True)
+
+        delay = self.next_delay()
+        # Le quote restano "fresche" fino al prossimo giro: i comandi non devono fare scraping
+        snapshot_cache.ttl = max(Config.SNAPSHOT_TTL, delay + CACHE_TTL_SLACK)
+        logging.info(
+            f"Scheduler: quote aggiornate (palinsesto {snapshot.codice_palinsesto}, "
+            f"invariate da {self._unchanged_runs} giri), prossimo aggiornamento tra {delay / 60:.1f} minuti."
+        )
+        return delay
+
+    def next_delay(self, now: Optional[datetime] = None) -> float:
+        next_kickoff = self.next_kickoff(now)
+        if self.streaming(next_kickoff, now):
+            return stream_interval(next_kickoff, self._unchanged_runs, now)
+        base = interval_for_kickoff(next_kickoff, now)
+        if next_kickoff is not None and next_kickoff - (now or datetime.now(timezone.utc)) <= KICKOFF_WINDOW:
+            return base
+        return base * min(BACKOFF_FACTOR ** self._unchanged_runs, MAX_BACKOFF)
+
+    def streaming(self, next_kickoff: Optional[datetime], now: Optional[datetime] = None) -> bool:
+        """True se è attiva la modalità streaming (vedi `stream_interval`)."""
+        if next_kickoff is None or not any(check() for check in self._streaming_checks):
+            return False
+        return next_kickoff - (now or datetime.now(timezone.utc)) <= STREAM_WINDOW
+
+    @staticmethod
+    def next_kickoff(now: Optional[datetime] = None) -> Optional[datetime]:
+        """Prossimo calcio d'inizio della giornata in calendario, se noto."""
+        matchday = get_cached_matchday()
+        if not matchday:
+            return None
+        now = now or datetime.now(timezone.utc)
+        return next((kickoff for kickoff in matchday["kickoffs"] if kickoff >= now), None)
+
+    async def _refresh_fixtures(self) -> None:
+        # Il calendario è in cache per tutta la giornata: viene riscaricato solo a giornata conclusa o scaduto
+        result = await get_matchday()
+        if isinstance(result, str):
+            logging.warning(f"Scheduler: calendario non aggiornato: {result}")
+
+
+refresh_scheduler = RefreshScheduler()
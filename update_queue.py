@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from metrics import registry, span
+
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "4"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "100"))
+# Quanti update_id recenti ricordare per scartare i reinvii di Telegram
+UPDATE_DEDUP_SIZE = 1000
+# Secondi concessi allo shutdown per smaltire la coda
+UPDATE_DRAIN_TIMEOUT = 10
+
+UPDATES = registry.counter("fanta_updates_total", "Update ricevuti dal webhook, per esito (accepted, duplicate, rejected).")
+QUEUE_DEPTH = registry.gauge("fanta_update_queue_depth", "Update in coda in attesa di un worker.")
+QUEUE_WAIT = registry.histogram("fanta_update_queue_wait_seconds", "Attesa in coda degli update prima dell'elaborazione.")
+
+# Gli update restano in coda come JSON: vengono convertiti in oggetti Telegram solo dal worker,
+# così il webhook funziona anche prima che il bot abbia finito di inizializzarsi
+UpdatePayload = Dict[str, Any]
+UpdateProcessor = Callable[[UpdatePayload], Awaitable[None]]
+# (istante di accodamento, update)
+QueuedUpdate = Tuple[float, UpdatePayload]
+
+
+def update_chat_id(data: UpdatePayload) -> Optional[Hashable]:
+    """Chat (o in mancanza utente) a cui appartiene un update, per elaborarne in ordine gli update."""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        if value.get("from"):
+            return ("user", value["from"].get("id"))
+    return None
+
+
+class UpdateQueue:
+    """
+    Coda limitata degli update di Telegram, smaltita da un gruppo di worker.
+
+    - Il webhook accoda l'update e risponde subito, senza attendere i comandi lenti.
+    - Ogni chat ha la sua sotto-coda: gli update della stessa chat vengono elaborati in ordine
+      di arrivo, uno alla volta, e la coda comune contiene le chat pronte (non quelle già in
+      elaborazione). Così una raffica di update di una chat occupa un solo worker e le altre
+      chat procedono in parallelo.
+    - Gli update già visti (stesso update_id, es. reinvii di Telegram) vengono scartati.
+    - Con la coda piena l'update viene rifiutato, così Telegram lo reinvia più tardi.
+    """
+
+    def __init__(self, process: UpdateProcessor, workers: int = UPDATE_WORKERS, maxsize: int = UPDATE_QUEUE_SIZE):
+        self.process = process
+        self.workers = workers
+        self.maxsize = maxsize
+        # ("chat", chat_id) per le chat pronte, ("update", update) per gli update senza chat
+        self._ready: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+        # Sotto-code delle chat con update in coda o in elaborazione
+        self._chats: Dict[Hashable, Deque[QueuedUpdate]] = {}
+        self._size = 0
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._size
+
+    def submit(self, data: UpdatePayload) -> bool:
+        """Accoda un update (JSON già validato). Restituisce False se la coda è piena (l'update va rifiutato)."""
+        update_id = data["update_id"]
+        if update_id in self._seen:
+            UPDATES.inc(result="duplicate")
+            logging.info(f"Update {update_id} già ricevuto: scartato.")
+            return True
+
+        if self._size >= self.maxsize:
+            UPDATES.inc(result="rejected")
+            logging.warning(f"Coda degli update piena ({self.maxsize}): update {update_id} rifiutato.")
+            return False
+
+        item = (time.perf_counter(), data)
+        chat_id = update_chat_id(data)
+        if chat_id is None:
+            self._ready.put_nowait(("update", item))
+        elif chat_id in self._chats:
+            # La chat è già pronta o in elaborazione: l'update aspetta il suo turno nella sotto-coda
+            self._chats[chat_id].append(item)
+        else:
+            self._chats[chat_id] = deque([item])
+            self._ready.put_nowait(("chat", chat_id))
+        self._size += 1
+
+        self._seen[update_id] = None
+        while len(self._seen) > UPDATE_DEDUP_SIZE:
+            self._seen.popitem(last=False)
+        UPDATES.inc(result="accepted")
+        QUEUE_DEPTH.set(self.depth)
+        return True
+
+    def start(self) -> None:
+        if not self._tasks:
+            logging.info(f"Avvio di {self.workers} worker per gli update di Telegram.")
+            self._tasks = [asyncio.create_task(self._worker(), name=f"update-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self, timeout: float = UPDATE_DRAIN_TIMEOUT) -> None:
+        """Smaltisce gli update in coda (entro `timeout` secondi) e ferma i worker."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Shutdown: {self.depth} update in coda non elaborati.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            kind, value = await self._ready.get()
+            try:
+                if kind == "update":
+                    await self._process(value)
+                else:
+                    # Un update alla volta per chat: se ne restano altri la chat torna in fondo
+                    # alla coda delle chat pronte, così non monopolizza il worker
+                    chat_queue = self._chats[value]
+                    try:
+                        await self._process(chat_queue.popleft())
+                    finally:
+                        if chat_queue:
+                            self._ready.put_nowait(("chat", value))
+                        else:
+                            del self._chats[value]
+            finally:
+                self._ready.task_done()
+
+    async def _process(self, item: QueuedUpdate) -> None:
+        enqueued_at, data = item
+        self._size -= 1
+        QUEUE_DEPTH.set(self.depth)
+        QUEUE_WAIT.observe(time.perf_counter() - enqueued_at)
+        try:
+            with span("telegram_webhook"):
+                await self.process(data)
+        except Exception as e:
+            logging.error(f"Errore nell'elaborazione dell'update {data['update_id']}: {e}", exc_info=True)
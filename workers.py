@@ -0,0 +1,232 @@
+import asyncio
+import dataclasses
+import logging
+import mmap
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from metrics import registry, span
+from quote.cache import Snapshot
+from quote.config import ProcessedData
+from quote.model import get_roster_quotes_many
+
+# Processi per il lavoro CPU (abbinamento delle rose, simulazione): 0 per eseguirlo in un thread.
+# Uno solo di default: ogni worker importa numpy e i modelli, e sul piano gratuito la memoria è poca
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", "1"))
+# Istantanee tenute su disco e nei worker: la corrente, la precedente (usata dagli avvisi)
+# e una di margine per le richieste ancora in corso durante un aggiornamento
+SHARED_SNAPSHOTS = 3
+
+POOL_JOBS = registry.counter("fanta_process_pool_jobs_total", "Elaborazioni CPU, per tipo e per esecutore (process, thread).")
+
+Roster = Dict[str, List[Tuple[str, str]]]
+
+
+# --- Lato worker ---
+
+# Istantanee già caricate dal worker: versione -> dati
+_worker_snapshots: Dict[str, ProcessedData] = {}
+
+
+def _warmup() -> int:
+    """Importa i moduli pesanti e carica l'anagrafica dei giocatori nel worker appena avviato."""
+    import formazione.model  # noqa: F401
+    from quote.identity import get_player_registry
+
+    get_player_registry()
+    return os.getpid()
+
+
+def _load_shared_snapshot(version: str, path: str) -> ProcessedData:
+    """Dati dell'istantanea, letti una sola volta per versione dal file mappato in memoria."""
+    data = _worker_snapshots.get(version)
+    if data is None:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = pickle.loads(mapped)
+        while len(_worker_snapshots) >= SHARED_SNAPSHOTS:
+            del _worker_snapshots[next(iter(_worker_snapshots))]
+        _worker_snapshots[version] = data
+    return data
+
+
+def _match_rosters_job(version: str, path: str, rosters: Dict[Hashable, Roster]) -> Dict[Hashable, Dict[str, List[Dict[str, Any]]]]:
+    return get_roster_quotes_many(rosters, _load_shared_snapshot(version, path))
+
+
+def _compute_lineups_job(version: str, path: str, roster: Roster):
+    # Import nel worker: formazione.model importa a sua volta questo modulo
+    from formazione.model import compute_lineups
+
+    return compute_lineups(roster, _load_shared_snapshot(version, path))
+
+
+# --- Lato applicazione ---
+
+def _shareable(data: ProcessedData) -> ProcessedData:
+    """
+    Copia dei dati senza gli indici e la tabella costruiti al primo utilizzo: nel processo
+    principale possono essere in costruzione in un altro thread, e i worker li ricostruiscono.
+    """
+    return dataclasses.replace(
+        data,
+        match_quotes={key: dataclasses.replace(quotes, name_indexes=None) for key, quotes in data.match_quotes.items()},
+        name_indexes=None,
+        table=None,
+    )
+
+
+class ProcessPool:
+    """
+    Gruppo di processi per il lavoro CPU, così l'event loop (webhook, /health) resta libero
+    e le elaborazioni di molte rose usano tutti i core.
+
+    L'istantanea non viene inviata a ogni richiesta: è scritta una volta per versione in un
+    file che i worker mappano in memoria e caricano una sola volta. Con `workers=0` (o prima
+    dell'avvio) le stesse elaborazioni girano in un thread.
+    """
+
+    def __init__(self, workers: int = PROCESS_POOL_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dir: Optional[str] = None
+        # Versione -> file dell'istantanea (in ordine di pubblicazione)
+        self._published: Dict[str, str] = {}
+        self._publishing: Dict[str, asyncio.Task] = {}
+        # Elaborazioni in corso per versione, e file già sostituiti ma ancora in uso:
+        # vengono cancellati quando l'ultima elaborazione che li usa termina
+        self._in_flight: Dict[str, int] = {}
+        self._retired: Dict[str, str] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self) -> None:
+        if self.running or self.workers <= 0:
+            return
+        self._dir = tempfile.mkdtemp(prefix="fanta-snapshots-")
+        self._executor = self._new_executor()
+        logging.info(f"Avvio di {self.workers} processi per il lavoro CPU.")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: il processo principale ha già thread attivi (storico quote, profiler), fork non è sicuro
+        executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        # I worker partono subito e importano i moduli, così la prima richiesta non paga l'avvio
+        for _ in range(self.workers):
+            executor.submit(_warmup)
+        return executor
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Sostituisce un gruppo di processi rotto (un worker è terminato in modo anomalo)."""
+        # Più richieste possono accorgersene insieme: lo ricrea solo la prima
+        if self._executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+        logging.warning(f"Gruppo di processi rotto: riavvio di {self.workers} processi.")
+
+    async def stop(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+        self._published.clear()
+        self._retired.clear()
+
+    async def _publish(self, snapshot: Snapshot) -> str:
+        """Scrive l'istantanea su file (una volta per versione) e restituisce il percorso."""
+        path = self._published.get(snapshot.version)
+        if path is not None:
+            return path
+        path = self._retired.pop(snapshot.version, None)
+        if path is not None:
+            # Sostituita ma ancora in uso: il file c'è ancora, torna tra le pubblicate
+            self._published[snapshot.version] = path
+            self._evict()
+            return path
+        task = self._publishing.get(snapshot.version)
+        if task is None:
+            task = asyncio.create_task(asyncio.to_thread(self._write, snapshot))
+            self._publishing[snapshot.version] = task
+            task.add_done_callback(lambda _: self._publishing.pop(snapshot.version, None))
+        path = await asyncio.shield(task)
+
+        self._published[snapshot.version] = path
+        self._evict()
+        return path
+
+    def _evict(self) -> None:
+        """Toglie le istantanee più vecchie; i file ancora in uso restano fino alla fine delle elaborazioni."""
+        while len(self._published) > SHARED_SNAPSHOTS:
+            version = next(iter(self._published))
+            old_path = self._published.pop(version)
+            if self._in_flight.get(version):
+                self._retired[version] = old_path
+            else:
+                os.remove(old_path)
+
+    def _release(self, version: str) -> None:
+        count = self._in_flight[version] - 1
+        if count:
+            self._in_flight[version] = count
+            return
+        del self._in_flight[version]
+        old_path = self._retired.pop(version, None)
+        if old_path is not None:
+            os.remove(old_path)
+
+    def _write(self, snapshot: Snapshot) -> str:
+        path = os.path.join(self._dir, f"{snapshot.version}.pickle")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(_shareable(snapshot.data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return path
+
+    async def _run(self, name: str, job: Callable, local: Callable[[], Any], snapshot: Snapshot, *args) -> Any:
+        with span("process_pool", job=name):
+            if self._executor is None:
+                POOL_JOBS.inc(job=name, executor="thread")
+                return await asyncio.to_thread(local)
+            path = await self._publish(snapshot)
+            # Il file resta su disco finché l'elaborazione non termina (vedi `_evict`)
+            self._in_flight[snapshot.version] = self._in_flight.get(snapshot.version, 0) + 1
+            try:
+                for attempt in range(2):
+                    executor = self._executor
+                    if executor is None:  # fermato nel frattempo
+                        break
+                    try:
+                        POOL_JOBS.inc(job=name, executor="process")
+                        return await asyncio.wrap_future(executor.submit(job, snapshot.version, path, *args))
+                    except BrokenExecutor:
+                        logging.error(f"Elaborazione {name} interrotta: un processo è terminato in modo anomalo.")
+                        self._restart(executor)
+            finally:
+                self._release(snapshot.version)
+            # Fallita anche dopo il riavvio: ultimo tentativo in un thread
+            POOL_JOBS.inc(job=name, executor="thread")
+            return await asyncio.to_thread(local)
+
+    async def match_rosters(self, snapshot: Snapshot, rosters: Dict[Hashable, Roster]) -> Dict[Hashable, Dict[str, List[Dict[str, Any]]]]:
+        """Abbina più rose all'istantanea (vedi `quote.model.get_roster_quotes_many`)."""
+        return await self._run(
+            "match_rosters", _match_rosters_job, lambda: get_roster_quotes_many(rosters, snapshot.data), snapshot, rosters
+        )
+
+    async def compute_lineups(self, snapshot: Snapshot, roster: Roster):
+        """Migliori formazioni di una rosa (vedi `formazione.model.compute_lineups`)."""
+        from formazione.model import compute_lineups  # formazione.model importa questo modulo
+
+        return await self._run("compute_lineups", _compute_lineups_job, lambda: compute_lineups(roster, snapshot.data), snapshot, roster)
+
+
+# Condiviso da tutta l'applicazione: avviato allo startup di FastAPI
+process_pool = ProcessPool()